@@ -0,0 +1,56 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Outputs written once extraction is done; each is an independent network round-trip
+ARTIFACT_SINKS = ('dynamodb', 'pdf', 'csv', 'json')
+# Matches what the pipeline always produced: the quotation record and the PO PDF
+DEFAULT_ARTIFACT_SINKS = 'dynamodb,pdf'
+
+def parse_sinks(value):
+    """Comma-separated names (or a list) to an ordered tuple of known sinks"""
+    names = value.split(',') if isinstance(value, str) else list(value or [])
+    sinks = []
+    for name in names:
+        name = name.strip().lower()
+        if not name or name in sinks:
+            continue
+        if name not in ARTIFACT_SINKS:
+            raise ValueError(f"Unknown artifact sink: {name}")
+        sinks.append(name)
+    return tuple(sinks)
+
+def _run_sink(name, write, trace):
+    started = time.perf_counter()
+    try:
+        return name, write(), None
+    except Exception as e:
+        print(f"Artifact sink {name} failed: {e}")
+        return name, None, str(e)
+    finally:
+        if trace:
+            trace.record(f'artifact_{name}', time.perf_counter() - started)
+
+def run_sinks(sinks, trace=None):
+    """Run the writers in sinks ({name: callable}) concurrently
+
+    Latency is that of the slowest sink rather than the sum. A failing sink
+    does not stop the others; returns (results, errors) where results maps
+    each successful sink to its return value.
+    """
+    if not sinks:
+        return {}, []
+    if len(sinks) == 1:
+        outcomes = [_run_sink(name, write, trace) for name, write in sinks.items()]
+    else:
+        with ThreadPoolExecutor(max_workers=len(sinks)) as pool:
+            futures = [pool.submit(_run_sink, name, write, trace) for name, write in sinks.items()]
+            outcomes = [future.result() for future in futures]
+
+    results = {}
+    errors = []
+    for name, value, error in outcomes:
+        if error:
+            errors.append({'sink': name, 'error': error})
+        else:
+            results[name] = value
+    return results, errors
@@ -0,0 +1,104 @@
+import os
+import json
+import zlib
+from datetime import datetime, timedelta
+
+# Stage progression recorded on the quotation record while a job runs out of band
+JOB_STAGES = ('queued', 'extracting', 'extracted', 'po_generated', 'report_ready', 'failed')
+TERMINAL_STAGES = ('report_ready', 'failed')
+# Keep the stored result well below the 400KB DynamoDB item limit
+MAX_RESULT_BYTES = 300000
+# A stage not updated within the function timeout (plus a margin for async retries) belongs to a dead worker
+JOB_TIMEOUT_SECONDS = int(os.environ.get('JOB_TIMEOUT_SECONDS', '360'))
+
+STATUS_ATTRIBUTES = ('quotation_id', 'stage', 'stage_updated_at', 'submitted_at', 'original_file', 'job_error', 'job_result',
+                     'extraction_preview')
+
+class JobTracker:
+    """Records the stage of one async quotation job on its quotations-table record"""
+
+    def __init__(self, table, quotation_id, file_name, upload_key):
+        self.table = table
+        self.quotation_id = quotation_id
+        self.base_attributes = {
+            'original_file': file_name,
+            'upload_key': upload_key,
+            'submitted_at': datetime.utcnow().isoformat()
+        }
+
+    def create(self):
+        item = {'quotation_id': self.quotation_id, 'status': 'queued'}
+        item.update(self.attributes('queued'))
+        self.table.put_item(Item=item)
+
+    def attributes(self, stage):
+        """Job attributes to merge into a full record rewrite (store_quotation)"""
+        attributes = dict(self.base_attributes)
+        attributes['stage'] = stage
+        attributes['stage_updated_at'] = datetime.utcnow().isoformat()
+        return attributes
+
+    def set_stage(self, stage, **extra):
+        if stage not in JOB_STAGES:
+            raise ValueError(f"Unknown job stage: {stage}")
+        names = {'#stage': 'stage', '#updated': 'stage_updated_at'}
+        values = {':stage': stage, ':updated': datetime.utcnow().isoformat()}
+        assignments = ['#stage = :stage', '#updated = :updated']
+        for i, (name, value) in enumerate(extra.items()):
+            names[f'#a{i}'] = name
+            values[f':v{i}'] = value
+            assignments.append(f'#a{i} = :v{i}')
+        self.table.update_item(
+            Key={'quotation_id': self.quotation_id},
+            UpdateExpression='SET ' + ', '.join(assignments),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+        print(f"Job {self.quotation_id}: {stage}")
+
+    def complete(self, response_data):
+        payload = zlib.compress(json.dumps(response_data, default=str).encode('utf-8'))
+        if len(payload) > MAX_RESULT_BYTES:
+            # The record itself still holds the extraction; only the cached response is skipped
+            print(f"Job result too large to store ({len(payload)} bytes)")
+            self.set_stage('report_ready')
+        else:
+            self.set_stage('report_ready', job_result=payload)
+
+    def fail(self, error):
+        self.set_stage('failed', job_error=str(error)[:1000])
+
+def get_job_status(table, quotation_id):
+    """Lightweight status lookup for polling; includes the result once the report is ready"""
+    response = table.get_item(
+        Key={'quotation_id': quotation_id},
+        ProjectionExpression=', '.join(f'#p{i}' for i in range(len(STATUS_ATTRIBUTES))),
+        ExpressionAttributeNames={f'#p{i}': name for i, name in enumerate(STATUS_ATTRIBUTES)}
+    )
+    item = response.get('Item')
+    if not item:
+        return None
+
+    status = {
+        'quotationId': item['quotation_id'],
+        # Records written by the synchronous path have no stage
+        'stage': item.get('stage', 'report_ready'),
+        'stageUpdatedAt': item.get('stage_updated_at'),
+        'submittedAt': item.get('submitted_at'),
+        'fileName': item.get('original_file'),
+        'done': item.get('stage', 'report_ready') in TERMINAL_STAGES
+    }
+    if item.get('job_error'):
+        status['error'] = item['job_error']
+    if not status['done'] and status['stageUpdatedAt']:
+        stale_for = datetime.utcnow() - datetime.fromisoformat(status['stageUpdatedAt'])
+        if stale_for > timedelta(seconds=JOB_TIMEOUT_SECONDS):
+            # The worker timed out or crashed without recording a failure
+            status.update({'stage': 'failed', 'done': True, 'timedOut': True,
+                           'error': f"Processing timed out at stage {item.get('stage')}"})
+    # Header fields from a streamed extraction, until the full record replaces them
+    if item.get('extraction_preview') and not status['done']:
+        status['preview'] = item['extraction_preview']
+    if item.get('job_result') is not None:
+        status['result'] = json.loads(zlib.decompress(bytes(item['job_result'])).decode('utf-8'))
+    return status
@@ -0,0 +1,175 @@
+import os
+import time
+import random
+import threading
+
+import boto3
+
+BEDROCK_REGION = os.environ.get('BEDROCK_REGION', 'us-east-1')
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.environ.get('BEDROCK_MAX_POOL_CONNECTIONS', '50'))
+BEDROCK_READ_TIMEOUT = int(os.environ.get('BEDROCK_READ_TIMEOUT', '120'))
+# Adaptive (AIMD) concurrency window shared by every caller in this container
+BEDROCK_INITIAL_CONCURRENCY = float(os.environ.get('BEDROCK_INITIAL_CONCURRENCY', '4'))
+BEDROCK_MIN_CONCURRENCY = float(os.environ.get('BEDROCK_MIN_CONCURRENCY', '1'))
+BEDROCK_MAX_CONCURRENCY = float(os.environ.get('BEDROCK_MAX_CONCURRENCY', '16'))
+BEDROCK_RETRY_BUDGET_SECONDS = float(os.environ.get('BEDROCK_RETRY_BUDGET_SECONDS', '60'))
+BEDROCK_MAX_ATTEMPTS = int(os.environ.get('BEDROCK_MAX_ATTEMPTS', '6'))
+BEDROCK_BACKOFF_BASE_SECONDS = float(os.environ.get('BEDROCK_BACKOFF_BASE_SECONDS', '0.5'))
+BEDROCK_BACKOFF_CAP_SECONDS = float(os.environ.get('BEDROCK_BACKOFF_CAP_SECONDS', '8'))
+
+THROTTLE_CODES = {'ThrottlingException', 'TooManyRequestsException', 'ServiceQuotaExceededException'}
+RETRYABLE_CODES = THROTTLE_CODES | {'ServiceUnavailableException', 'InternalServerException', 'ModelNotReadyException', 'ModelTimeoutException'}
+
+def error_code(error):
+    """Error code of a botocore ClientError (or any exception carrying a .response dict)"""
+    return (getattr(error, 'response', None) or {}).get('Error', {}).get('Code', type(error).__name__)
+
+class AdaptiveLimiter:
+    """AIMD concurrency limiter: grow the window by ~1 per window of successes, halve it on throttling"""
+
+    def __init__(self, initial=None, minimum=None, maximum=None, decrease_factor=0.5):
+        self.minimum = minimum or BEDROCK_MIN_CONCURRENCY
+        self.maximum = maximum or BEDROCK_MAX_CONCURRENCY
+        self.limit = min(self.maximum, max(self.minimum, initial or BEDROCK_INITIAL_CONCURRENCY))
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """Wait for a slot; returns seconds spent waiting, or None on timeout"""
+        started = time.monotonic()
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                remaining = None if timeout is None else timeout - (time.monotonic() - started)
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            self.in_flight += 1
+        return time.monotonic() - started
+
+    def release(self, throttled=False):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit * self.decrease_factor)
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+class BedrockInvoker:
+    """Shared bedrock-runtime client with adaptive concurrency and jittered, time-budgeted retries
+
+    Exposes invoke_model and invoke_model_with_response_stream with the boto3
+    signatures so it can stand in for a client. Pass client= to run against a
+    local stub. A streaming call holds its concurrency slot until the stream
+    opens; errors in the middle of a stream are not retried.
+    """
+
+    def __init__(self, client=None, limiter=None, retry_budget_seconds=None, max_attempts=None,
+                 backoff_base_seconds=None, backoff_cap_seconds=None, sleep=time.sleep):
+        self.client = client or _build_client()
+        self.limiter = limiter or AdaptiveLimiter()
+        self.retry_budget_seconds = retry_budget_seconds or BEDROCK_RETRY_BUDGET_SECONDS
+        self.max_attempts = max_attempts or BEDROCK_MAX_ATTEMPTS
+        self.backoff_base_seconds = backoff_base_seconds or BEDROCK_BACKOFF_BASE_SECONDS
+        self.backoff_cap_seconds = backoff_cap_seconds or BEDROCK_BACKOFF_CAP_SECONDS
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.metrics = {
+            'calls': 0,
+            'attempts': 0,
+            'successes': 0,
+            'failures': 0,
+            'throttles': 0,
+            'retries': 0,
+            'budget_exhausted': 0,
+            'queue_wait_seconds_total': 0.0,
+            'queue_wait_seconds_max': 0.0
+        }
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self.metrics[name] += value
+
+    def invoke_model(self, **kwargs):
+        return self._invoke(self.client.invoke_model, kwargs)
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        return self._invoke(self.client.invoke_model_with_response_stream, kwargs)
+
+    def _invoke(self, call, kwargs):
+        deadline = time.monotonic() + self.retry_budget_seconds
+        self._count(calls=1)
+        attempt = 0
+        while True:
+            attempt += 1
+            waited = self.limiter.acquire(timeout=max(0.0, deadline - time.monotonic()))
+            if waited is None:
+                self._count(failures=1, budget_exhausted=1)
+                raise TimeoutError("Bedrock retry budget exhausted waiting for a concurrency slot")
+            with self._lock:
+                self.metrics['queue_wait_seconds_total'] += waited
+                self.metrics['queue_wait_seconds_max'] = max(self.metrics['queue_wait_seconds_max'], waited)
+                self.metrics['attempts'] += 1
+
+            try:
+                response = call(**kwargs)
+            except Exception as e:
+                code = error_code(e)
+                throttled = code in THROTTLE_CODES
+                self.limiter.release(throttled=throttled)
+                if throttled:
+                    self._count(throttles=1)
+                if code not in RETRYABLE_CODES or attempt >= self.max_attempts:
+                    self._count(failures=1)
+                    raise
+                # Full jitter keeps retrying callers from re-synchronising
+                delay = random.uniform(0, min(self.backoff_cap_seconds, self.backoff_base_seconds * (2 ** (attempt - 1))))
+                if time.monotonic() + delay >= deadline:
+                    self._count(failures=1, budget_exhausted=1)
+                    raise
+                print(f"Bedrock {code}, retry {attempt} in {delay:.2f}s (limit now {self.limiter.limit:.2f})")
+                self._count(retries=1)
+                self._sleep(delay)
+                continue
+
+            self.limiter.release(throttled=False)
+            self._count(successes=1)
+            return response
+
+    def get_metrics(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+        metrics['concurrency_limit'] = round(self.limiter.limit, 2)
+        metrics['in_flight'] = self.limiter.in_flight
+        return metrics
+
+def _build_client():
+    from botocore.config import Config
+    return boto3.client(
+        'bedrock-runtime',
+        region_name=BEDROCK_REGION,
+        config=Config(
+            max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+            read_timeout=BEDROCK_READ_TIMEOUT,
+            # Retries are handled by BedrockInvoker so throttling feeds the limiter
+            retries={'max_attempts': 1, 'mode': 'standard'}
+        )
+    )
+
+_invoker = None
+_invoker_lock = threading.Lock()
+
+def get_bedrock_invoker():
+    """Process-wide invoker, built on first use and reused across warm invocations"""
+    global _invoker
+    if _invoker is None:
+        with _invoker_lock:
+            if _invoker is None:
+                _invoker = BedrockInvoker()
+    return _invoker
+
+def get_bedrock_metrics():
+    """Invoker metrics for this container, without building the client if it was never used"""
+    return _invoker.get_metrics() if _invoker is not None else {}
@@ -0,0 +1,138 @@
+import json
+
+# Stream exceptions arrive as events keyed by their name instead of being raised by boto3
+STREAM_ERROR_EVENTS = ('internalServerException', 'modelStreamErrorException', 'validationException',
+                       'throttlingException', 'modelTimeoutException', 'serviceUnavailableException')
+
+class StreamError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.response = {'Error': {'Code': code[0].upper() + code[1:], 'Message': message}}
+
+def iter_text_deltas(response, usage=None):
+    """Yield the completion text of an invoke_model_with_response_stream response as it arrives
+
+    usage (a dict) is filled with input_tokens, output_tokens and stop_reason
+    from the message_start / message_delta events.
+    """
+    usage = usage if usage is not None else {}
+    for event in response['body']:
+        for code in STREAM_ERROR_EVENTS:
+            if code in event:
+                raise StreamError(code, event[code].get('message', code))
+        chunk = event.get('chunk')
+        if not chunk:
+            continue
+        message = json.loads(chunk['bytes'])
+        kind = message.get('type')
+        if kind == 'content_block_delta':
+            text = message.get('delta', {}).get('text')
+            if text:
+                yield text
+        elif kind == 'message_start':
+            usage['input_tokens'] = message.get('message', {}).get('usage', {}).get('input_tokens')
+        elif kind == 'message_delta':
+            usage['stop_reason'] = message.get('delta', {}).get('stop_reason')
+            usage['output_tokens'] = message.get('usage', {}).get('output_tokens')
+
+class _Container:
+    __slots__ = ('kind', 'start', 'key', 'expect_key')
+
+    def __init__(self, kind, start):
+        self.kind = kind
+        self.start = start
+        self.key = None
+        self.expect_key = kind == '{'
+
+class IncrementalJSONParser:
+    """Parse one JSON object fed in arbitrary text pieces, reporting values as they complete
+
+    on_field(name, value) fires for each top-level field except items_key;
+    on_item(item) fires for each element of the top-level items_key array.
+    Text before the first "{" (a preamble or code fence) and after the
+    closing "}" is ignored, as in the non-streaming parse.
+    """
+
+    def __init__(self, on_field=None, on_item=None, items_key='items'):
+        self.on_field = on_field
+        self.on_item = on_item
+        self.items_key = items_key
+        self.items = 0
+        self.result = None
+        self._text = ''
+        self._position = 0
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._token_start = None
+        self._string_is_key = False
+
+    def feed(self, text):
+        self._text += text
+        text = self._text
+        position = self._position
+        while position < len(text) and self.result is None:
+            char = text[position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._string_is_key:
+                        self._stack[-1].key = json.loads(text[self._token_start:position + 1])
+                    else:
+                        self._value_done(self._token_start, position + 1)
+                    self._token_start = None
+                position += 1
+                continue
+            if self._token_start is not None:
+                # Inside a number, true, false or null
+                if char not in ',}] \t\r\n':
+                    position += 1
+                    continue
+                self._value_done(self._token_start, position)
+                self._token_start = None
+            if not self._stack:
+                if char == '{':
+                    self._stack.append(_Container('{', position))
+                position += 1
+                continue
+            container = self._stack[-1]
+            if char == '"':
+                self._in_string = True
+                self._token_start = position
+                self._string_is_key = container.kind == '{' and container.expect_key
+            elif char == ':':
+                container.expect_key = False
+            elif char == ',':
+                container.expect_key = container.kind == '{'
+            elif char in '{[':
+                self._stack.append(_Container(char, position))
+            elif char in '}]':
+                self._stack.pop()
+                self._value_done(container.start, position + 1)
+            elif not char.isspace():
+                self._token_start = position
+            position += 1
+        self._position = position
+
+    def _value_done(self, start, end):
+        if not self._stack:
+            self.result = json.loads(self._text[start:end])
+            return
+        parent = self._stack[-1]
+        if len(self._stack) == 1 and parent.key != self.items_key:
+            if self.on_field:
+                self.on_field(parent.key, json.loads(self._text[start:end]))
+        elif len(self._stack) == 2 and parent.kind == '[' and self._stack[0].key == self.items_key:
+            self.items += 1
+            if self.on_item:
+                self.on_item(json.loads(self._text[start:end]))
+
+    def close(self):
+        """The complete object; raises ValueError if the text ended before it closed"""
+        if self.result is None:
+            raise ValueError("No JSON in Bedrock response" if not self._stack else "Incomplete JSON in Bedrock stream")
+        return self.result
@@ -0,0 +1,577 @@
+import io
+import os
+import csv
+import copy
+import json
+import time
+import zlib
+import uuid
+import queue
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from bedrock_invoker import error_code
+from quotation_store import get_all_line_items
+from quotation_query import PROCESSED_INDEX
+
+# Bulk exports write every processed quotation, one row per line item, to S3 as CSV or Parquet.
+# Rows are streamed into multipart uploads, so memory stays flat however many quotations there are
+EXPORT_PREFIX = 'exports/'
+EXPORT_FORMATS = ('csv', 'parquet')
+EXPORT_SCAN_SEGMENTS = int(os.environ.get('EXPORT_SCAN_SEGMENTS', '4'))
+EXPORT_PAGE_SIZE = int(os.environ.get('EXPORT_PAGE_SIZE', '100'))
+EXPORT_ITEM_WORKERS = int(os.environ.get('EXPORT_ITEM_WORKERS', '8'))
+# S3 parts other than the last must be at least 5MB; progress is checkpointed after each part
+S3_MIN_PART_BYTES = 5 * 1024 * 1024
+EXPORT_PART_BYTES = max(S3_MIN_PART_BYTES, int(os.environ.get('EXPORT_PART_BYTES', str(8 * 1024 * 1024))))
+# Parquet is written as a series of files, each complete on its own; rows are held one row group at a time
+EXPORT_PARQUET_FILE_ROWS = int(os.environ.get('EXPORT_PARQUET_FILE_ROWS', '1000000'))
+EXPORT_ROW_GROUP_ROWS = int(os.environ.get('EXPORT_ROW_GROUP_ROWS', '10000'))
+# Checkpoint and continue in a fresh invocation well before the 300s Lambda timeout
+EXPORT_TIME_BUDGET_SECONDS = float(os.environ.get('EXPORT_TIME_BUDGET_SECONDS', '240'))
+# This close to the function timeout a run stops at the next page even without a checkpoint to show for it
+EXPORT_STOP_MARGIN_SECONDS = float(os.environ.get('EXPORT_STOP_MARGIN_SECONDS', '20'))
+EXPORT_URL_EXPIRES_SECONDS = int(os.environ.get('EXPORT_URL_EXPIRES_SECONDS', '3600'))
+EXPORT_RECORD_TTL_SECONDS = 7 * 24 * 3600
+
+HEADER_COLUMNS = ('quotation_id', 'processed_at', 'company_name', 'quote_number', 'date',
+                  'po_number', 'po_date', 'po_status', 'subtotal', 'tax', 'total')
+ITEM_COLUMNS = ('item_seq', 'description', 'quantity', 'unit_price', 'total_amount')
+EXPORT_COLUMNS = HEADER_COLUMNS + ITEM_COLUMNS
+NUMBER_COLUMNS = ('subtotal', 'tax', 'total', 'quantity', 'unit_price', 'total_amount')
+
+class ExportConflict(Exception):
+    """Another invocation advanced the export since this one loaded it"""
+
+class ExportRequestError(ValueError):
+    """The export cannot be started as requested; the caller gets a 400, not a 500"""
+
+def export_record_key(export_id):
+    return f"export#{export_id}"
+
+def _load_state(cache_table, export_id):
+    record = cache_table.get_item(Key={'cache_key': export_record_key(export_id)}, ConsistentRead=True).get('Item')
+    if record is None:
+        return None
+    return json.loads(zlib.decompress(bytes(record['export_state'])).decode('utf-8'))
+
+def _save_state(cache_table, state):
+    """Write the export record if nobody else wrote it since state was loaded"""
+    version = state['version']
+    state['version'] = version + 1
+    state['updated_at'] = datetime.utcnow().isoformat()
+    item = {
+        'cache_key': export_record_key(state['export_id']),
+        'export_state': zlib.compress(json.dumps(state, default=str).encode('utf-8')),
+        'version': state['version'],
+        'expires_at': int(time.time()) + EXPORT_RECORD_TTL_SECONDS
+    }
+    if version:
+        condition, values = '#version = :version', {':version': version}
+    else:
+        condition, values = 'attribute_not_exists(#key)', None
+    request = {'Item': item, 'ConditionExpression': condition,
+               'ExpressionAttributeNames': {'#version': 'version'} if version else {'#key': 'cache_key'}}
+    if values:
+        request['ExpressionAttributeValues'] = values
+    try:
+        cache_table.put_item(**request)
+    except Exception as e:
+        if error_code(e) == 'ConditionalCheckFailedException':
+            raise ExportConflict(f"Export {state['export_id']} was updated by another run")
+        raise
+
+def _months(start, end):
+    year, month = int(start[:4]), int(start[5:7])
+    while f"{year:04d}-{month:02d}" <= end[:7]:
+        yield f"{year:04d}-{month:02d}"
+        year, month = (year, month + 1) if month < 12 else (year + 1, 1)
+
+def create_export(cache_table, export_format='csv', start=None, end=None):
+    """Record a new export and return its status; run_export does the work
+
+    With start (and optionally end, default today) the quotations processed
+    in that range are read from the monthly partitions of the processed_at
+    index, one segment per month. Without a range the whole table is read
+    with a parallel scan of EXPORT_SCAN_SEGMENTS segments.
+    """
+    export_format = (export_format or 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ExportRequestError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    if export_format == 'parquet':
+        # Rejected up front rather than failing in the background run
+        try:
+            import pyarrow
+        except ImportError:
+            raise ExportRequestError("Parquet exports are not available: pyarrow is not in the Lambda layer, use format csv")
+    if start:
+        end = end or datetime.utcnow().strftime('%Y-%m-%d')
+        try:
+            datetime.strptime(start[:10], '%Y-%m-%d')
+            datetime.strptime(end[:10], '%Y-%m-%d')
+        except ValueError:
+            raise ExportRequestError("from and to must be dates in YYYY-MM-DD format")
+        segments = [{'month': month, 'key': None, 'done': False} for month in _months(start, end)]
+        source = 'index'
+    else:
+        segments = [{'segment': n, 'key': None, 'done': False} for n in range(EXPORT_SCAN_SEGMENTS)]
+        source = 'scan'
+    now = datetime.utcnow().isoformat()
+    state = {
+        'export_id': str(uuid.uuid4()),
+        'format': export_format,
+        'source': source,
+        'from': start,
+        'to': end,
+        'status': 'queued',
+        'segments': segments,
+        'rows': 0,
+        'quotations': 0,
+        'seconds': 0.0,
+        'runs': 0,
+        'output': None,
+        'error': None,
+        'created_at': now,
+        'version': 0
+    }
+    _save_state(cache_table, state)
+    print(f"Created export {state['export_id']} ({export_format}, {source}, {len(segments)} segments)")
+    return export_status(state)
+
+def export_status(state, s3_client=None, bucket_name=None):
+    """Status view of an export record; finished exports include download URLs when a client is passed"""
+    output = state.get('output') or {}
+    keys = output.get('files') or ([output['key']] if output.get('key') and state['status'] == 'done' else [])
+    status = {
+        'exportId': state['export_id'],
+        'status': state['status'],
+        'format': state['format'],
+        'source': state['source'],
+        'from': state.get('from'),
+        'to': state.get('to'),
+        'rows': state['rows'],
+        'quotations': state['quotations'],
+        'bytes': output.get('bytes', 0),
+        'seconds': round(state['seconds'], 2),
+        'rowsPerSecond': round(state['rows'] / state['seconds'], 1) if state['seconds'] else 0.0,
+        'segments': {'done': sum(1 for segment in state['segments'] if segment['done']), 'total': len(state['segments'])},
+        'runs': state['runs'],
+        'createdAt': state.get('created_at'),
+        'updatedAt': state.get('updated_at'),
+        'files': keys
+    }
+    if state.get('error'):
+        status['error'] = state['error']
+    if s3_client is not None and state['status'] == 'done':
+        status['downloadUrls'] = [s3_client.generate_presigned_url(
+            'get_object', Params={'Bucket': bucket_name, 'Key': key}, ExpiresIn=EXPORT_URL_EXPIRES_SECONDS) for key in keys]
+    return status
+
+def get_export_status(cache_table, export_id, s3_client=None, bucket_name=None):
+    state = _load_state(cache_table, export_id)
+    return export_status(state, s3_client, bucket_name) if state else None
+
+def prepare_resume(cache_table, export_id):
+    """Status of an export that may be run again; raises ValueError while another run is still active"""
+    state = _load_state(cache_table, export_id)
+    if state is None:
+        raise ExportRequestError(f"Unknown exportId: {export_id}")
+    if state['status'] == 'running':
+        idle = (datetime.utcnow() - datetime.fromisoformat(state['updated_at'])).total_seconds()
+        # A run checkpoints at least once per time budget; a quieter one has died
+        if idle < EXPORT_TIME_BUDGET_SECONDS + 60:
+            raise ValueError(f"Export {export_id} is still running")
+    return export_status(state)
+
+class MultipartUpload:
+    """Write-only file object that uploads to S3 in parts of at least EXPORT_PART_BYTES
+
+    Only the part being filled is held in memory. write() appends all it is
+    given before uploading, so a part always ends where a write ended.
+    state() describes the parts uploaded so far; passing it back continues
+    the same upload after the last of them.
+    """
+
+    def __init__(self, s3_client, bucket_name, key, content_type, state=None):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        if state:
+            self.upload_id = state['upload_id']
+            self.parts = list(state['parts'])
+            self.bytes = state['bytes']
+        else:
+            self.upload_id = s3_client.create_multipart_upload(Bucket=bucket_name, Key=key, ContentType=content_type)['UploadId']
+            self.parts = []
+            self.bytes = 0
+        self.buffer = bytearray()
+        self.closed = False
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= EXPORT_PART_BYTES:
+            self.upload_part()
+        return len(data)
+
+    def tell(self):
+        return self.bytes + len(self.buffer)
+
+    def flush(self):
+        pass
+
+    def writable(self):
+        return True
+
+    def upload_part(self):
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id,
+                                              PartNumber=part_number, Body=self.buffer)
+        self.parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+        self.bytes += len(self.buffer)
+        self.buffer = bytearray()
+
+    def flush_part(self):
+        """Upload the buffer now if S3 accepts it as a part; True when nothing is left to upload"""
+        if len(self.buffer) >= S3_MIN_PART_BYTES:
+            self.upload_part()
+        return not self.buffer
+
+    def state(self):
+        return {'upload_id': self.upload_id, 'parts': list(self.parts), 'bytes': self.bytes}
+
+    def complete(self):
+        if self.buffer or not self.parts:
+            self.upload_part()
+        self.s3_client.complete_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id,
+                                                 MultipartUpload={'Parts': self.parts})
+        self.closed = True
+
+    def close(self):
+        # pyarrow closes its sink when the Parquet writer closes; completing is left to complete()
+        pass
+
+    def abort(self):
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id)
+        except Exception as e:
+            print(f"Aborting upload of {self.key} failed: {e}")
+        self.closed = True
+
+class _CsvOutput:
+    """One CSV object; a checkpoint is possible after each uploaded part"""
+
+    def __init__(self, s3_client, bucket_name, export_id, state=None):
+        state = state or {'key': f"{EXPORT_PREFIX}{export_id}/quotations.csv", 'upload': None}
+        self.key = state['key']
+        self.upload = MultipartUpload(s3_client, bucket_name, self.key, 'text/csv', state['upload'])
+        # Until the first part is in S3 the header is not either
+        if not self.upload.parts:
+            self._write([EXPORT_COLUMNS])
+
+    def _write(self, rows):
+        text = io.StringIO()
+        csv.writer(text).writerows(rows)
+        parts = len(self.upload.parts)
+        self.upload.write(text.getvalue().encode('utf-8'))
+        return len(self.upload.parts) != parts
+
+    def write_rows(self, rows):
+        """Returns True when everything written so far is in S3"""
+        return self._write(rows) if rows else False
+
+    def flush(self):
+        """Returns True when everything written so far is in S3; below 5MB the rows can only wait for the next part"""
+        return self.upload.flush_part()
+
+    def finish(self):
+        self.upload.complete()
+
+    def discard(self):
+        # The upload stays open for a resume; parts after the checkpoint are uploaded again under the same numbers
+        pass
+
+    def state(self):
+        return {'key': self.key, 'upload': self.upload.state(), 'bytes': self.upload.bytes}
+
+class _ParquetOutput:
+    """A series of Parquet files; each is complete once closed, so a checkpoint is possible after any file"""
+
+    def __init__(self, s3_client, bucket_name, export_id, state=None):
+        import pyarrow as pa
+
+        self.pa = pa
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.export_id = export_id
+        state = state or {'files': [], 'bytes': 0}
+        self.files = list(state['files'])
+        self.bytes = state['bytes']
+        self.schema = pa.schema([(name, pa.float64() if name in NUMBER_COLUMNS else pa.int64() if name == 'item_seq' else pa.string())
+                                 for name in EXPORT_COLUMNS])
+        self.upload = None
+        self.writer = None
+        self.rows = []
+        self.file_rows = 0
+
+    def _open(self):
+        import pyarrow.parquet as pq
+
+        key = f"{EXPORT_PREFIX}{self.export_id}/part-{len(self.files):05d}.parquet"
+        self.upload = MultipartUpload(self.s3_client, self.bucket_name, key, 'application/vnd.apache.parquet')
+        self.writer = pq.ParquetWriter(self.upload, self.schema, compression='snappy')
+
+    def _write_row_group(self):
+        if self.writer is None:
+            self._open()
+        columns = list(zip(*self.rows)) if self.rows else [()] * len(EXPORT_COLUMNS)
+        arrays = []
+        for name, values in zip(EXPORT_COLUMNS, columns):
+            if name in NUMBER_COLUMNS:
+                values = [None if value is None else float(value) for value in values]
+            elif name == 'item_seq':
+                values = [None if value is None else int(value) for value in values]
+            else:
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(self.pa.array(values, type=self.schema.field(name).type))
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+        self.rows = []
+
+    def _close_file(self):
+        if self.rows or self.writer is None:
+            self._write_row_group()
+        self.writer.close()
+        self.upload.complete()
+        self.files.append(self.upload.key)
+        self.bytes += self.upload.bytes
+        self.upload = self.writer = None
+        self.file_rows = 0
+
+    def write_rows(self, rows):
+        self.rows.extend(rows)
+        self.file_rows += len(rows)
+        if len(self.rows) >= EXPORT_ROW_GROUP_ROWS:
+            self._write_row_group()
+        if self.file_rows >= EXPORT_PARQUET_FILE_ROWS:
+            self._close_file()
+            return True
+        return False
+
+    def flush(self):
+        """Close the file being written, so everything written so far is in S3"""
+        if self.file_rows:
+            self._close_file()
+        return True
+
+    def finish(self):
+        # An export without rows still gets one (empty) file with the schema
+        if self.file_rows or not self.files:
+            self._close_file()
+
+    def discard(self):
+        # Closed files are kept; the one being written is started again on resume
+        if self.upload is not None:
+            self.upload.abort()
+
+    def state(self):
+        return {'files': list(self.files), 'bytes': self.bytes}
+
+OUTPUTS = {'csv': _CsvOutput, 'parquet': _ParquetOutput}
+
+class BulkExport:
+    """One invocation's run of an export, from its last checkpoint until done or the time budget is spent
+
+    Segment readers (scan segments or index months) fetch pages of
+    quotation headers in parallel and look up their line items on a shared
+    pool; the pages go through a small bounded queue to the one thread
+    writing the output, so at most a few pages are held at a time. The
+    segment cursors are checkpointed together with the output whenever the
+    output is safely in S3, and an interrupted export resumes from there.
+    """
+
+    def __init__(self, cache_table, quotations_table, items_table, s3_client, bucket_name, state):
+        self.cache_table = cache_table
+        self.quotations_table = quotations_table
+        self.items_table = items_table
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.state = state
+        self.committed = None
+        self.seconds_before = state['seconds']
+        self.started = None
+
+    def _scan_page(self, segment, start_key):
+        names = {f'#h{i}': name for i, name in enumerate(HEADER_COLUMNS + ('items_count',))}
+        request = {
+            'Segment': segment['segment'],
+            'TotalSegments': len(self.state['segments']),
+            'Limit': EXPORT_PAGE_SIZE,
+            'ProjectionExpression': ', '.join(names),
+            # Async jobs that are still running or failed have no export rows yet
+            'FilterExpression': '#status = :processed',
+            'ExpressionAttributeNames': dict(names, **{'#status': 'status'}),
+            'ExpressionAttributeValues': {':processed': 'processed'}
+        }
+        if start_key:
+            request['ExclusiveStartKey'] = start_key
+        response = self.quotations_table.scan(**request)
+        return response.get('Items', []), response.get('LastEvaluatedKey')
+
+    def _index_page(self, segment, start_key):
+        start, end = self.state['from'], self.state['to']
+        request = {
+            'IndexName': PROCESSED_INDEX,
+            'KeyConditionExpression': '#pk = :pk AND #sk BETWEEN :start AND :end',
+            'ProjectionExpression': '#id',
+            'ExpressionAttributeNames': {'#pk': 'processed_month', '#sk': 'processed_at', '#id': 'quotation_id'},
+            # A bare date as the upper bound covers that whole day
+            'ExpressionAttributeValues': {':pk': segment['month'], ':start': start,
+                                          ':end': end + 'T23:59:59.999999' if len(end) == 10 else end},
+            'Limit': EXPORT_PAGE_SIZE
+        }
+        if start_key:
+            request['ExclusiveStartKey'] = start_key
+        response = self.quotations_table.query(**request)
+        return response.get('Items', []), response.get('LastEvaluatedKey')
+
+    def _quotation_rows(self, record):
+        if 'items_count' not in record:
+            # The index projects summary fields only; the PO and amounts are on the full record
+            names = {f'#h{i}': name for i, name in enumerate(HEADER_COLUMNS + ('items_count',))}
+            record = self.quotations_table.get_item(
+                Key={'quotation_id': record['quotation_id']},
+                ProjectionExpression=', '.join(names),
+                ExpressionAttributeNames=names
+            ).get('Item') or record
+        header = [record.get(name) for name in HEADER_COLUMNS]
+        items = get_all_line_items(self.items_table, record['quotation_id'], record.get('items_count'))
+        if not items:
+            return [tuple(header) + (None,) * len(ITEM_COLUMNS)]
+        return [tuple(header) + tuple(item.get(name) for name in ITEM_COLUMNS) for item in items]
+
+    def _put(self, pages, stop, entry):
+        while not stop.is_set():
+            try:
+                pages.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read_segment(self, index, start_key, pages, stop, item_pool):
+        segment = self.state['segments'][index]
+        read_page = self._index_page if 'month' in segment else self._scan_page
+        try:
+            while not stop.is_set():
+                records, start_key = read_page(segment, start_key)
+                rows = [row for quotation in item_pool.map(self._quotation_rows, records) for row in quotation]
+                if not self._put(pages, stop, (index, rows, len(records), start_key)) or start_key is None:
+                    return
+        except Exception as e:
+            # Straight to the writer, which stops the other segments
+            self._put(pages, stop, e)
+
+    def _read(self, pages, stop):
+        pending = [(index, segment['key']) for index, segment in enumerate(self.state['segments']) if not segment['done']]
+        with ThreadPoolExecutor(max_workers=EXPORT_ITEM_WORKERS) as item_pool, \
+                ThreadPoolExecutor(max_workers=max(1, min(EXPORT_SCAN_SEGMENTS, len(pending)))) as segment_pool:
+            for index, start_key in pending:
+                segment_pool.submit(self._read_segment, index, start_key, pages, stop, item_pool)
+        # After every segment; a failed one has already put its error
+        self._put(pages, stop, None)
+
+    def _commit(self, output, status='running'):
+        state = self.state
+        state['output'] = output.state()
+        state['status'] = status
+        state['seconds'] = self.seconds_before + time.perf_counter() - self.started
+        _save_state(self.cache_table, state)
+        self.committed = copy.deepcopy({name: state[name] for name in ('segments', 'rows', 'quotations', 'output')})
+
+    def _pause(self, output, in_s3):
+        """Checkpoint as 'paused'; rows that cannot be put in S3 yet are dropped and read again by the next run"""
+        if not in_s3 and not output.flush():
+            self.state.update(copy.deepcopy(self.committed))
+        self._commit(output, 'paused')
+
+    def run(self, time_budget=None, time_left=None):
+        """Export until done or out of time; returns the status, 'paused' if another run should continue
+
+        After time_budget seconds the run stops at the next checkpoint. With
+        time_left (seconds until the invocation times out) it also stops at
+        the next page once within EXPORT_STOP_MARGIN_SECONDS of the timeout,
+        checkpoint or not.
+        """
+        state = self.state
+        self.started = time.perf_counter()
+        deadline = self.started + (EXPORT_TIME_BUDGET_SECONDS if time_budget is None else time_budget)
+        stop_by = self.started + time_left - EXPORT_STOP_MARGIN_SECONDS if time_left is not None else float('inf')
+        state['runs'] += 1
+        output = None
+        pages = queue.Queue(maxsize=2 * EXPORT_SCAN_SEGMENTS)
+        stop = threading.Event()
+        reader = threading.Thread(target=self._read, args=(pages, stop), daemon=True)
+        try:
+            output = OUTPUTS[state['format']](self.s3_client, self.bucket_name, state['export_id'], state['output'])
+            self._commit(output)
+            reader.start()
+            while True:
+                try:
+                    page = pages.get(timeout=1)
+                except queue.Empty:
+                    # Slow reads must not run into the timeout either
+                    if time.perf_counter() >= stop_by:
+                        self._pause(output, False)
+                        break
+                    continue
+                if page is None:
+                    output.finish()
+                    self._commit(output, 'done')
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                index, rows, quotations, next_key = page
+                in_s3 = output.write_rows(rows)
+                segment = state['segments'][index]
+                segment['key'], segment['done'] = next_key, next_key is None
+                state['rows'] += len(rows)
+                state['quotations'] += quotations
+                if in_s3:
+                    self._commit(output)
+                now = time.perf_counter()
+                if now >= deadline and not in_s3:
+                    # Out of time between parts: checkpoint early if the rows so far can go to S3 now
+                    in_s3 = output.flush()
+                if (now >= deadline and in_s3) or now >= stop_by:
+                    self._pause(output, in_s3)
+                    break
+        except ExportConflict:
+            raise
+        except Exception as e:
+            # Recorded at the last checkpoint, so a resume carries on from there
+            print(f"Export {state['export_id']} failed: {e}")
+            if output is not None:
+                output.discard()
+            if self.committed:
+                state.update(copy.deepcopy(self.committed))
+            state['status'] = 'failed'
+            state['error'] = str(e)[:1000]
+            state['seconds'] = self.seconds_before + time.perf_counter() - self.started
+            _save_state(self.cache_table, state)
+        finally:
+            stop.set()
+            if reader.is_alive():
+                reader.join()
+        status = export_status(state)
+        print(f"Export {state['export_id']} {state['status']}: {status['rows']} rows, "
+              f"{status['quotations']} quotations, {status['rowsPerSecond']} rows/s")
+        return status
+
+def run_export(cache_table, quotations_table, items_table, s3_client, bucket_name, export_id, time_budget=None, time_left=None):
+    state = _load_state(cache_table, export_id)
+    if state is None:
+        raise ValueError(f"Unknown exportId: {export_id}")
+    if state['status'] == 'done':
+        return export_status(state)
+    state['error'] = None
+    return BulkExport(cache_table, quotations_table, items_table, s3_client, bucket_name, state).run(time_budget, time_left)
@@ -0,0 +1,175 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_extractor import PAGE_SEPARATOR
+
+# Documents longer than this are extracted as concurrent per-chunk Bedrock calls
+CHUNKED_EXTRACTION_MIN_CHARS = int(os.environ.get('CHUNKED_EXTRACTION_MIN_CHARS', '16000'))
+CHUNK_TARGET_CHARS = int(os.environ.get('CHUNK_TARGET_CHARS', '8000'))
+CHUNK_MAX_WORKERS = int(os.environ.get('CHUNK_MAX_WORKERS', '4'))
+
+ITEMS_PROMPT = """
+You are a data extraction expert. Below is part {part} of {parts} of a longer quotation document.
+Extract ONLY the line items that appear in this part and return ONLY a valid JSON object.
+
+Document part:
+{text}
+
+Return JSON in this exact shape:
+{{
+  "items": [
+    {{
+      "description": "item name/description",
+      "quantity": number,
+      "unit_price": number,
+      "total_amount": number
+    }}
+  ],
+  "subtotal": number or null if not shown in this part,
+  "tax": number or null if not shown in this part,
+  "total": number or null if not shown in this part
+}}
+
+Return ONLY the JSON object, no other text.
+"""
+
+def should_chunk(text_content):
+    return len(text_content) >= CHUNKED_EXTRACTION_MIN_CHARS
+
+def _split_lines(text, target_chars):
+    """Split an oversized page on line boundaries so item rows stay intact"""
+    pieces = []
+    current = []
+    size = 0
+    for line in text.split('\n'):
+        if current and size + len(line) + 1 > target_chars:
+            pieces.append('\n'.join(current))
+            current = []
+            size = 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        pieces.append('\n'.join(current))
+    return pieces
+
+def split_into_chunks(text_content, target_chars=None):
+    """Pack whole pages into chunks of roughly target_chars, splitting only oversized pages"""
+    target_chars = target_chars or CHUNK_TARGET_CHARS
+    units = []
+    for page in text_content.split(PAGE_SEPARATOR):
+        if not page.strip():
+            continue
+        units.extend(_split_lines(page, target_chars) if len(page) > target_chars else [page])
+
+    chunks = []
+    current = []
+    size = 0
+    for unit in units:
+        if current and size + len(unit) > target_chars:
+            chunks.append(PAGE_SEPARATOR.join(current))
+            current = []
+            size = 0
+        current.append(unit)
+        size += len(unit)
+    if current:
+        chunks.append(PAGE_SEPARATOR.join(current))
+    return chunks
+
+def _item_key(item):
+    description = ' '.join(str(item.get('description') or '').lower().split())
+    return (description, str(item.get('quantity')), str(item.get('unit_price')), str(item.get('total_amount')))
+
+def _amount(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def merge_chunk_results(results):
+    """Combine per-chunk extractions: header from the first chunk, items from every chunk in order
+
+    Chunks never overlap, so a row found again in a later chunk is usually
+    a genuine repeat (the same SKU for another delivery phase). Such rows
+    are dropped only while the items add up to more than the stated
+    subtotal, which is what a carried-forward line or repeated table does.
+    """
+    merged = dict(results[0])
+    items = []
+    repeats = []
+    seen = set()
+    for result in results:
+        if not result:
+            continue
+        chunk_keys = set()
+        for item in result.get('items') or []:
+            key = _item_key(item)
+            # Identical rows within one chunk are always separate lines
+            if key in seen:
+                repeats.append(len(items))
+            chunk_keys.add(key)
+            items.append(item)
+        seen |= chunk_keys
+    # Totals are normally printed at the end, so the last chunk that reports them wins
+    for field in ('subtotal', 'tax', 'total'):
+        for result in reversed(results):
+            if result and result.get(field) is not None:
+                merged[field] = result[field]
+                break
+
+    subtotal = merged.get('subtotal')
+    if subtotal is None and merged.get('total') is not None:
+        subtotal = _amount(merged['total']) - _amount(merged.get('tax'))
+    dropped = set()
+    if repeats and subtotal is not None:
+        excess = sum(_amount(item.get('total_amount')) for item in items) - _amount(subtotal)
+        for index in repeats:
+            amount = _amount(items[index].get('total_amount'))
+            if excess > 0.01 and 0 < amount <= excess + 0.01:
+                dropped.add(index)
+                excess -= amount
+    if dropped:
+        print(f"Dropped {len(dropped)} repeated rows that pushed the items past the subtotal")
+    merged['items'] = [item for index, item in enumerate(items) if index not in dropped]
+    return merged
+
+def extract_chunked(text_content, invoke, build_header_prompt, max_workers=None):
+    """Map the document's chunks over concurrent model calls and reduce them into one result
+
+    invoke(prompt) must return the parsed JSON dict for a prompt. The first chunk
+    uses build_header_prompt so header fields are extracted exactly once.
+    Returns (result, complete, metrics); result is None if the first chunk failed.
+    """
+    started = time.perf_counter()
+    chunks = split_into_chunks(text_content)
+    prompts = [build_header_prompt(chunks[0])]
+    prompts += [ITEMS_PROMPT.format(part=i + 1, parts=len(chunks), text=chunk) for i, chunk in enumerate(chunks[1:], start=1)]
+
+    def run(prompt):
+        call_started = time.perf_counter()
+        try:
+            return invoke(prompt), None, time.perf_counter() - call_started
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}", time.perf_counter() - call_started
+
+    workers = max(1, min(max_workers or CHUNK_MAX_WORKERS, len(prompts)))
+    print(f"Chunked extraction: {len(chunks)} chunks, {workers} concurrent calls")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outcomes = list(pool.map(run, prompts))
+
+    results = [result for result, _, _ in outcomes]
+    errors = [{'chunk': i, 'error': error} for i, (_, error, _) in enumerate(outcomes) if error]
+    for error in errors:
+        print(f"Chunk {error['chunk']} failed: {error['error']}")
+
+    merged = merge_chunk_results(results) if results[0] else None
+    metrics = {
+        'chunks': len(chunks),
+        'workers': workers,
+        'chunk_chars': [len(chunk) for chunk in chunks],
+        'chunk_seconds': [round(seconds, 3) for _, _, seconds in outcomes],
+        'total_seconds': round(time.perf_counter() - started, 3),
+        'items': len(merged['items']) if merged else 0,
+        'errors': errors
+    }
+    return merged, not errors, metrics
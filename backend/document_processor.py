@@ -3,29 +3,61 @@ import boto3
 import base64
 import uuid
 import os
+import re
 from datetime import datetime
-from io import BytesIO
 from decimal import Decimal
 import csv
+import hashlib
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-PyPDF2 = None
-docx = None
+from pdf_extractor import pdf_available, extract_pdf_pages, join_pages
+from tracing import RequestTrace, log_debug
+from s3_ingest import check_upload_key, create_upload_url, download_to_tempfile
+from async_jobs import JobTracker, get_job_status
+from bedrock_invoker import get_bedrock_invoker, get_bedrock_metrics
+from bedrock_streaming import IncrementalJSONParser, iter_text_deltas
+from chunked_extraction import should_chunk, extract_chunked
+from extraction_cache import make_cache_key, get_cached_extraction, put_cached_extraction, get_cache_stats
+from quotation_store import put_line_items, put_raw_text, get_line_items, StreamingItemWriter
+from quotation_query import (processed_month, invalidate_query_cache, find_by_company, find_by_quote_number,
+                             find_by_processed_range, get_query_cache_stats)
+from spreadsheet_extractor import spreadsheet_format, extract_spreadsheet
+from docx_extractor import DOCX_TYPE, extract_docx
+from rule_extractor import RULE_CONFIDENCE_THRESHOLD, extract_with_rules, record_path, get_path_metrics
+from vendor_templates import match_template, learn_template, get_template_stats
+from artifact_fanout import DEFAULT_ARTIFACT_SINKS, parse_sinks, run_sinks
+from prompt_compaction import PROMPT_COMPACTION, compaction_mode, compact_text
+from quotation_model import LineItem, Quotation, PurchaseOrder
+from single_flight import IDEMPOTENCY_TTL_SECONDS, FlightInProgress, IdempotencyKeyReused, run_once, get_flight_stats
+from model_router import (ACCURATE_MODEL_ID, MODEL_TIERS, model_signature, document_features, choose_tier,
+                          validate_extraction, record_tier, get_tier_metrics)
 
-try:
-    import PyPDF2
-except ImportError:
-    pass
+# AWS clients, document parsers and config are created on first use so a cold
+# start only pays for what the request actually needs
+_clients = {}
+_clients_lock = threading.Lock()
 
-try:
-    from docx import Document
-    docx = True
-except ImportError:
-    pass
+def get_client(service):
+    """Shared boto3 client for a service, built on first use"""
+    client = _clients.get(service)
+    if client is None:
+        # Client creation on the default session is not thread-safe
+        with _clients_lock:
+            client = _clients.get(service)
+            if client is None:
+                client = _clients[service] = boto3.client(service)
+    return client
 
-# Initialize AWS clients
-s3_client = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
-bedrock_client = boto3.client('bedrock-runtime')
+def get_dynamodb():
+    resource = _clients.get('dynamodb-resource')
+    if resource is None:
+        with _clients_lock:
+            resource = _clients.get('dynamodb-resource')
+            if resource is None:
+                resource = _clients['dynamodb-resource'] = boto3.resource('dynamodb')
+    return resource
 
 # Load configuration from env-vars1.json
 def load_config():
@@ -39,14 +71,77 @@ def load_config():
             'DYNAMODB_TABLE': os.environ.get('DYNAMODB_TABLE', 'quotation-processor-quotations')
         }
 
-config = load_config()
+_config = None
+
+def get_config():
+    global _config
+    if _config is None:
+        _config = load_config()
+    return _config
+
+def get_docs_bucket():
+    return get_config().get('DOCS_BUCKET', os.environ.get('S3_BUCKET', 'quotation-processor-docs'))
+
+# Bump PROMPT_VERSION whenever enhanced_prompt changes so cached extractions are invalidated
+BEDROCK_MODEL_ID = ACCURATE_MODEL_ID
+PROMPT_VERSION = "3"
+BEDROCK_MAX_TOKENS = int(os.environ.get('BEDROCK_MAX_TOKENS', '4096'))
+# Stream single-call extractions so line items are written while the model is still generating
+BEDROCK_STREAMING = os.environ.get('BEDROCK_STREAMING', 'off').lower() in ('1', 'on', 'true', 'yes')
+# Header fields shown on the job record as soon as the model has produced them
+PREVIEW_FIELDS = ('company_name', 'quote_number', 'date')
+
+# Batch requests fan out over a bounded pool; Bedrock and S3 calls are I/O bound
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', '8'))
+BATCH_MAX_DOCUMENTS = int(os.environ.get('BATCH_MAX_DOCUMENTS', '200'))
+# Larger batches are queued as async jobs (HTTP 202); a synchronous one has to answer within the API Gateway limit
+BATCH_SYNC_MAX_DOCUMENTS = int(os.environ.get('BATCH_SYNC_MAX_DOCUMENTS', str(BATCH_MAX_WORKERS)))
+# No synchronous batch document is started after this long, or this close to the function timeout
+BATCH_TIME_BUDGET_SECONDS = float(os.environ.get('BATCH_TIME_BUDGET_SECONDS', '20'))
+BATCH_STOP_MARGIN_SECONDS = float(os.environ.get('BATCH_STOP_MARGIN_SECONDS', '60'))
+
+# Currency recorded in the extraction metadata, read from the document text
+SGD_PATTERN = re.compile(r'\bSGD\b|\bS\$')
+
+FILE_TYPES_BY_EXTENSION = {
+    '.pdf': 'application/pdf',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.doc': 'application/msword',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.csv': 'text/csv'
+}
+
+def get_artifact_sinks():
+    """Outputs written after extraction: any of dynamodb, pdf, csv, json"""
+    return parse_sinks(get_config().get('ARTIFACT_SINKS', os.environ.get('ARTIFACT_SINKS', DEFAULT_ARTIFACT_SINKS)))
+
+def get_quotations_table():
+    return get_dynamodb().Table(get_config().get('DYNAMODB_TABLE', os.environ.get('DYNAMODB_TABLE', 'quotation-processor-quotations')))
+
+def get_items_table():
+    quotations_table = get_config().get('DYNAMODB_TABLE', os.environ.get('DYNAMODB_TABLE', 'quotation-processor-quotations'))
+    return get_dynamodb().Table(get_config().get('ITEMS_TABLE', os.environ.get('ITEMS_TABLE', f"{quotations_table}-items")))
+
+def get_cache_table():
+    quotations_table = get_config().get('DYNAMODB_TABLE', os.environ.get('DYNAMODB_TABLE', 'quotation-processor-quotations'))
+    return get_dynamodb().Table(get_config().get('CACHE_TABLE', os.environ.get('CACHE_TABLE', f"{quotations_table}-cache")))
 
 def handler(event, context):
+    trace = RequestTrace(getattr(context, 'aws_request_id', None))
     try:
-        # Handle different HTTP methods for Function URLs
-        http_method = event.get('requestContext', {}).get('http', {}).get('method', 'POST')
+        # Out-of-band run of an async job submitted by an earlier request
+        if 'asyncJob' in event:
+            run_async_job(event['asyncJob'])
+            return {'statusCode': 200, 'body': ''}
+        # A bulk export continuing from its last checkpoint
+        if 'exportJob' in event:
+            run_export_job(event['exportJob'], context)
+            return {'statusCode': 200, 'body': ''}
+        
+        # Handle different HTTP methods for Function URLs and API Gateway
+        http_method = event.get('requestContext', {}).get('http', {}).get('method') or event.get('httpMethod') or 'POST'
         print(f"HTTP Method: {http_method}")
-        print(f"Event: {json.dumps(event, default=str)[:200]}...")
+        log_debug(lambda: f"Event: {json.dumps(event, default=str)[:200]}...")
         
         # Handle OPTIONS request for CORS
         if http_method == 'OPTIONS':
@@ -54,140 +149,678 @@ def handler(event, context):
                 'statusCode': 200,
                 'headers': {
                     'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type',
-                    'Access-Control-Allow-Methods': 'POST,OPTIONS',
+                    'Access-Control-Allow-Headers': 'Content-Type,Idempotency-Key',
+                    'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
                     'Access-Control-Max-Age': '86400'
                 },
                 'body': ''
             }
         
+        # Search: GET ?company=... | ?quoteNumber=... | ?from=YYYY-MM-DD[&to=...] with limit/cursor
+        # Poll an async job: GET ?quotationId=...
+        # Page through line items: GET ?quotationId=...&view=items[&limit=100&cursor=...]
+        # Poll a bulk export: GET ?exportId=...
+        if http_method == 'GET':
+            params = event.get('queryStringParameters') or {}
+            quotation_id = params.get('quotationId')
+            not_found = f"Quotation {quotation_id} not found"
+            if params.get('exportId'):
+                status = get_export(params['exportId'])
+                not_found = f"Export {params['exportId']} not found"
+            elif not quotation_id:
+                status = search_quotations(params)
+            elif params.get('view') == 'items':
+                status = get_item_page(quotation_id, params.get('limit'), params.get('cursor'))
+            else:
+                status = get_job_status(get_quotations_table(), quotation_id)
+            return {
+                'statusCode': 200 if status else 404,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Allow-Headers': 'Content-Type,Idempotency-Key',
+                    'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
+                    'Content-Type': 'application/json'
+                },
+                'body': json.dumps(decimal_to_float(status) if status else {'error': not_found})
+            }
+        
         # Parse the incoming request
         if 'body' not in event or not event['body']:
             raise ValueError("No body in request")
             
         body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
+        status_code = 200
+        # Retries and duplicate submits of one document share a single run (see single_flight)
+        idempotency_key = get_idempotency_key(event, body)
         
-        if 'file' not in body:
-            raise ValueError("No file in request body")
-            
-        file_content = base64.b64decode(body['file'])
-        file_name = body.get('fileName', 'unknown.pdf')
-        file_type = body.get('fileType', 'application/pdf')
+        # Step one of a direct upload: hand out a presigned PUT URL for DOCS_BUCKET
+        if body.get('action') == 'createUpload':
+            file_name = body.get('fileName', 'unknown.pdf')
+            bucket_name = get_docs_bucket()
+            response_data = create_upload_url(get_client('s3'), bucket_name, file_name, body.get('fileType') or guess_file_type(file_name))
         
-        print(f"Processing file: {file_name}, type: {file_type}, size: {len(file_content)} bytes")
+        # Price comparison of stored quotations: {"action": "compare", "quotationIds": [...], "itemLimit": 200}
+        elif body.get('action') == 'compare':
+            with trace.stage('compare'):
+                response_data = compare_stored_quotations(body.get('quotationIds') or [], body.get('itemLimit'))
         
-        # Extract text from document
-        print("Extracting text...")
-        text_content = extract_text(file_content, file_type)
-        print(f"Extracted text length: {len(text_content)}")
-        print(f"First 500 chars: {text_content[:500]}")
-        
-        # Process with Bedrock AI
-        print("Processing with Bedrock...")
-        extracted_data = process_with_bedrock(text_content)
-        print(f"Bedrock response: {extracted_data}")
-        
-        # Store in DynamoDB
-        quotation_id = str(uuid.uuid4())
-        print(f"Storing in DynamoDB with ID: {quotation_id}")
-        store_quotation(quotation_id, extracted_data, file_name, text_content)
-        print("Stored successfully")
-        
-        # Generate purchase order
-        print("Generating purchase order...")
-        purchase_order = generate_purchase_order(extracted_data)
-        print("Purchase order generated")
-        
-        # Generate PDF report
-        print("Generating PDF report...")
-        from simple_reports import generate_pdf_report, generate_summary
-        pdf_url = generate_pdf_report(quotation_id, extracted_data, purchase_order)
-        summary = generate_summary(extracted_data, purchase_order)
-        print(f"PDF report generated: {pdf_url}, Summary: {summary}")
-        
-        # Convert Decimals to floats for JSON response
-        def decimal_to_float(obj):
-            if isinstance(obj, dict):
-                return {k: decimal_to_float(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [decimal_to_float(v) for v in obj]
-            elif isinstance(obj, Decimal):
-                return float(obj)
-            return obj
-        
-        response_data = {
-            'quotationId': quotation_id,
-            'extractedData': decimal_to_float(extracted_data),
-            'purchaseOrder': decimal_to_float(purchase_order),
-            'reports': {
-                'pdfUrl': pdf_url
+        # Bulk export to S3: {"action": "export", "format": "csv" | "parquet", "from": "2024-01-01", "to": "2024-01-31"}
+        # or {"action": "export", "resume": "<exportId>"}; poll with GET ?exportId=...
+        elif body.get('action') == 'export':
+            response_data, status_code = start_export(body, context)
+        
+        # Batch mode: {"files": [{"file" | "s3Key", "fileName", "fileType"}, ...], "async": false}
+        elif 'files' in body:
+            with trace.stage('batch'):
+                response_data = process_batch(body['files'], context, skip_cache=body.get('skipCache', False),
+                                              run_async=body.get('async', False))
+            if response_data['async']:
+                status_code = 202
+        
+        # Step two of a direct upload: process the object by key, streamed from S3
+        elif 's3Key' in body:
+            # Checked here too so an async job is never queued for a key it may not read
+            upload_key = check_upload_key(body['s3Key'])
+            file_name = body.get('fileName') or os.path.basename(upload_key)
+            file_type = body.get('fileType') or guess_file_type(file_name)
+            bucket_name = get_docs_bucket()
+            
+            document_id = f"s3://{bucket_name}/{upload_key}"
+            
+            if body.get('async'):
+                response_data = run_single_flight(
+                    document_id, 'async', idempotency_key, body.get('skipCache', False), trace,
+                    lambda: submit_async_job(None, file_name, file_type, context, skip_cache=body.get('skipCache', False), upload_key=upload_key))
+                status_code = 202
+            else:
+                response_data = run_single_flight(
+                    document_id, 'sync', idempotency_key, body.get('skipCache', False), trace,
+                    lambda: process_s3_document(bucket_name, upload_key, file_name, file_type, skip_cache=body.get('skipCache', False), trace=trace))
+        else:
+            if 'file' not in body:
+                raise ValueError("No file in request body")
+                
+            with trace.stage('decode'):
+                file_content = base64.b64decode(body['file'])
+                file_digest = hashlib.sha256(file_content).hexdigest()
+            file_name = body.get('fileName', 'unknown.pdf')
+            file_type = body.get('fileType', 'application/pdf')
+            
+            if body.get('async'):
+                # Return the ID straight away; the pipeline runs in a separate invocation
+                response_data = run_single_flight(
+                    file_digest, 'async', idempotency_key, body.get('skipCache', False), trace,
+                    lambda: submit_async_job(file_content, file_name, file_type, context, skip_cache=body.get('skipCache', False)))
+                status_code = 202
+            else:
+                response_data = run_single_flight(
+                    file_digest, 'sync', idempotency_key, body.get('skipCache', False), trace,
+                    lambda: process_document(file_content, file_name, file_type, skip_cache=body.get('skipCache', False),
+                                             file_digest=file_digest, trace=trace))
+        
+        log_debug(lambda: f"Returning response: {response_data}")
+        with trace.stage('serialize_response'):
+            # NaN or Infinity is not JSON; failing here beats a body the client cannot parse
+            response_body = json.dumps(response_data, allow_nan=False)
+        trace.count(response_bytes=len(response_body))
+        trace.emit(status_code=status_code)
+        return {
+            'statusCode': status_code,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Headers': 'Content-Type,Idempotency-Key',
+                'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
+                'Content-Type': 'application/json'
             },
-            'summary': summary
+            'body': response_body
         }
         
-        print(f"Returning response: {response_data}")
+    except FlightInProgress as e:
+        # The first request is still running; the client should retry with the same key
+        print(f"Conflict: {str(e)}")
+        trace.emit(status_code=409, error=str(e))
+        return {
+            'statusCode': 409,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Headers': 'Content-Type,Idempotency-Key',
+                'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
+                'Content-Type': 'application/json',
+                'Retry-After': '5'
+            },
+            'body': json.dumps({'error': str(e)})
+        }
+    except IdempotencyKeyReused as e:
+        # The client sent another document under a key it already used
+        print(f"Rejected: {str(e)}")
+        trace.emit(status_code=422, error=str(e))
         return {
-            'statusCode': 200,
+            'statusCode': 422,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Allow-Methods': 'POST,OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type,Idempotency-Key',
+                'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
                 'Content-Type': 'application/json'
             },
-            'body': json.dumps(response_data)
+            'body': json.dumps({'error': str(e)})
         }
-        
     except Exception as e:
         print(f"Error: {str(e)}")
+        trace.emit(status_code=500, error=str(e))
         return {
             'statusCode': 500,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Allow-Methods': 'POST,OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type,Idempotency-Key',
+                'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
                 'Content-Type': 'application/json'
             },
             'body': json.dumps({'error': str(e)})
         }
 
-def extract_text(file_content, file_type):
-    """Extract text from PDF or Word documents"""
+def get_idempotency_key(event, body):
+    """Client-chosen key from the request body or an Idempotency-Key header"""
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    return body.get('idempotencyKey') or headers.get('idempotency-key')
+
+def run_single_flight(document_id, mode, idempotency_key, skip_cache, trace, compute):
+    """Run compute once for identical concurrent requests and return its response plus the caller's flight role
+
+    Requests coalesce on the idempotency key when one is given (its response
+    is kept for IDEMPOTENCY_TTL_SECONDS), otherwise on the document itself.
+    A skipCache request only shares a run that is still in progress.
+    """
+    fingerprint = f"{mode}#{document_id}"
+    if idempotency_key:
+        key, retention_seconds = f"key#{idempotency_key}", IDEMPOTENCY_TTL_SECONDS
+    elif skip_cache:
+        key, retention_seconds = f"doc#{fingerprint}#fresh", 0
+    else:
+        key, retention_seconds = f"doc#{fingerprint}", None
+    started = time.perf_counter()
+    response_data, role = run_once(key, compute, get_cache_table(), fingerprint=fingerprint, retention_seconds=retention_seconds)
+    if role != 'leader':
+        print(f"Shared the response of an identical request ({role})")
+        if trace:
+            trace.record('flight_wait', time.perf_counter() - started)
+    # A copy, other callers may share the same response object
+    return dict(response_data, flight={'role': role})
+
+def decimal_to_float(obj):
+    """Convert Decimals to floats for JSON response"""
+    if isinstance(obj, dict):
+        return {k: decimal_to_float(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [decimal_to_float(v) for v in obj]
+    elif isinstance(obj, Decimal):
+        return float(obj)
+    return obj
+
+def search_quotations(params):
+    """Summary listing from the secondary indexes; never scans the table"""
+    table = get_quotations_table()
+    limit = params.get('limit')
+    cursor = params.get('cursor')
+    if params.get('company'):
+        result = find_by_company(table, params['company'], limit, cursor)
+    elif params.get('quoteNumber'):
+        result = find_by_quote_number(table, params['quoteNumber'], limit, cursor)
+    elif params.get('from'):
+        result = find_by_processed_range(table, params['from'], params.get('to'), limit, cursor)
+    else:
+        raise ValueError("quotationId, company, quoteNumber or from query parameter is required")
+    result['cache'] = get_query_cache_stats()
+    return result
+
+def get_item_page(quotation_id, limit=None, cursor=None):
+    """One page of a stored quotation's line items, or None if the quotation is unknown"""
+    header = get_quotations_table().get_item(
+        Key={'quotation_id': quotation_id},
+        ProjectionExpression='items_count'
+    ).get('Item')
+    if header is None:
+        return None
+    items_count = header.get('items_count')
+    items, next_cursor = get_line_items(get_items_table(), quotation_id, limit, cursor, items_count)
+    return {
+        'quotationId': quotation_id,
+        'itemsCount': items_count,
+        'items': items,
+        'nextCursor': next_cursor
+    }
+
+def compare_stored_quotations(quotation_ids, item_limit=None):
+    """Vendor x item price comparison of stored quotations (see price_comparison)"""
+    # NumPy is only loaded for comparisons, not on the document path
+    from price_comparison import load_quotations, compare_quotations
+    
+    started = time.perf_counter()
+    quotations = load_quotations(get_quotations_table(), get_items_table(), quotation_ids)
+    load_seconds = time.perf_counter() - started
+    comparison = compare_quotations(quotations, item_limit)
+    comparison['timings']['load_seconds'] = round(load_seconds, 4)
+    print(f"Compared {comparison['quotations']} quotations, {comparison['items']} items: {comparison['timings']}")
+    return comparison
+
+def start_export(body, context):
+    """Create (or resume) a bulk export and hand it to an async invocation (see bulk_export)
+
+    Returns (response data, status code): 202 once queued, 400 for a request
+    that cannot be served, such as Parquet without pyarrow in the layer.
+    """
+    from bulk_export import ExportRequestError, create_export, prepare_resume
+    
     try:
-        if file_type == 'application/pdf':
-            if PyPDF2 is None:
-                return "PDF processing not available. Please install PyPDF2."
-            pdf_reader = PyPDF2.PdfReader(BytesIO(file_content))
-            text = ""
-            for page_num, page in enumerate(pdf_reader.pages):
+        if body.get('resume'):
+            status = prepare_resume(get_cache_table(), body['resume'])
+            if status['status'] == 'done':
+                return status, 202
+        else:
+            status = create_export(get_cache_table(), body.get('format'), body.get('from'), body.get('to'))
+    except ExportRequestError as e:
+        print(f"Export rejected: {e}")
+        return {'error': str(e)}, 400
+    invoke_export_job(status['exportId'], context)
+    return status, 202
+
+def invoke_export_job(export_id, context):
+    function_name = get_config().get('ASYNC_FUNCTION_NAME', os.environ.get('ASYNC_FUNCTION_NAME')) or context.function_name
+    get_client('lambda').invoke(
+        FunctionName=function_name,
+        InvocationType='Event',
+        Payload=json.dumps({'exportJob': {'exportId': export_id}})
+    )
+
+def run_export_job(export_job, context):
+    """Run an export until done or out of time; a paused export continues in a new invocation"""
+    from bulk_export import ExportConflict, run_export
+    
+    export_id = export_job['exportId']
+    # Seconds until this invocation times out, so the run can stop in time between checkpoints
+    time_left = context.get_remaining_time_in_millis() / 1000 if hasattr(context, 'get_remaining_time_in_millis') else None
+    try:
+        status = run_export(get_cache_table(), get_quotations_table(), get_items_table(), get_client('s3'),
+                            get_docs_bucket(), export_id, time_left=time_left)
+    except ExportConflict as e:
+        # Another invocation owns the export now
+        print(f"Export {export_id} stopped: {e}")
+        return
+    if status['status'] == 'paused':
+        invoke_export_job(export_id, context)
+
+def get_export(export_id):
+    from bulk_export import get_export_status
+    
+    return get_export_status(get_cache_table(), export_id, get_client('s3'), get_docs_bucket())
+
+def process_document(file_content, file_name, file_type, skip_cache=False, quotation_id=None, job=None, file_digest=None, trace=None):
+    """Run extraction, storage, PO and report generation for one document
+
+    file_content is the raw bytes, or a local file path together with its
+    precomputed sha256 file_digest. When a JobTracker is passed, each stage is
+    recorded on the quotation record. Stage timings go to trace (a fresh
+    RequestTrace if none is given) and are returned under 'timings'.
+    """
+    trace = trace or RequestTrace()
+    file_size = len(file_content) if isinstance(file_content, bytes) else os.path.getsize(file_content)
+    trace.count(input_bytes=file_size)
+    print(f"Processing file: {file_name}, type: {file_type}, size: {file_size} bytes")
+    if job:
+        job.set_stage('extracting')
+    
+    # Identical uploads reuse a previous extraction instead of calling Bedrock again
+    with trace.stage('cache_lookup'):
+        cache_key = make_cache_key(file_content, model_signature(), f"{PROMPT_VERSION}-{compaction_mode()}", digest=file_digest)
+        cache_table = get_cache_table()
+        cached, cache_tier = (None, None) if skip_cache else get_cached_extraction(cache_key, cache_table)
+    extraction_metrics = {}
+    rule_checks = None
+    confidence = None
+    vendor = None
+    streamed_items = None
+    routing = None
+    quotation_id = quotation_id or str(uuid.uuid4())
+    path_started = time.perf_counter()
+    
+    if cached:
+        print(f"Extraction cache hit ({cache_tier}): {cache_key}")
+        text_content = cached['text_content']
+        extracted_data = cached['extracted_data']
+        extraction_path = 'cache'
+    else:
+        # Spreadsheets and Word tables map straight to fields; without a usable table they take the text path
+        sheet_format = spreadsheet_format(file_type, file_name) or ('docx' if file_type == DOCX_TYPE else None)
+        sheet_data = None
+        print("Extracting text...")
+        with trace.stage('extract_text'):
+            if sheet_format == 'docx':
                 try:
-                    page_text = page.extract_text()
-                    print(f"Page {page_num + 1}: extracted {len(page_text) if page_text else 0} chars")
-                    if page_text and page_text.strip():
-                        text += page_text + "\n"
-                        print(f"Page {page_num + 1} content preview: {page_text[:100]}...")
+                    sheet_data, text_content, sheet_checks = extract_spreadsheet(file_content, 'docx', metrics=extraction_metrics)
                 except Exception as e:
-                    print(f"Error on page {page_num + 1}: {e}")
+                    # A damaged file gets the same error text from extract_text below as any other document
+                    print(f"Could not read Word tables: {e}")
+                    sheet_data = None
+                if sheet_data is None:
+                    # The text path reads the tables as "a | b | c" rows, not the header-style lines rebuilt above
+                    text_content = extract_text(file_content, DOCX_TYPE, metrics=extraction_metrics)
+            elif sheet_format:
+                sheet_data, text_content, sheet_checks = extract_spreadsheet(file_content, sheet_format, metrics=extraction_metrics)
+            else:
+                text_content = extract_text(file_content, file_type, metrics=extraction_metrics)
+        print(f"Extracted text length: {len(text_content)}")
+        log_debug(lambda: f"First 500 chars: {text_content[:500]}")
+        
+        if sheet_data is not None:
+            print(f"Item table mapped ({sheet_format}): {sheet_checks}")
+            extracted_data = sheet_data
+            extraction_path = 'table' if sheet_format == 'docx' else 'spreadsheet'
+            rule_checks = sheet_checks
+        else:
+            # Repeat suppliers are parsed with the layout template learned from an earlier document
+            with trace.stage('template_match'):
+                template_data, vendor, template_checks = match_template(text_content, cache_table)
+        
+            if template_data is not None:
+                print(f"Vendor template hit: {vendor}")
+                extracted_data = template_data
+                extraction_path = 'template'
+                rule_checks = template_checks
+            else:
+                # Well-formed quotations whose arithmetic checks out never reach the model
+                with trace.stage('rule_extract'):
+                    rule_data, confidence, rule_checks = extract_with_rules(text_content)
+                print(f"Rule extraction confidence: {confidence} {rule_checks}")
+            
+                if confidence >= RULE_CONFIDENCE_THRESHOLD:
+                    extracted_data = rule_data
+                    extraction_path = 'rules'
+                else:
+                    # Process with Bedrock AI
+                    print("Processing with Bedrock...")
+                    with trace.stage('bedrock'):
+                        extracted_data, from_model, streamed_items, routing = extract_with_model(
+                            text_content, confidence, quotation_id, job=job, trace=trace)
+                    log_debug(lambda: f"Bedrock response: {extracted_data}")
+                    extraction_path = 'model' if from_model else 'fallback'
+                
+                    # Never cache or learn from fallback results, the next attempt may succeed
+                    if from_model:
+                        with trace.stage('cache_store'):
+                            put_cached_extraction(cache_key, {'text_content': text_content, 'extracted_data': extracted_data}, cache_table)
+                        with trace.stage('template_learn'):
+                            learn_template(text_content, extracted_data, cache_table)
+    record_path(extraction_path, time.perf_counter() - path_started)
+    trace.count(text_chars=len(text_content), items=len(extracted_data.get('items') or []))
+    if job:
+        job.set_stage('extracted')
+    
+    # Generate purchase order
+    print("Generating purchase order...")
+    with trace.stage('generate_purchase_order'):
+        quotation = Quotation.from_extraction(extracted_data)
+        purchase_order = generate_purchase_order(quotation)
+    print("Purchase order generated")
+    
+    # The record, reports and exports are independent, so write them concurrently
+    from simple_reports import generate_pdf_report, generate_csv_report, generate_json_report, generate_summary
+    writers = {
+        # The record is written once the PO exists, so it doubles as the po_generated job stage
+        'dynamodb': lambda: store_quotation(quotation_id, quotation, file_name, text_content,
+                                            extra_attributes=job.attributes('po_generated') if job else None,
+                                            streamed_items=streamed_items, purchase_order=purchase_order),
+        'pdf': lambda: generate_pdf_report(quotation_id, quotation, purchase_order, trace=trace),
+        'csv': lambda: generate_csv_report(quotation_id, quotation, purchase_order),
+        'json': lambda: generate_json_report(quotation_id, quotation, purchase_order)
+    }
+    sinks = get_artifact_sinks()
+    print(f"Writing artifacts: {', '.join(sinks)} (quotation {quotation_id})")
+    with trace.stage('artifacts'):
+        artifacts, artifact_errors = run_sinks({name: writers[name] for name in sinks}, trace=trace)
+    print(f"Artifacts written: {', '.join(artifacts) or 'none'}")
+    summary = generate_summary(quotation, purchase_order)
+    log_debug(lambda: f"Summary: {summary}")
+    # The quotation and the PO share one serialized item list
+    items_json = [item.to_json() for item in quotation.items]
+    
+    return {
+        'quotationId': quotation_id,
+        'extractedData': quotation.to_json(items_json),
+        'purchaseOrder': purchase_order.to_json(items_json),
+        'reports': {
+            'pdfUrl': artifacts.get('pdf'),
+            'csvUrl': artifacts.get('csv'),
+            'jsonUrl': artifacts.get('json')
+        },
+        'artifacts': {
+            'sinks': list(sinks),
+            'errors': artifact_errors
+        },
+        'summary': summary,
+        'cache': {
+            'hit': cache_tier,
+            'stats': get_cache_stats()
+        },
+        'extraction': {
+            'path': extraction_path,
+            'vendor': vendor,
+            'confidence': confidence,
+            'checks': rule_checks,
+            'routing': routing
+        },
+        'metrics': {
+            'extract_text': extraction_metrics,
+            'paths': get_path_metrics(),
+            'templates': get_template_stats(),
+            'tiers': get_tier_metrics(),
+            'flights': get_flight_stats(),
+            'bedrock': get_bedrock_metrics()
+        },
+        'timings': trace.to_dict()
+    }
+
+def process_s3_document(bucket_name, key, file_name, file_type, skip_cache=False, quotation_id=None, job=None, trace=None):
+    """Stream an uploaded object to /tmp and run the pipeline on the local copy
+
+    Every by-key path (single, batch and async) comes through here, so only
+    uploads under UPLOAD_PREFIX in the docs bucket can be read.
+    """
+    if bucket_name != get_docs_bucket():
+        raise ValueError("Documents can only be read from the docs bucket")
+    check_upload_key(key)
+    trace = trace or RequestTrace()
+    with trace.stage('s3_download'):
+        file_path, file_size, file_digest = download_to_tempfile(get_client('s3'), bucket_name, key)
+    print(f"Downloaded s3://{bucket_name}/{key} ({file_size} bytes)")
+    try:
+        return process_document(file_path, file_name, file_type, skip_cache=skip_cache,
+                                quotation_id=quotation_id, job=job, file_digest=file_digest, trace=trace)
+    finally:
+        os.remove(file_path)
+
+def submit_async_job(file_content, file_name, file_type, context, skip_cache=False, upload_key=None):
+    """Persist the upload, record a queued job and hand the pipeline to an async invocation
+
+    Documents already uploaded to DOCS_BUCKET are referenced by upload_key instead of re-uploaded.
+    """
+    quotation_id = str(uuid.uuid4())
+    bucket_name = get_docs_bucket()
+    
+    if upload_key is None:
+        upload_key = f"uploads/{quotation_id}/{os.path.basename(file_name)}"
+        get_client('s3').put_object(Bucket=bucket_name, Key=upload_key, Body=file_content, ContentType=file_type)
+    JobTracker(get_quotations_table(), quotation_id, file_name, upload_key).create()
+    
+    function_name = get_config().get('ASYNC_FUNCTION_NAME', os.environ.get('ASYNC_FUNCTION_NAME')) or context.function_name
+    get_client('lambda').invoke(
+        FunctionName=function_name,
+        InvocationType='Event',
+        Payload=json.dumps({'asyncJob': {
+            'quotationId': quotation_id,
+            'bucket': bucket_name,
+            's3Key': upload_key,
+            'fileName': file_name,
+            'fileType': file_type,
+            'skipCache': skip_cache
+        }})
+    )
+    print(f"Queued async job {quotation_id} ({upload_key})")
+    return {'quotationId': quotation_id, 'stage': 'queued'}
+
+def run_async_job(job_request):
+    """Run the full pipeline for a queued job, recording each stage"""
+    quotation_id = job_request['quotationId']
+    job = JobTracker(get_quotations_table(), quotation_id, job_request['fileName'], job_request['s3Key'])
+    trace = RequestTrace(quotation_id)
+    try:
+        response_data = process_s3_document(job_request['bucket'], job_request['s3Key'],
+                                            job_request['fileName'], job_request['fileType'],
+                                            skip_cache=job_request.get('skipCache', False),
+                                            quotation_id=quotation_id, job=job, trace=trace)
+        job.complete(response_data)
+        trace.emit(async_job=True, stage='report_ready')
+    except Exception as e:
+        print(f"Async job {quotation_id} failed: {e}")
+        job.fail(e)
+        trace.emit(async_job=True, stage='failed', error=str(e))
+
+def guess_file_type(file_name):
+    return FILE_TYPES_BY_EXTENSION.get(os.path.splitext(file_name)[1].lower(), 'application/pdf')
+
+def process_batch_entry(entry, skip_cache=False, context=None):
+    """Run one batch entry (base64 payload or S3 key); returns (file_name, response_data)
+
+    With a context the entry is queued as an async job instead and the
+    response is its quotationId (see submit_async_job).
+    """
+    mode = 'sync' if context is None else 'async'
+    if 'file' in entry:
+        file_name = entry.get('fileName') or 'unknown.pdf'
+        file_type = entry.get('fileType') or guess_file_type(file_name)
+        file_content = base64.b64decode(entry['file'])
+        file_digest = hashlib.sha256(file_content).hexdigest()
+        if context is not None:
+            run = lambda: submit_async_job(file_content, file_name, file_type, context, skip_cache=skip_cache)
+        else:
+            run = lambda: process_document(file_content, file_name, file_type, skip_cache=skip_cache, file_digest=file_digest)
+        return file_name, run_single_flight(file_digest, mode, None, skip_cache, None, run)
+    elif 's3Key' in entry:
+        bucket_name = get_docs_bucket()
+        upload_key = check_upload_key(entry['s3Key'])
+        file_name = entry.get('fileName') or os.path.basename(upload_key)
+        file_type = entry.get('fileType') or guess_file_type(file_name)
+        if context is not None:
+            run = lambda: submit_async_job(None, file_name, file_type, context, skip_cache=skip_cache, upload_key=upload_key)
+        else:
+            run = lambda: process_s3_document(bucket_name, upload_key, file_name, file_type, skip_cache=skip_cache)
+        return file_name, run_single_flight(f"s3://{bucket_name}/{upload_key}", mode, None, skip_cache, None, run)
+    else:
+        raise ValueError("Batch entry needs 'file' or 's3Key'")
+
+def process_batch(entries, context=None, skip_cache=False, run_async=False):
+    """Process many documents over a bounded worker pool, isolating per-document failures
+
+    Batches of more than BATCH_SYNC_MAX_DOCUMENTS, or with run_async, are
+    queued as one async job per document and answered with their
+    quotationIds ('async' in the response). A synchronous batch starts no
+    document after BATCH_TIME_BUDGET_SECONDS or within
+    BATCH_STOP_MARGIN_SECONDS of the function timeout; those are reported
+    as notStarted, so the caller always gets the results of the rest.
+    """
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("'files' must be a non-empty list")
+    if len(entries) > BATCH_MAX_DOCUMENTS:
+        raise ValueError(f"Batch too large: {len(entries)} documents (max {BATCH_MAX_DOCUMENTS})")
+    
+    run_async = context is not None and (run_async or len(entries) > BATCH_SYNC_MAX_DOCUMENTS)
+    max_workers = min(BATCH_MAX_WORKERS, len(entries))
+    batch_started = time.time()
+    deadline = batch_started + BATCH_TIME_BUDGET_SECONDS
+    if hasattr(context, 'get_remaining_time_in_millis'):
+        deadline = min(deadline, batch_started + context.get_remaining_time_in_millis() / 1000 - BATCH_STOP_MARGIN_SECONDS)
+    print(f"Processing batch of {len(entries)} documents with {max_workers} workers{' as async jobs' if run_async else ''}")
+    
+    def run(index, entry):
+        started = time.time()
+        result = {'index': index, 'fileName': entry.get('fileName') or entry.get('s3Key')}
+        if not run_async and started >= deadline:
+            result['status'] = 'notStarted'
+            return result
+        try:
+            result['fileName'], result['result'] = process_batch_entry(entry, skip_cache=skip_cache,
+                                                                       context=context if run_async else None)
+            result['status'] = 'queued' if run_async else 'succeeded'
+            if run_async:
+                result['quotationId'] = result['result']['quotationId']
+        except Exception as e:
+            print(f"Batch document {index} failed: {e}")
+            result['status'] = 'failed'
+            result['error'] = str(e)
+        result['seconds'] = round(time.time() - started, 3)
+        return result
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(run, range(len(entries)), entries))
+    wall_seconds = time.time() - batch_started
+    
+    durations = sorted(r['seconds'] for r in results if 'seconds' in r)
+    counts = {status: sum(1 for r in results if r['status'] == status) for status in ('succeeded', 'queued', 'failed', 'notStarted')}
+    stats = {
+        'documents': len(results),
+        'succeeded': counts['succeeded'],
+        'queued': counts['queued'],
+        'failed': counts['failed'],
+        'notStarted': counts['notStarted'],
+        'max_workers': max_workers,
+        'wall_seconds': round(wall_seconds, 3),
+        'documents_per_second': round(len(durations) / wall_seconds, 3) if wall_seconds > 0 else None,
+        'document_seconds': {
+            'min': durations[0],
+            'p50': durations[len(durations) // 2],
+            'p95': durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+            'max': durations[-1],
+            'sum': round(sum(durations), 3)
+        } if durations else None
+    }
+    print(f"Batch complete: {stats}")
+    return {'batch': True, 'async': run_async, 'results': results, 'stats': stats}
+
+def extract_text(file_content, file_type, metrics=None):
+    """Extract text from PDF or Word documents
+
+    file_content is the raw bytes or the path of a local copy. PDF pages are
+    separated by pdf_extractor.PAGE_SEPARATOR. If a metrics dict is passed it
+    is filled with per-page and total extraction timings.
+    """
+    try:
+        if file_type == 'application/pdf':
+            if not pdf_available():
+                return "PDF processing not available. Please install PyPDF2."
+            pages, page_metrics = extract_pdf_pages(file_content)
+            if metrics is not None:
+                metrics.update(page_metrics)
+            print(f"Extracted {page_metrics['pages']} pages ({page_metrics['chars']} chars) in {page_metrics['total_seconds']}s "
+                  f"using {page_metrics['workers']} {page_metrics['mode']} worker(s)")
+            for page_error in page_metrics['errors']:
+                print(f"Error on page {page_error['page']}: {page_error['error']}")
+            text = join_pages(pages)
             
             if not text.strip():
                 print("WARNING: No text extracted from PDF - trying alternative method")
                 # Try alternative extraction
                 try:
                     import fitz  # PyMuPDF alternative
-                    doc = fitz.open(stream=file_content, filetype="pdf")
-                    for page in doc:
-                        text += page.get_text()
+                    doc = fitz.open(stream=file_content, filetype="pdf") if isinstance(file_content, bytes) else fitz.open(file_content)
+                    text = join_pages([page.get_text() for page in doc])
                     doc.close()
                 except:
                     print("PyMuPDF not available, using basic extraction")
             return text if text.strip() else "Could not extract text from PDF"
         
-        elif file_type in ['application/vnd.openxmlformats-officedocument.wordprocessingml.document', 'application/msword']:
-            if not docx:
-                return "Word processing not available. Please install python-docx."
-            doc = Document(BytesIO(file_content))
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
+        elif file_type in [DOCX_TYPE, 'application/msword']:
+            text = extract_docx(file_content, metrics=metrics)
+            if metrics is not None:
+                print(f"Extracted {metrics['paragraphs']} paragraphs and {metrics['table_rows']} table rows "
+                      f"({metrics['chars']} chars) in {metrics['total_seconds']}s")
             return text if text.strip() else "Could not extract text from Word document"
         
         else:
@@ -196,27 +829,7 @@ def extract_text(file_content, file_type):
     except Exception as e:
         return f"Error extracting text: {str(e)}"
 
-def process_with_bedrock(text_content):
-    """Extract structured data from quotation text using fallback parsing"""
-    
-    print(f"Sending to Bedrock - text length: {len(text_content)}")
-    print(f"Text content: {text_content}")
-    
-    # Check if PDF extraction failed
-    if len(text_content.strip()) < 50:
-        print("WARNING: Very little text extracted from PDF")
-        # Continue with whatever text was extracted instead of replacing it
-    
-    # Use Bedrock in us-east-1 where Claude models are available
-    try:
-        bedrock_client_east1 = boto3.client('bedrock-runtime', region_name='us-east-1')
-        
-        # Use Claude 3.5 Sonnet with correct model ID
-        model_id = "anthropic.claude-3-5-sonnet-20240620-v1:0"
-        print(f"Calling Bedrock with model: {model_id}")
-        
-        # Improved prompt for better extraction
-        enhanced_prompt = f"""
+EXTRACTION_PROMPT = """
 You are a data extraction expert. Extract information from this quotation document and return ONLY a valid JSON object.
 
 Document text:
@@ -247,43 +860,188 @@ Extract these exact fields and return as JSON:
 
 Return ONLY the JSON object, no other text.
 """
-        
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 2000,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": enhanced_prompt
-                }
-            ]
-        }
-        
-        print(f"Request body: {json.dumps(request_body, indent=2)}")
-        
-        response = bedrock_client_east1.invoke_model(
-            modelId=model_id,
+
+def build_extraction_prompt(text_content):
+    return EXTRACTION_PROMPT.format(text_content=text_content)
+
+def build_request_body(prompt, max_tokens=None):
+    return {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens or BEDROCK_MAX_TOKENS,
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    }
+
+def invoke_bedrock_json(client, prompt, max_tokens=None, trace=None, model_id=None):
+    """Send one prompt to Bedrock and parse the JSON object in the reply
+
+    client is anything with boto3's invoke_model signature, normally the shared BedrockInvoker.
+    """
+    trace = trace or RequestTrace()
+    request_body = build_request_body(prompt, max_tokens)
+    
+    log_debug(lambda: f"Request body: {json.dumps(request_body, indent=2)}")
+    trace.count(prompt_chars=len(prompt))
+    
+    with trace.stage('bedrock_call'):
+        response = client.invoke_model(
+            modelId=model_id or BEDROCK_MODEL_ID,
             body=json.dumps(request_body)
         )
-        print(f"Bedrock response received successfully")
-        print(f"Response status: {response.get('ResponseMetadata', {}).get('HTTPStatusCode')}")
-        
-        response_body = json.loads(response['body'].read())
-        print(f"Response body: {json.dumps(response_body, indent=2)}")
+        raw_body = response['body'].read()
+    print(f"Bedrock response received, status: {response.get('ResponseMetadata', {}).get('HTTPStatusCode')}")
+    
+    with trace.stage('json_parse'):
+        response_body = json.loads(raw_body)
+        log_debug(lambda: f"Response body: {json.dumps(response_body, indent=2)}")
+        usage = response_body.get('usage') or {}
+        trace.count(input_tokens=usage.get('input_tokens'), output_tokens=usage.get('output_tokens'))
+        if response_body.get('stop_reason') == 'max_tokens':
+            print(f"WARNING: Bedrock output truncated at max_tokens={request_body['max_tokens']}")
         extracted_text = response_body['content'][0]['text']
-        print(f"Extracted text from Bedrock: {extracted_text}")
+        log_debug(lambda: f"Extracted text from Bedrock: {extracted_text}")
         
         # Parse JSON from response
         start_idx = extracted_text.find('{')
         end_idx = extracted_text.rfind('}') + 1
-        if start_idx >= 0 and end_idx > start_idx:
-            json_str = extracted_text[start_idx:end_idx]
-            result = json.loads(json_str)
-            print(f"Bedrock extracted: {result}")
-            return result
+        if start_idx < 0 or end_idx <= start_idx:
+            raise ValueError("No JSON in Bedrock response")
+        return json.loads(extracted_text[start_idx:end_idx])
+
+def invoke_bedrock_json_stream(client, prompt, on_field=None, on_item=None, max_tokens=None, trace=None, model_id=None):
+    """Streaming variant of invoke_bedrock_json
+
+    The reply is parsed while it is generated: on_field(name, value) fires for
+    each header field and on_item(item) for each line item as soon as it is
+    complete. Returns the whole parsed object like invoke_bedrock_json.
+    """
+    trace = trace or RequestTrace()
+    request_body = build_request_body(prompt, max_tokens)
+    log_debug(lambda: f"Request body: {json.dumps(request_body, indent=2)}")
+    trace.count(prompt_chars=len(prompt))
+    
+    parser = IncrementalJSONParser(on_field=on_field, on_item=on_item)
+    usage = {}
+    started = time.perf_counter()
+    first_token = None
+    with trace.stage('bedrock_call'):
+        response = client.invoke_model_with_response_stream(
+            modelId=model_id or BEDROCK_MODEL_ID,
+            body=json.dumps(request_body)
+        )
+        for text in iter_text_deltas(response, usage):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+                trace.record('bedrock_first_token', first_token)
+            parser.feed(text)
+    print(f"Bedrock stream finished: {parser.items} items, first token after {(first_token or 0) * 1000:.0f} ms")
+    trace.count(input_tokens=usage.get('input_tokens'), output_tokens=usage.get('output_tokens'))
+    if usage.get('stop_reason') == 'max_tokens':
+        print(f"WARNING: Bedrock output truncated at max_tokens={request_body['max_tokens']}")
+    return parser.close()
+
+class StreamedExtraction:
+    """Overlaps storage with generation for a streamed model extraction
+
+    Line items are written to the items table as the model completes them,
+    and an async job's record gets a preview of the header fields as soon as
+    they are known.
+    """
+
+    def __init__(self, quotation_id, job=None):
+        self.writer = StreamingItemWriter(get_items_table(), quotation_id)
+        self.job = job
+        self.header = {}
+        self.items = []
+        self._preview = None
+
+    def on_field(self, name, value):
+        self.header[name] = value
+
+    def on_item(self, item):
+        # Header fields precede the items in the reply, so they are complete by now
+        if self.job and self._preview is None:
+            preview = {field: str(self.header.get(field) or '') for field in PREVIEW_FIELDS}
+            self._preview = threading.Thread(target=self._write_preview, args=(preview,), daemon=True)
+            self._preview.start()
+        line_item = LineItem.from_dict(item)
+        self.items.append(line_item)
+        self.writer.add(line_item.to_item())
+
+    def _write_preview(self, preview):
+        try:
+            self.job.set_stage('extracting', extraction_preview=preview)
+        except Exception as e:
+            print(f"Extraction preview not written: {e}")
+
+    def finish(self):
+        """LineItems already stored, or None if store_quotation has to write them"""
+        if self._preview:
+            self._preview.join()
+        try:
+            self.writer.finish()
+            return self.items
+        except Exception as e:
+            print(f"Streamed item writes failed: {e}")
+            return None
+
+def process_with_bedrock(text_content, return_source=False, trace=None, stream=None, model_id=None):
+    """Extract structured data from quotation text using fallback parsing
+
+    Long documents are split into chunks that are extracted concurrently and
+    merged. With return_source=True returns (data, from_model) where from_model
+    is True only for a complete model extraction (not parse_fallback, and no
+    failed chunks). Unless PROMPT_COMPACTION is off the text is compacted
+    first; parse_fallback still sees the full text. A single-call extraction
+    is streamed into stream (a StreamedExtraction) when one is passed.
+    """
+    trace = trace or RequestTrace()
+    print(f"Sending to Bedrock - text length: {len(text_content)}")
+    log_debug(lambda: f"Text content: {text_content}")
+    
+    # Check if PDF extraction failed
+    if len(text_content.strip()) < 50:
+        print("WARNING: Very little text extracted from PDF")
+        # Continue with whatever text was extracted instead of replacing it
+    
+    # Use Bedrock in us-east-1 where Claude models are available
+    try:
+        # Shared pooled client; throttling is retried with backoff and shrinks the concurrency window
+        bedrock = get_bedrock_invoker()
+        model_id = model_id or BEDROCK_MODEL_ID
+        print(f"Calling Bedrock with model: {model_id}")
+        
+        # Repeated page furniture and boilerplate cost input tokens without adding fields
+        prompt_text = text_content
+        if PROMPT_COMPACTION:
+            with trace.stage('prompt_compaction'):
+                prompt_text, compaction = compact_text(text_content)
+            trace.count(prompt_tokens_before=compaction['tokens_before'], prompt_tokens_after=compaction['tokens_after'])
+            print(f"Prompt compaction: ~{compaction['tokens_before']} -> ~{compaction['tokens_after']} tokens {compaction}")
+        
+        if should_chunk(prompt_text):
+            result, complete, chunk_metrics = extract_chunked(
+                prompt_text,
+                lambda prompt: invoke_bedrock_json(bedrock, prompt, trace=trace, model_id=model_id),
+                build_extraction_prompt
+            )
+            print(f"Chunked extraction metrics: {chunk_metrics}")
+            if result is None:
+                raise ValueError("First chunk extraction failed")
+        elif stream:
+            result = invoke_bedrock_json_stream(bedrock, build_extraction_prompt(prompt_text),
+                                                on_field=stream.on_field, on_item=stream.on_item, trace=trace, model_id=model_id)
+            complete = True
         else:
-            print("No JSON in Bedrock response, using fallback")
-            return parse_fallback(text_content)
+            result = invoke_bedrock_json(bedrock, build_extraction_prompt(prompt_text), trace=trace, model_id=model_id)
+            complete = True
+        
+        log_debug(lambda: f"Bedrock extracted: {result}")
+        return (result, complete) if return_source else result
             
     except Exception as e:
         print(f"Bedrock error type: {type(e).__name__}")
@@ -291,10 +1049,58 @@ Return ONLY the JSON object, no other text.
         import traceback
         print(f"Bedrock error traceback: {traceback.format_exc()}")
         print("Using fallback parsing...")
-        return parse_fallback(text_content)
+        result = parse_fallback(text_content)
+        return (result, False) if return_source else result
+
+def _run_tier(tier, text_content, trace, stream=None):
+    """process_with_bedrock on one tier; returns (data, from_model, usage) for record_tier"""
+    tokens_before = (trace.counters.get('input_tokens', 0), trace.counters.get('output_tokens', 0))
+    started = time.perf_counter()
+    data, from_model = process_with_bedrock(text_content, return_source=True, trace=trace, stream=stream,
+                                            model_id=MODEL_TIERS[tier])
+    usage = {
+        'seconds': time.perf_counter() - started,
+        'input_tokens': trace.counters.get('input_tokens', 0) - tokens_before[0],
+        'output_tokens': trace.counters.get('output_tokens', 0) - tokens_before[1]
+    }
+    return data, from_model, usage
+
+def extract_with_model(text_content, rule_confidence, quotation_id, job=None, trace=None):
+    """Send a document to the model tier its features call for
+
+    Simple documents go to the fast tier first. If the result fails
+    validation, the document is escalated to the accurate tier. Only the
+    accurate tier is streamed, since a fast result may be discarded.
+    Returns (data, from_model, streamed_items, routing).
+    """
+    trace = trace or RequestTrace()
+    features = document_features(text_content, rule_confidence)
+    tier, reasons = choose_tier(features)
+    routing = {'tier': tier, 'reasons': reasons, 'features': features, 'escalated': False}
+    print(f"Model tier: {tier} {features} {reasons}")
+    
+    if tier == 'fast':
+        data, from_model, usage = _run_tier('fast', text_content, trace)
+        valid, checks = validate_extraction(data, features) if from_model else (False, None)
+        record_tier('fast', usage['seconds'], usage['input_tokens'], usage['output_tokens'], escalated=not valid)
+        routing['validation'] = checks
+        if valid:
+            return data, from_model, None, routing
+        print(f"Fast tier result failed validation, escalating: {checks}")
+        routing.update(tier='accurate', escalated=True)
+    
+    stream = StreamedExtraction(quotation_id, job) if BEDROCK_STREAMING else None
+    data, from_model, usage = _run_tier('accurate', text_content, trace, stream)
+    record_tier('accurate', usage['seconds'], usage['input_tokens'], usage['output_tokens'])
+    streamed_items = None
+    if stream:
+        with trace.stage('stream_finish'):
+            streamed_items = stream.finish()
+    return data, from_model, streamed_items, routing
 
 def unused_bedrock_code():
     bedrock_agent_client = boto3.client('bedrock-agent')
+    bedrock_client = get_client('bedrock-runtime')
     
     try:
         # Get the managed prompt
@@ -429,84 +1235,72 @@ def parse_fallback(text):
         "total": 0
     }
 
-def store_quotation(quotation_id, extracted_data, file_name, raw_text=""):
-    """Store extracted quotation data in DynamoDB"""
-    table = dynamodb.Table(config.get('DYNAMODB_TABLE', os.environ.get('DYNAMODB_TABLE', 'quotation-processor-quotations')))
-    
-    def safe_decimal(value):
-        try:
-            return Decimal(str(value)) if value is not None else Decimal('0')
-        except:
-            return Decimal('0')
-    
-    # Deep copy items to avoid modifying original
-    items = []
-    for item in extracted_data.get('items', []):
-        item_copy = {
-            'description': item.get('description', ''),
-            'quantity': safe_decimal(item.get('quantity')),
-            'unit_price': safe_decimal(item.get('unit_price')),
-            'total_amount': safe_decimal(item.get('total_amount'))
-        }
-        items.append(item_copy)
+def detect_currency(raw_text):
+    """SGD when the document text quotes Singapore dollars, otherwise USD"""
+    return 'SGD' if SGD_PATTERN.search(raw_text or '') else 'USD'
+
+def store_quotation(quotation_id, quotation, file_name, raw_text="", extra_attributes=None, streamed_items=None,
+                    purchase_order=None):
+    """Store extracted quotation data in DynamoDB
+
+    Line items go to the items table and the full text to S3 first; the
+    compact header record is written last, so a readable header always has
+    its items and text in place. Items already written while the model
+    streamed (streamed_items) are not written again if they are unchanged.
+    The purchase order's number, date and status are kept on the header.
+    """
+    table = get_quotations_table()
     
-    # Calculate total if missing
-    subtotal = safe_decimal(extracted_data.get('subtotal'))
-    tax = safe_decimal(extracted_data.get('tax'))
-    total = safe_decimal(extracted_data.get('total'))
-    if total == Decimal('0') and subtotal > Decimal('0'):
-        total = subtotal + tax
+    items = quotation.items
+    if streamed_items != items:
+        put_line_items(get_items_table(), quotation_id, [line_item.to_item() for line_item in items])
+    text_key = put_raw_text(get_client('s3'), get_docs_bucket(), quotation_id, raw_text)
+    processed_at = datetime.utcnow().isoformat()
     
     item = {
         'quotation_id': quotation_id,
-        'company_name': extracted_data.get('company_name') or 'Unknown',
-        'email': extracted_data.get('email') or '',
-        'phone': extracted_data.get('phone') or '',
-        'address': extracted_data.get('address') or '',
-        'buyer_name': extracted_data.get('buyer_name') or '',
-        'buyer_address': extracted_data.get('buyer_address') or '',
-        'quote_number': extracted_data.get('quote_number') or '',
-        'date': extracted_data.get('date') or '',
-        'items': items,
-        'subtotal': subtotal,
-        'tax': tax,
-        'total': total,
+        'company_name': quotation.company_name or 'Unknown',
+        'email': quotation.email,
+        'phone': quotation.phone,
+        'address': quotation.address,
+        'buyer_name': quotation.buyer_name,
+        'buyer_address': quotation.buyer_address,
+        'quote_number': quotation.quote_number or None,
+        'date': quotation.date,
+        'items_count': len(items),
+        'subtotal': quotation.subtotal,
+        'tax': quotation.tax,
+        'total': quotation.grand_total,
         'original_file': file_name,
-        'processed_at': datetime.utcnow().isoformat(),
+        'processed_at': processed_at,
+        'processed_month': processed_month(processed_at),
         'status': 'processed',
+        # Preview only; the complete text is at raw_text_key
         'raw_text': raw_text[:1000],
+        'raw_text_key': text_key,
         'extraction_metadata': {
             'items_count': len(items),
-            'has_tax': tax > Decimal('0'),
-            'currency_detected': 'SGD' if 'SGD' in str(extracted_data) else 'USD',
+            'has_tax': quotation.tax > 0,
+            'currency_detected': detect_currency(raw_text),
             'text_length': len(raw_text)
         }
     }
     
+    if purchase_order is not None:
+        item.update({
+            'po_number': purchase_order.po_number,
+            'po_date': purchase_order.po_date,
+            'po_status': purchase_order.status
+        })
+    if extra_attributes:
+        item.update(extra_attributes)
+    # Index key attributes may not be empty strings, so leave a missing quote number out
+    if item['quote_number'] is None:
+        del item['quote_number']
+    
     table.put_item(Item=item)
+    invalidate_query_cache()
 
-def generate_purchase_order(extracted_data):
+def generate_purchase_order(quotation):
     """Generate purchase order from extracted quotation data"""
-    po_number = f"PO-{datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8]}"
-    
-    # Calculate total if not provided
-    subtotal = extracted_data.get('subtotal', 0) or 0
-    tax = extracted_data.get('tax', 0) or 0
-    total = extracted_data.get('total') or (subtotal + tax)
-    
-    purchase_order = {
-        "po_number": po_number,
-        "vendor": extracted_data.get('company_name'),
-        "vendor_email": extracted_data.get('email'),
-        "vendor_phone": extracted_data.get('phone'),
-        "vendor_address": extracted_data.get('address'),
-        "quote_reference": extracted_data.get('quote_number'),
-        "po_date": datetime.now().strftime('%Y-%m-%d'),
-        "items": extracted_data.get('items', []),
-        "subtotal": subtotal,
-        "tax": tax,
-        "total": total,
-        "status": "pending_approval"
-    }
-    
-    return purchase_order
\ No newline at end of file
+    return PurchaseOrder.for_quotation(quotation)
\ No newline at end of file
@@ -0,0 +1,188 @@
+import io
+import re
+import time
+import zipfile
+from xml.etree.ElementTree import XMLParser, iterparse
+
+DOCX_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+READ_CHUNK_BYTES = 64 * 1024
+
+_WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_PACKAGE_RELS_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+# Text boxes are stored twice (DrawingML and a VML fallback); only the first copy is read
+_FALLBACK_TAG = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+_OFFICE_DOCUMENT = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+_PARAGRAPH = f'{_WORD_NS}p'
+_RUN = f'{_WORD_NS}r'
+_TEXT = f'{_WORD_NS}t'
+_TABLE = f'{_WORD_NS}tbl'
+_ROW = f'{_WORD_NS}tr'
+_CELL = f'{_WORD_NS}tc'
+_GRID_SPAN = f'{_WORD_NS}gridSpan'
+_VAL = f'{_WORD_NS}val'
+_TEXT_BREAKS = {f'{_WORD_NS}tab': '\t', f'{_WORD_NS}br': '\n', f'{_WORD_NS}cr': '\n'}
+
+_SPACES = re.compile(r'\s+')
+
+def _document_path(archive):
+    try:
+        with archive.open('_rels/.rels') as rels:
+            for _, element in iterparse(rels):
+                if element.tag == f'{_PACKAGE_RELS_NS}Relationship' and element.get('Type') == _OFFICE_DOCUMENT:
+                    return element.get('Target').lstrip('/')
+    except KeyError:
+        pass
+    return 'word/document.xml'
+
+class _BlockReader:
+    """XMLParser target that turns WordprocessingML into paragraph and table row blocks
+
+    expat calls start/data/end as the XML is fed; no element tree is built,
+    only the text of the block being read is held.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.parts = []
+        self.cells = []
+        self.paragraph_depth = 0
+        self.table_depth = 0
+        self.run_depth = 0
+        self.fallback_depth = 0
+        self.in_text = False
+        self.span = 1
+
+    def start(self, tag, attrib):
+        if tag == _RUN:
+            self.run_depth += 1
+        elif tag == _FALLBACK_TAG:
+            self.fallback_depth += 1
+        elif self.fallback_depth:
+            return
+        elif self.run_depth:
+            # Tab stops in paragraph properties are also w:tab; only those in runs are text
+            if tag == _TEXT:
+                self.in_text = True
+            elif tag in _TEXT_BREAKS:
+                self.parts.append(_TEXT_BREAKS[tag])
+        elif tag == _PARAGRAPH:
+            self.paragraph_depth += 1
+        elif tag == _TABLE:
+            self.table_depth += 1
+        elif tag == _GRID_SPAN and self.table_depth == 1:
+            self.span = int(attrib.get(_VAL, '1'))
+
+    def data(self, text):
+        if self.in_text:
+            self.parts.append(text)
+
+    def end(self, tag):
+        if tag == _TEXT:
+            self.in_text = False
+        elif tag == _RUN:
+            self.run_depth -= 1
+        elif tag == _FALLBACK_TAG:
+            self.fallback_depth -= 1
+        elif self.fallback_depth:
+            return
+        elif self.run_depth:
+            # A text box paragraph inside a run
+            if tag == _PARAGRAPH:
+                self.parts.append('\n')
+        elif tag == _PARAGRAPH:
+            self.paragraph_depth -= 1
+            # Paragraphs inside tables and text boxes are part of their cell or outer paragraph
+            if self.paragraph_depth or self.table_depth:
+                self.parts.append('\n')
+                return
+            self.blocks.append(('paragraph', ''.join(self.parts).strip()))
+            self.parts = []
+        elif self.table_depth != 1:
+            if tag == _TABLE:
+                self.table_depth -= 1
+        elif tag == _CELL:
+            # Whitespace collapsed so each row stays on one line
+            self.cells.append(_SPACES.sub(' ', ''.join(self.parts)).strip())
+            # Horizontally merged cells keep the following columns aligned with the header
+            self.cells.extend([''] * (self.span - 1))
+            self.parts = []
+            self.span = 1
+        elif tag == _ROW:
+            self.blocks.append(('row', self.cells))
+            self.cells = []
+        elif tag == _TABLE:
+            self.table_depth = 0
+            self.blocks.append(('table_end', None))
+
+    def close(self):
+        pass
+
+def _iter_part_blocks(source):
+    reader = _BlockReader()
+    parser = XMLParser(target=reader)
+    while True:
+        chunk = source.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        parser.feed(chunk)
+        # Blocks are handed on as soon as they are complete, so memory stays flat
+        yield from reader.blocks
+        reader.blocks = []
+    parser.close()
+    yield from reader.blocks
+
+def iter_docx_blocks(file_content, headers=True):
+    """Paragraphs and tables of a .docx (bytes or a local path) in document order
+
+    Yields ('paragraph', text), ('row', [cell, ...]) for each table row and
+    ('table_end', None) after the last row of each table. The document XML
+    is fed to the parser in chunks and only the block being read is held,
+    so memory stays flat however long the document is. Page header text, where
+    suppliers usually put their name and address, comes first when headers
+    is true.
+    """
+    with zipfile.ZipFile(io.BytesIO(file_content) if isinstance(file_content, bytes) else file_content) as archive:
+        parts = []
+        if headers:
+            parts.extend(sorted(name for name in archive.namelist() if re.match(r'word/header\d*\.xml$', name)))
+        parts.append(_document_path(archive))
+        for part in parts:
+            with archive.open(part) as source:
+                yield from _iter_part_blocks(source)
+
+def iter_docx_rows(file_content):
+    """Rows for the table mapping: a paragraph is a one-cell row, [] marks the end of a table"""
+    for kind, value in iter_docx_blocks(file_content):
+        if kind == 'paragraph':
+            yield [value]
+        elif kind == 'row':
+            yield value
+        else:
+            yield []
+
+def extract_docx(file_content, metrics=None):
+    """Text of a .docx with table rows as "a | b | c" lines, the item layout rule_extractor reads
+
+    Unlike python-docx paragraphs, this keeps item tables (where the prices
+    are) in the text. If a metrics dict is passed it is filled with block
+    counts and the extraction time.
+    """
+    started = time.perf_counter()
+    lines = []
+    counts = {'paragraphs': 0, 'tables': 0, 'table_rows': 0}
+    for kind, value in iter_docx_blocks(file_content):
+        if kind == 'paragraph':
+            counts['paragraphs'] += 1
+            if value:
+                lines.append(value)
+        elif kind == 'row':
+            counts['table_rows'] += 1
+            cells = [cell for cell in value if cell]
+            if cells:
+                lines.append(' | '.join(cells))
+        else:
+            counts['tables'] += 1
+    text = '\n'.join(lines) + '\n'
+    if metrics is not None:
+        metrics.update(counts, chars=len(text), total_seconds=round(time.perf_counter() - started, 4))
+    return text
@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import zlib
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+# In-process tier survives warm Lambda invocations; the DynamoDB tier is shared
+CACHE_TTL_SECONDS = int(os.environ.get('CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '256'))
+# Stay well below the 400KB DynamoDB item limit
+MAX_PERSISTED_BYTES = 350000
+
+_memory_cache = OrderedDict()
+_lock = threading.Lock()
+
+cache_stats = {
+    'memory_hits': 0,
+    'persistent_hits': 0,
+    'misses': 0,
+    'stores': 0,
+    'evictions': 0,
+    'errors': 0
+}
+
+def make_cache_key(file_content, model_id, prompt_version, digest=None):
+    """Content-address a document by its bytes plus the prompt/model that extracted it
+
+    Pass a precomputed sha256 digest when the bytes were hashed while streaming.
+    """
+    digest = digest or hashlib.sha256(file_content).hexdigest()
+    return f"{prompt_version}#{model_id}#{digest}"
+
+def get_cached_extraction(cache_key, table=None):
+    """Return (entry, tier) for a cached extraction, or (None, None) on a miss"""
+    now = time.time()
+    with _lock:
+        entry = _memory_cache.get(cache_key)
+        if entry is not None:
+            if entry['expires_at'] > now:
+                _memory_cache.move_to_end(cache_key)
+                cache_stats['memory_hits'] += 1
+                return copy.deepcopy(entry['value']), 'memory'
+            del _memory_cache[cache_key]
+            cache_stats['evictions'] += 1
+
+    if table is not None:
+        try:
+            response = table.get_item(Key={'cache_key': cache_key})
+            record = response.get('Item')
+            # DynamoDB TTL deletion is lazy, so check expiry ourselves
+            if record and int(record.get('expires_at', 0)) > now:
+                value = json.loads(zlib.decompress(bytes(record['payload'])).decode('utf-8'))
+                _remember(cache_key, value, int(record['expires_at']))
+                with _lock:
+                    cache_stats['persistent_hits'] += 1
+                return value, 'dynamodb'
+        except Exception as e:
+            with _lock:
+                cache_stats['errors'] += 1
+            print(f"Extraction cache read error: {e}")
+
+    with _lock:
+        cache_stats['misses'] += 1
+    return None, None
+
+def put_cached_extraction(cache_key, value, table=None):
+    """Store an extraction result in both cache tiers"""
+    expires_at = int(time.time()) + CACHE_TTL_SECONDS
+    _remember(cache_key, copy.deepcopy(value), expires_at)
+    with _lock:
+        cache_stats['stores'] += 1
+
+    if table is None:
+        return
+    try:
+        payload = zlib.compress(json.dumps(value, default=str).encode('utf-8'))
+        if len(payload) > MAX_PERSISTED_BYTES:
+            print(f"Extraction cache entry too large to persist ({len(payload)} bytes)")
+            return
+        table.put_item(Item={
+            'cache_key': cache_key,
+            'payload': payload,
+            'created_at': int(time.time()),
+            'expires_at': expires_at
+        })
+    except Exception as e:
+        with _lock:
+            cache_stats['errors'] += 1
+        print(f"Extraction cache write error: {e}")
+
+def _remember(cache_key, value, expires_at):
+    with _lock:
+        _memory_cache[cache_key] = {'value': value, 'expires_at': expires_at}
+        _memory_cache.move_to_end(cache_key)
+        while len(_memory_cache) > CACHE_MAX_ENTRIES:
+            _memory_cache.popitem(last=False)
+            cache_stats['evictions'] += 1
+
+def get_cache_stats():
+    """Snapshot of cache counters for this container"""
+    with _lock:
+        stats = dict(cache_stats)
+        stats['memory_entries'] = len(_memory_cache)
+    lookups = stats['memory_hits'] + stats['persistent_hits'] + stats['misses']
+    stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 4) if lookups else 0.0
+    return stats
@@ -0,0 +1,109 @@
+import os
+import threading
+
+from pdf_extractor import PAGE_SEPARATOR
+from rule_extractor import MONEY_PATTERN, TOTALS_LABEL_PATTERN, ROUNDING_PER_ITEM, AMOUNT_TOLERANCE
+
+# Simple quotations go to the fast tier; its output is validated and escalated when it fails
+MODEL_ROUTING = os.environ.get('MODEL_ROUTING', 'on').lower() not in ('0', 'off', 'false', 'no')
+FAST_MODEL_ID = os.environ.get('BEDROCK_FAST_MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0')
+ACCURATE_MODEL_ID = os.environ.get('BEDROCK_ACCURATE_MODEL_ID', 'anthropic.claude-3-5-sonnet-20240620-v1:0')
+MODEL_TIERS = {'fast': FAST_MODEL_ID, 'accurate': ACCURATE_MODEL_ID}
+
+# A document must stay within every limit to be sent to the fast tier
+FAST_MAX_CHARS = int(os.environ.get('FAST_MAX_CHARS', '12000'))
+FAST_MAX_PAGES = int(os.environ.get('FAST_MAX_PAGES', '5'))
+FAST_MAX_ITEMS = int(os.environ.get('FAST_MAX_ITEMS', '40'))
+# Rule pre-parse confidence below this means an irregular layout
+FAST_MIN_RULE_CONFIDENCE = float(os.environ.get('FAST_MIN_RULE_CONFIDENCE', '0.3'))
+# The fast tier fails validation if it returns fewer items than this share of priced lines
+MIN_ITEM_RECALL = 0.9
+
+_tier_stats = {}
+_stats_lock = threading.Lock()
+
+def model_signature():
+    """Models that may produce an extraction; part of the extraction cache key"""
+    return f"{FAST_MODEL_ID}>{ACCURATE_MODEL_ID}" if MODEL_ROUTING else ACCURATE_MODEL_ID
+
+def document_features(text, rule_confidence=None):
+    """Cheap features of the extracted text used to pick a tier"""
+    return {
+        'chars': len(text),
+        'pages': text.count(PAGE_SEPARATOR) + 1,
+        # Item rows carry a unit price and an amount; totals lines are labelled
+        'estimated_items': sum(1 for line in text.splitlines()
+                               if len(MONEY_PATTERN.findall(line)) >= 2 and not TOTALS_LABEL_PATTERN.search(line)),
+        'rule_confidence': rule_confidence or 0.0
+    }
+
+def choose_tier(features):
+    """Returns (tier, reasons); reasons name the limits that kept a document off the fast tier"""
+    if not MODEL_ROUTING:
+        return 'accurate', ['routing disabled']
+    reasons = []
+    if features['chars'] > FAST_MAX_CHARS:
+        reasons.append('chars')
+    if features['pages'] > FAST_MAX_PAGES:
+        reasons.append('pages')
+    if features['estimated_items'] > FAST_MAX_ITEMS:
+        reasons.append('estimated_items')
+    if features['rule_confidence'] < FAST_MIN_RULE_CONFIDENCE:
+        reasons.append('rule_confidence')
+    return ('accurate' if reasons else 'fast'), reasons
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def validate_extraction(data, features):
+    """Returns (valid, checks) for a model extraction
+
+    Valid means items were returned, each quantity x unit price matches its
+    amount, the items add up to the subtotal, subtotal + tax matches the
+    total, and no large share of the document's priced lines is missing.
+    """
+    items = data.get('items') or []
+    checks = {'items': len(items)}
+    if not items:
+        return False, checks
+    amounts = [(_number(item.get('quantity')), _number(item.get('unit_price')), _number(item.get('total_amount'))) for item in items]
+    checks['items_consistent'] = all(
+        None not in row and abs(row[0] * row[1] - row[2]) <= max(0.01, AMOUNT_TOLERANCE * abs(row[2])) for row in amounts
+    )
+    items_sum = sum(row[2] or 0 for row in amounts)
+    subtotal, tax, total = _number(data.get('subtotal')), _number(data.get('tax')) or 0, _number(data.get('total'))
+    checks['subtotal_matches'] = subtotal is None or abs(items_sum - subtotal) <= max(0.01, ROUNDING_PER_ITEM * len(items))
+    checks['total_matches'] = not total or abs((subtotal if subtotal is not None else items_sum) + tax - total) <= max(0.01, AMOUNT_TOLERANCE * total)
+    checks['items_recalled'] = len(items) >= MIN_ITEM_RECALL * features['estimated_items']
+    return all(checks[name] for name in ('items_consistent', 'subtotal_matches', 'total_matches', 'items_recalled')), checks
+
+def record_tier(tier, seconds, input_tokens=0, output_tokens=0, escalated=False):
+    with _stats_lock:
+        stats = _tier_stats.setdefault(tier, {'calls': 0, 'escalations': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                              'input_tokens': 0, 'output_tokens': 0})
+        stats['calls'] += 1
+        stats['escalations'] += int(escalated)
+        stats['total_ms'] += seconds * 1000
+        stats['max_ms'] = max(stats['max_ms'], seconds * 1000)
+        stats['input_tokens'] += input_tokens or 0
+        stats['output_tokens'] += output_tokens or 0
+
+def get_tier_metrics():
+    """Per-tier calls, latency, token spend and escalation rate for this container"""
+    with _stats_lock:
+        return {
+            tier: {
+                'model': MODEL_TIERS[tier],
+                'calls': stats['calls'],
+                'avg_ms': round(stats['total_ms'] / stats['calls'], 2),
+                'max_ms': round(stats['max_ms'], 2),
+                'input_tokens': stats['input_tokens'],
+                'output_tokens': stats['output_tokens'],
+                'escalations': stats['escalations'],
+                'escalation_rate': round(stats['escalations'] / stats['calls'], 3)
+            }
+            for tier, stats in _tier_stats.items()
+        }
@@ -0,0 +1,192 @@
+import os
+import re
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from quotation_store import get_all_line_items
+
+# Competing quotations for one purchase are compared item by item; each quotation is one row
+MAX_COMPARE_QUOTATIONS = int(os.environ.get('MAX_COMPARE_QUOTATIONS', '500'))
+COMPARE_LOAD_WORKERS = int(os.environ.get('COMPARE_LOAD_WORKERS', '8'))
+# Items returned in the response, largest price spread first; the totals always cover every item
+COMPARE_ITEM_LIMIT = int(os.environ.get('COMPARE_ITEM_LIMIT', '200'))
+
+# Words that differ between suppliers' descriptions of the same product
+MATCH_STOPWORDS = frozenset((
+    'a', 'an', 'and', 'the', 'of', 'for', 'with', 'to', 'in', 'x', 'qty',
+    'pc', 'pcs', 'pce', 'piece', 'pieces', 'unit', 'units', 'ea', 'each', 'no', 'nos', 'set', 'sets', 'pkt', 'pack'
+))
+_TOKEN = re.compile(r'[a-z0-9]+(?:\.[0-9]+)?')
+
+def _singular(token):
+    return token[:-1] if len(token) > 3 and token.endswith('s') and not token.endswith('ss') else token
+
+@lru_cache(maxsize=65536)
+def match_key(description):
+    """Item description -> key shared by the same product across suppliers
+
+    Lowercased word tokens without filler words, plurals folded, sorted so
+    word order does not matter: "Pens, ballpoint (blue) x 10 pcs" and
+    "10 blue ballpoint pen" both become "10 ballpoint blue pen".
+    """
+    return ' '.join(sorted({_singular(token) for token in _TOKEN.findall(description.lower()) if token not in MATCH_STOPWORDS}))
+
+def load_quotations(quotations_table, items_table, quotation_ids, workers=None):
+    """Headers and line items of stored quotations, in the order given; unknown IDs raise ValueError"""
+    quotation_ids = list(dict.fromkeys(quotation_ids))
+    if not 2 <= len(quotation_ids) <= MAX_COMPARE_QUOTATIONS:
+        raise ValueError(f"Between 2 and {MAX_COMPARE_QUOTATIONS} quotationIds are required")
+
+    def load(quotation_id):
+        header = quotations_table.get_item(
+            Key={'quotation_id': quotation_id},
+            ProjectionExpression='quotation_id, company_name, quote_number, #d, items_count',
+            ExpressionAttributeNames={'#d': 'date'}
+        ).get('Item')
+        if header is None:
+            return None
+        header['items'] = get_all_line_items(items_table, quotation_id, header.get('items_count'))
+        return header
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers or COMPARE_LOAD_WORKERS, len(quotation_ids)))) as pool:
+        quotations = list(pool.map(load, quotation_ids))
+    missing = [quotation_id for quotation_id, quotation in zip(quotation_ids, quotations) if quotation is None]
+    if missing:
+        raise ValueError(f"Unknown quotationIds: {', '.join(missing[:10])}")
+    return quotations
+
+def _numbers(lines, name):
+    # float() per value is the fastest way from DynamoDB Decimals to an array
+    return np.fromiter(map(float, [item.get(name) or 0 for item in lines]), dtype=float, count=len(lines))
+
+def _money(value):
+    return round(float(value), 2)
+
+def compare_quotations(quotations, item_limit=None):
+    """Cheapest vendor per item, the best split award and its savings over a single vendor
+
+    quotations are dicts with quotation_id, company_name and items (the
+    stored line items). Items are matched across quotations by match_key
+    and laid out as a quotation x item matrix of unit prices; lines of one
+    item in the same quotation are combined at their average price, and
+    lines without a price are left out, as are items no quotation priced. Each item is priced at the largest
+    quantity any vendor quoted. Everything after building the matrix is
+    a whole-array NumPy operation.
+    """
+    started = time.perf_counter()
+    lines = [item for quotation in quotations for item in quotation.get('items') or []]
+    rows = np.repeat(np.arange(len(quotations)), [len(quotation.get('items') or []) for quotation in quotations])
+    texts = [str(item.get('description') or '') for item in lines]
+    # Each distinct wording is normalised once; its column is that of its match key
+    keys = {}
+    descriptions = []
+    text_columns = {}
+    for text in dict.fromkeys(texts):
+        key = match_key(text)
+        column = keys.get(key)
+        if column is None and key:
+            column = keys[key] = len(descriptions)
+            descriptions.append((key, text))
+        text_columns[text] = -1 if column is None else column
+    columns = np.fromiter(map(text_columns.__getitem__, texts), dtype=np.int64, count=len(texts))
+    quantities = _numbers(lines, 'quantity')
+    amounts = _numbers(lines, 'total_amount')
+    unpriced = np.flatnonzero(amounts <= 0)
+    if len(unpriced):
+        amounts[unpriced] = quantities[unpriced] * _numbers([lines[index] for index in unpriced], 'unit_price')
+    # Lines without a price or a describable item are left out; a lump-sum line counts as one unit
+    keep = (columns >= 0) & (amounts > 0)
+    quantities = np.where(quantities > 0, quantities, 1.0)[keep]
+    item_columns = columns[keep]
+    # An item no vendor priced (a 0 price, "Delivery FOC") has no cheapest vendor, so it gets no column
+    priced = np.bincount(item_columns, minlength=len(descriptions)) > 0
+    if not priced.all():
+        item_columns = (np.cumsum(priced) - 1)[item_columns]
+        descriptions = [description for description, kept in zip(descriptions, priced.tolist()) if kept]
+
+    vendor_count, item_count = len(quotations), len(descriptions)
+    cells = rows[keep] * item_count + item_columns
+    shape = (vendor_count, item_count)
+    quantity_sum = np.bincount(cells, weights=quantities, minlength=vendor_count * item_count).reshape(shape)
+    amount_sum = np.bincount(cells, weights=amounts[keep], minlength=vendor_count * item_count).reshape(shape)
+    quoted = quantity_sum > 0
+    prices = np.divide(amount_sum, quantity_sum, out=np.full(shape, np.inf), where=quoted)
+    built = time.perf_counter()
+
+    demand = quantity_sum.max(axis=0)
+    best_vendor = prices.argmin(axis=0)
+    best_price = prices[best_vendor, np.arange(item_count)]
+    best_cost = best_price * demand
+    highest_price = np.where(quoted, prices, 0.0).max(axis=0)
+    spread_cost = (highest_price - best_price) * demand
+
+    vendor_totals = np.where(quoted, prices, 0.0) @ demand
+    # What the split award pays for exactly the items each vendor quoted
+    split_same_items = quoted @ best_cost
+    items_quoted = quoted.sum(axis=1)
+    awarded_items = np.bincount(best_vendor, minlength=vendor_count)
+    awarded_value = np.bincount(best_vendor, weights=best_cost, minlength=vendor_count)
+    split_total = best_cost.sum()
+
+    complete = np.flatnonzero(items_quoted == item_count)
+    single = complete[vendor_totals[complete].argmin()] if len(complete) else None
+
+    vendors = [{
+        'quotationId': quotation.get('quotation_id'),
+        'company': quotation.get('company_name'),
+        'quoteNumber': quotation.get('quote_number'),
+        'date': quotation.get('date'),
+        'itemsQuoted': int(items_quoted[row]),
+        'quotedTotal': _money(vendor_totals[row]),
+        'splitTotalSameItems': _money(split_same_items[row]),
+        'premiumOverSplit': _money(vendor_totals[row] - split_same_items[row]),
+        'itemsAwarded': int(awarded_items[row]),
+        'awardedValue': _money(awarded_value[row])
+    } for row, quotation in enumerate(quotations)]
+
+    order = np.argsort(-spread_cost, kind='stable')[:COMPARE_ITEM_LIMIT if item_limit is None else int(item_limit)]
+    quoting = quoted.sum(axis=0)
+    items = []
+    for column in order.tolist():
+        match, description = descriptions[column]
+        best = vendors[best_vendor[column]]
+        items.append({
+            'matchKey': match,
+            'description': description,
+            'quantity': float(demand[column]),
+            'vendorsQuoting': int(quoting[column]),
+            'bestQuotationId': best['quotationId'],
+            'bestCompany': best['company'],
+            'bestUnitPrice': round(float(best_price[column]), 4),
+            'highestUnitPrice': round(float(highest_price[column]), 4),
+            'savingVsHighest': _money(spread_cost[column])
+        })
+
+    comparison = {
+        'quotations': vendor_count,
+        'items': item_count,
+        'splitAward': {
+            'total': _money(split_total),
+            'vendors': int(np.count_nonzero(awarded_items))
+        },
+        'bestSingleVendor': None,
+        'vendors': vendors,
+        'itemsBySpread': items
+    }
+    if single is not None:
+        single_total = vendor_totals[single]
+        comparison['bestSingleVendor'] = {
+            'quotationId': vendors[single]['quotationId'],
+            'company': vendors[single]['company'],
+            'total': _money(single_total),
+            'savingsWithSplit': _money(single_total - split_total),
+            'savingsPercent': round(float((single_total - split_total) / single_total * 100), 2) if single_total else 0.0
+        }
+    comparison['timings'] = {
+        'build_seconds': round(built - started, 4),
+        'analysis_seconds': round(time.perf_counter() - built, 4)
+    }
+    return comparison
@@ -0,0 +1,137 @@
+import os
+import re
+from collections import Counter
+
+from pdf_extractor import PAGE_SEPARATOR
+from rule_extractor import MONEY_PATTERN, TOTALS_LABEL_PATTERN
+
+# Compaction changes what the model sees, so the mode is part of the extraction cache key
+PROMPT_COMPACTION = os.environ.get('PROMPT_COMPACTION', 'on').lower() not in ('0', 'off', 'false', 'no')
+# Keep only the first-page header, priced lines with their neighbours, and totals
+PROMPT_FOCUS_ITEMS = os.environ.get('PROMPT_FOCUS_ITEMS', 'off').lower() in ('1', 'on', 'true', 'yes')
+FOCUS_HEADER_LINES = 15
+FOCUS_CONTEXT_LINES = 1
+
+# Lines this close to a page edge are header/footer candidates
+EDGE_LINES = 5
+# A candidate repeating on at least this share of pages is dropped after its first page
+REPEAT_PAGE_SHARE = 0.5
+# Elsewhere only long repeated lines (wrapped terms paragraphs) are dropped; short
+# ones such as a repeated "Delivered in boxes of 12" may belong to different items
+MIN_DUPLICATE_CHARS = 60
+
+# Boilerplate that never feeds an extracted field; lines with amounts are always kept
+BOILERPLATE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'^\s*terms\s*(?:and|&)\s*conditions\b',
+    r'^\s*prices?\s+(?:are\s+)?valid\b',
+    r'^\s*(?:payment|delivery)\s+terms?\b',
+    r'^\s*goods\s+remain\b',
+    r'^\s*(?:this\s+is\s+a\s+)?computer[-\s]generated\b',
+    r'^\s*thank\s+you\s+for\s+your\s+(?:business|enquiry|inquiry)\b',
+    r'^\s*(?:e\.?\s*&\s*o\.?\s*e\.?|errors\s+and\s+omissions\s+excepted)\b',
+    r'^\s*all\s+prices\s+(?:are\s+)?(?:exclusive|inclusive|exclude|include)\b',
+    r'^\s*(?:authori[sz]ed|customer)\s+signature\b',
+)]
+
+_SPACES = re.compile(r'[ \t ]{2,}')
+_DIGITS = re.compile(r'\d+')
+
+def compaction_mode():
+    if not PROMPT_COMPACTION:
+        return 'raw'
+    return 'focus' if PROMPT_FOCUS_ITEMS else 'compact'
+
+def estimate_tokens(text):
+    """Rough Claude token count (about four characters per token); logged before and after compaction"""
+    return (len(text) + 3) // 4
+
+def _normalize(line):
+    # Aligned columns keep a two-space gap so they stay distinguishable from words
+    return _SPACES.sub('  ', line.rstrip())
+
+def _edge_key(line):
+    # "Page 3 of 10" on every page should count as the same line
+    return _DIGITS.sub('#', line.strip().lower())
+
+def _repeated_edges(pages):
+    if len(pages) < 2:
+        return set()
+    counts = Counter()
+    for lines in pages:
+        keys = {_edge_key(line) for line in lines[:EDGE_LINES] + lines[-EDGE_LINES:]
+                if line.strip() and not MONEY_PATTERN.search(line)}
+        counts.update(keys)
+    threshold = max(2, REPEAT_PAGE_SHARE * len(pages))
+    return {key for key, count in counts.items() if count >= threshold}
+
+def _is_boilerplate(line):
+    return not MONEY_PATTERN.search(line) and any(pattern.search(line) for pattern in BOILERPLATE_PATTERNS)
+
+def _focus(lines):
+    """Indexes of the lines worth sending when only item regions are kept"""
+    keep = set(range(min(FOCUS_HEADER_LINES, len(lines))))
+    for index, line in enumerate(lines):
+        if MONEY_PATTERN.search(line) or TOTALS_LABEL_PATTERN.search(line):
+            keep.update(range(max(0, index - FOCUS_CONTEXT_LINES), min(len(lines), index + FOCUS_CONTEXT_LINES + 1)))
+    return keep
+
+def compact_text(text, focus_items=None):
+    """Shrink extracted text before it goes into a prompt; returns (text, stats)
+
+    Whitespace is normalised, header/footer lines repeated across pages are
+    kept on the first page only, known boilerplate and repeated non-priced
+    lines are dropped, and with focus_items only the first-page header, priced
+    lines and totals (with a line of context) remain. Page separators are
+    preserved so chunked extraction still splits on pages.
+    """
+    focus_items = PROMPT_FOCUS_ITEMS if focus_items is None else focus_items
+    pages = [[_normalize(line) for line in page.split('\n')] for page in text.split(PAGE_SEPARATOR)]
+    repeated = _repeated_edges(pages)
+
+    stats = {'chars_before': len(text), 'tokens_before': estimate_tokens(text),
+             'header_footer_lines': 0, 'boilerplate_lines': 0, 'duplicate_lines': 0, 'unfocused_lines': 0}
+    seen_edges = set()
+    seen_lines = set()
+    compacted_pages = []
+    for lines in pages:
+        kept = []
+        for position, line in enumerate(lines):
+            stripped = line.strip()
+            if not stripped:
+                # Collapse runs of blank lines
+                if kept and kept[-1]:
+                    kept.append('')
+                continue
+            at_edge = position < EDGE_LINES or position >= len(lines) - EDGE_LINES
+            key = _edge_key(line) if at_edge else None
+            if key in repeated:
+                if key in seen_edges:
+                    stats['header_footer_lines'] += 1
+                    continue
+                seen_edges.add(key)
+            if _is_boilerplate(line):
+                stats['boilerplate_lines'] += 1
+                continue
+            if len(stripped) >= MIN_DUPLICATE_CHARS and not MONEY_PATTERN.search(line):
+                if stripped in seen_lines:
+                    stats['duplicate_lines'] += 1
+                    continue
+                seen_lines.add(stripped)
+            kept.append(line)
+        compacted_pages.append(kept)
+
+    if focus_items:
+        all_lines = [line for page in compacted_pages for line in page]
+        keep = _focus(all_lines)
+        focused = []
+        offset = 0
+        for page in compacted_pages:
+            focused.append([line for index, line in enumerate(page, start=offset) if index in keep])
+            stats['unfocused_lines'] += len(page) - len(focused[-1])
+            offset += len(page)
+        compacted_pages = focused
+
+    compacted = PAGE_SEPARATOR.join('\n'.join(page).strip('\n') + '\n' for page in compacted_pages)
+    stats['chars_after'] = len(compacted)
+    stats['tokens_after'] = estimate_tokens(compacted)
+    return compacted, stats
@@ -0,0 +1,139 @@
+import uuid
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from dataclasses import dataclass, field
+
+# Extraction output (model, rules, template or cache) is turned into these once per
+# request; storage, reports and the API response all serialize from them
+ZERO = Decimal('0')
+
+HEADER_FIELDS = ('company_name', 'email', 'phone', 'address', 'buyer_name', 'buyer_address', 'quote_number', 'date')
+
+def to_decimal(value):
+    """The single place extracted numbers become Decimal; missing or unparseable values are 0"""
+    if isinstance(value, Decimal):
+        return value
+    if value is None or isinstance(value, bool):
+        return ZERO
+    try:
+        number = Decimal(str(value).replace(',', '').strip() or '0')
+    except InvalidOperation:
+        return ZERO
+    # DynamoDB and JSON reject NaN and Infinity
+    return number if number.is_finite() else ZERO
+
+def json_number(value):
+    # Whole numbers stay ints (quantities), everything else is a float
+    return int(value) if value == value.to_integral_value() and abs(value) < 2 ** 53 else float(value)
+
+@dataclass(slots=True)
+class LineItem:
+    description: str
+    quantity: Decimal
+    unit_price: Decimal
+    total_amount: Decimal
+
+    @classmethod
+    def from_dict(cls, item):
+        return cls(
+            str(item.get('description') or ''),
+            to_decimal(item.get('quantity')),
+            to_decimal(item.get('unit_price')),
+            to_decimal(item.get('total_amount'))
+        )
+
+    def to_item(self):
+        """Items-table attributes (without the key)"""
+        return {
+            'description': self.description,
+            'quantity': self.quantity,
+            'unit_price': self.unit_price,
+            'total_amount': self.total_amount
+        }
+
+    def to_json(self):
+        return {
+            'description': self.description,
+            'quantity': json_number(self.quantity),
+            'unit_price': json_number(self.unit_price),
+            'total_amount': json_number(self.total_amount)
+        }
+
+    def to_row(self):
+        """CSV/report row: description, quantity, unit price, amount"""
+        return (self.description or 'N/A', json_number(self.quantity), json_number(self.unit_price), json_number(self.total_amount))
+
+@dataclass(slots=True)
+class Quotation:
+    company_name: str = ''
+    email: str = ''
+    phone: str = ''
+    address: str = ''
+    buyer_name: str = ''
+    buyer_address: str = ''
+    quote_number: str = ''
+    date: str = ''
+    items: list = field(default_factory=list)
+    subtotal: Decimal = ZERO
+    tax: Decimal = ZERO
+    # As stated on the document; 0 when it shows none
+    total: Decimal = ZERO
+
+    @classmethod
+    def from_extraction(cls, data):
+        """Build from the extraction dict shape shared by the model, rules, templates and cache"""
+        return cls(
+            *(str(data.get(name) or '') for name in HEADER_FIELDS),
+            items=[LineItem.from_dict(item) for item in data.get('items') or []],
+            subtotal=to_decimal(data.get('subtotal')),
+            tax=to_decimal(data.get('tax')),
+            total=to_decimal(data.get('total'))
+        )
+
+    @property
+    def grand_total(self):
+        return self.total or self.subtotal + self.tax
+
+    def to_json(self, items=None):
+        """The extraction dict with JSON numbers; pass items to reuse an already serialized list"""
+        data = {name: getattr(self, name) for name in HEADER_FIELDS}
+        data.update({
+            'items': items if items is not None else [item.to_json() for item in self.items],
+            'subtotal': json_number(self.subtotal),
+            'tax': json_number(self.tax),
+            'total': json_number(self.total)
+        })
+        return data
+
+@dataclass(slots=True)
+class PurchaseOrder:
+    po_number: str
+    po_date: str
+    quotation: Quotation
+    status: str = 'pending_approval'
+
+    @classmethod
+    def for_quotation(cls, quotation):
+        now = datetime.now()
+        return cls(f"PO-{now.strftime('%Y%m%d')}-{str(uuid.uuid4())[:8]}", now.strftime('%Y-%m-%d'), quotation)
+
+    @property
+    def total(self):
+        return self.quotation.grand_total
+
+    def to_json(self, items=None):
+        quotation = self.quotation
+        return {
+            'po_number': self.po_number,
+            'vendor': quotation.company_name,
+            'vendor_email': quotation.email,
+            'vendor_phone': quotation.phone,
+            'vendor_address': quotation.address,
+            'quote_reference': quotation.quote_number,
+            'po_date': self.po_date,
+            'items': items if items is not None else [item.to_json() for item in quotation.items],
+            'subtotal': json_number(quotation.subtotal),
+            'tax': json_number(quotation.tax),
+            'total': json_number(self.total),
+            'status': self.status
+        }
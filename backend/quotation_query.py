@@ -0,0 +1,146 @@
+import os
+import copy
+import time
+import threading
+from datetime import datetime
+from collections import OrderedDict
+
+from quotation_store import encode_cursor, decode_cursor
+
+# Global secondary indexes on the quotations table; each projects SUMMARY_FIELDS only
+COMPANY_INDEX = 'company_name-processed_at-index'
+QUOTE_NUMBER_INDEX = 'quote_number-processed_at-index'
+# processed_at needs a partition key too; one partition per month keeps them bounded
+PROCESSED_INDEX = 'processed_month-processed_at-index'
+
+SUMMARY_FIELDS = ('quotation_id', 'company_name', 'quote_number', 'date', 'total', 'items_count',
+                  'original_file', 'processed_at', 'status')
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# A date-range search walks at most this many monthly partitions per page
+MAX_MONTHS_PER_PAGE = 24
+
+# Hot lookups (a vendor's latest quotations) are served from memory for a short while
+QUERY_CACHE_TTL_SECONDS = int(os.environ.get('QUERY_CACHE_TTL_SECONDS', '30'))
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get('QUERY_CACHE_MAX_ENTRIES', '128'))
+
+_query_cache = OrderedDict()
+_lock = threading.Lock()
+
+query_cache_stats = {'hits': 0, 'misses': 0}
+
+def processed_month(processed_at):
+    return processed_at[:7]
+
+def _cached(cache_key, load):
+    now = time.time()
+    with _lock:
+        entry = _query_cache.get(cache_key)
+        if entry and entry[0] > now:
+            _query_cache.move_to_end(cache_key)
+            query_cache_stats['hits'] += 1
+            return copy.deepcopy(entry[1])
+    value = load()
+    with _lock:
+        query_cache_stats['misses'] += 1
+        _query_cache[cache_key] = (now + QUERY_CACHE_TTL_SECONDS, copy.deepcopy(value))
+        _query_cache.move_to_end(cache_key)
+        while len(_query_cache) > QUERY_CACHE_MAX_ENTRIES:
+            _query_cache.popitem(last=False)
+    return value
+
+def invalidate_query_cache():
+    """Drop cached pages, e.g. after this container stored a new quotation"""
+    with _lock:
+        _query_cache.clear()
+
+def _page_size(limit):
+    return max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+def _query_index(table, index_name, partition_name, partition_value, limit, start_key=None, sort_range=None):
+    names = {f'#f{i}': name for i, name in enumerate(SUMMARY_FIELDS)}
+    names.update({'#pk': partition_name, '#sk': 'processed_at'})
+    values = {':pk': partition_value}
+    condition = '#pk = :pk'
+    if sort_range:
+        condition += ' AND #sk BETWEEN :start AND :end'
+        values[':start'], values[':end'] = sort_range
+    query = {
+        'IndexName': index_name,
+        'KeyConditionExpression': condition,
+        'ProjectionExpression': ', '.join(f'#f{i}' for i in range(len(SUMMARY_FIELDS))),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values,
+        # Newest first
+        'ScanIndexForward': False,
+        'Limit': limit
+    }
+    if start_key:
+        query['ExclusiveStartKey'] = start_key
+    response = table.query(**query)
+    return response.get('Items', []), response.get('LastEvaluatedKey')
+
+def find_by_company(table, company_name, limit=None, cursor=None):
+    """A vendor's quotations, newest first; returns {'quotations', 'nextCursor'}"""
+    limit = _page_size(limit)
+
+    def load():
+        items, last_key = _query_index(table, COMPANY_INDEX, 'company_name', company_name, limit, decode_cursor(cursor))
+        return {'quotations': items, 'nextCursor': encode_cursor(last_key)}
+    return _cached(('company', company_name, limit, cursor), load)
+
+def find_by_quote_number(table, quote_number, limit=None, cursor=None):
+    limit = _page_size(limit)
+
+    def load():
+        items, last_key = _query_index(table, QUOTE_NUMBER_INDEX, 'quote_number', quote_number, limit, decode_cursor(cursor))
+        return {'quotations': items, 'nextCursor': encode_cursor(last_key)}
+    return _cached(('quote_number', quote_number, limit, cursor), load)
+
+def _months_descending(start, end):
+    year, month = int(end[:4]), int(end[5:7])
+    while f"{year:04d}-{month:02d}" >= start[:7]:
+        yield f"{year:04d}-{month:02d}"
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+
+def find_by_processed_range(table, start, end=None, limit=None, cursor=None):
+    """Quotations processed between two ISO dates (inclusive), newest first
+
+    Walks the monthly partitions of the processed_at index from end back to
+    start; the cursor remembers the month and position within it.
+    """
+    limit = _page_size(limit)
+    end = end or datetime.utcnow().strftime('%Y-%m-%d')
+    datetime.strptime(start[:10], '%Y-%m-%d')
+    datetime.strptime(end[:10], '%Y-%m-%d')
+    # A bare date as the upper bound covers that whole day
+    sort_range = (start, end + 'T23:59:59.999999' if len(end) == 10 else end)
+
+    def load():
+        position = decode_cursor(cursor) or {}
+        months = list(_months_descending(start, position.get('month') or end))
+        items = []
+        start_key = position.get('key')
+        for walked, month in enumerate(months):
+            if walked >= MAX_MONTHS_PER_PAGE:
+                return {'quotations': items, 'nextCursor': encode_cursor({'month': month})}
+            while len(items) < limit:
+                page, start_key = _query_index(table, PROCESSED_INDEX, 'processed_month', month,
+                                               limit - len(items), start_key, sort_range)
+                items.extend(page)
+                if not start_key:
+                    break
+            if len(items) >= limit:
+                if start_key:
+                    return {'quotations': items, 'nextCursor': encode_cursor({'month': month, 'key': start_key})}
+                next_months = months[walked + 1:]
+                return {'quotations': items, 'nextCursor': encode_cursor({'month': next_months[0]}) if next_months else None}
+        return {'quotations': items, 'nextCursor': None}
+    return _cached(('processed', start, end, limit, cursor), load)
+
+def get_query_cache_stats():
+    with _lock:
+        stats = dict(query_cache_stats)
+        stats['entries'] = len(_query_cache)
+    return stats
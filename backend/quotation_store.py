@@ -0,0 +1,157 @@
+import os
+import json
+import gzip
+import queue
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# A quotation is a compact header record in the quotations table, its line
+# items under item_seq in the items table and its full text gzipped in S3
+RAW_TEXT_PREFIX = 'raw-text/'
+ITEM_WRITE_WORKERS = int(os.environ.get('ITEM_WRITE_WORKERS', '4'))
+# batch_writer flushes every 25 puts; a segment per worker keeps several batches in flight
+ITEM_SEGMENT_SIZE = 250
+ITEMS_PAGE_SIZE = int(os.environ.get('ITEMS_PAGE_SIZE', '100'))
+MAX_ITEMS_PAGE_SIZE = 1000
+
+def encode_cursor(last_evaluated_key):
+    """Opaque pagination cursor from a DynamoDB LastEvaluatedKey"""
+    if not last_evaluated_key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key, default=str).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+def raw_text_key(quotation_id):
+    return f"{RAW_TEXT_PREFIX}{quotation_id}.txt.gz"
+
+def put_raw_text(s3_client, bucket_name, quotation_id, raw_text):
+    """Store the complete extracted text gzip-compressed; returns the S3 key"""
+    key = raw_text_key(quotation_id)
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=key,
+        Body=gzip.compress(raw_text.encode('utf-8')),
+        ContentType='text/plain; charset=utf-8',
+        ContentEncoding='gzip'
+    )
+    return key
+
+def get_raw_text(s3_client, bucket_name, key):
+    body = s3_client.get_object(Bucket=bucket_name, Key=key)['Body'].read()
+    return gzip.decompress(body).decode('utf-8')
+
+def _write_segment(items_table, quotation_id, start, items):
+    with items_table.batch_writer() as batch:
+        for offset, item in enumerate(items):
+            record = dict(item)
+            record['quotation_id'] = quotation_id
+            record['item_seq'] = start + offset
+            batch.put_item(Item=record)
+
+def put_line_items(items_table, quotation_id, items, workers=None):
+    """Batch-write line items as item_seq 0..n-1 under the quotation
+
+    Segments are written in parallel; batch_writer resends unprocessed items.
+    """
+    segments = [(start, items[start:start + ITEM_SEGMENT_SIZE]) for start in range(0, len(items), ITEM_SEGMENT_SIZE)]
+    workers = max(1, min(workers or ITEM_WRITE_WORKERS, len(segments)))
+    if workers == 1:
+        for start, segment in segments:
+            _write_segment(items_table, quotation_id, start, segment)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_write_segment, items_table, quotation_id, start, segment) for start, segment in segments]
+        for future in futures:
+            future.result()
+
+class StreamingItemWriter:
+    """Writes line items in the background while the model is still generating the rest
+
+    add() queues one item record for the next item_seq; finish() waits for the
+    writes and returns the records written. A failed write is raised from
+    finish(), after which the caller should write all items again.
+    """
+
+    def __init__(self, items_table, quotation_id):
+        self.items_table = items_table
+        self.quotation_id = quotation_id
+        self.records = []
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = None
+
+    def _run(self):
+        finished = False
+        try:
+            with self.items_table.batch_writer() as batch:
+                while not finished:
+                    record = self._queue.get()
+                    finished = record is None
+                    if not finished:
+                        batch.put_item(Item=record)
+        except Exception as e:
+            self._error = e
+            # Consume up to the end marker so finish() returns
+            while not finished:
+                finished = self._queue.get() is None
+
+    def add(self, item):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        record = dict(item)
+        record['quotation_id'] = self.quotation_id
+        record['item_seq'] = len(self.records)
+        self.records.append(item)
+        self._queue.put(record)
+
+    def finish(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+        if self._error:
+            raise self._error
+        return self.records
+
+def get_line_items(items_table, quotation_id, limit=None, cursor=None, items_count=None):
+    """One page of line items in item order; returns (items, next_cursor)
+
+    items_count (from the header) bounds the range, so rows left over from an
+    earlier, longer write of the same quotation are never returned.
+    """
+    limit = max(1, min(int(limit or ITEMS_PAGE_SIZE), MAX_ITEMS_PAGE_SIZE))
+    names = {'#q': 'quotation_id', '#s': 'item_seq'}
+    values = {':q': quotation_id}
+    condition = '#q = :q'
+    if items_count is not None:
+        condition += ' AND #s < :count'
+        values[':count'] = int(items_count)
+    query = {
+        'KeyConditionExpression': condition,
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values,
+        'Limit': limit
+    }
+    start_key = decode_cursor(cursor)
+    if start_key:
+        query['ExclusiveStartKey'] = {'quotation_id': quotation_id, 'item_seq': int(start_key['item_seq'])}
+    response = items_table.query(**query)
+    items = [{k: v for k, v in record.items() if k != 'quotation_id'} for record in response.get('Items', [])]
+    return items, encode_cursor(response.get('LastEvaluatedKey'))
+
+def get_all_line_items(items_table, quotation_id, items_count=None):
+    items = []
+    cursor = None
+    while True:
+        page, cursor = get_line_items(items_table, quotation_id, MAX_ITEMS_PAGE_SIZE, cursor, items_count)
+        items.extend(page)
+        if not cursor:
+            return items
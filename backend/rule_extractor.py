@@ -0,0 +1,196 @@
+import os
+import re
+import threading
+from datetime import datetime
+
+# Documents scoring at least this are accepted without calling Bedrock; above 1 disables the rule path
+RULE_CONFIDENCE_THRESHOLD = float(os.environ.get('RULE_CONFIDENCE_THRESHOLD', '0.9'))
+# Relative tolerance for quantity x unit price and for subtotal + tax against the total
+AMOUNT_TOLERANCE = 0.01
+# The item sum may differ from the stated subtotal by at most half a cent of rounding per item
+ROUNDING_PER_ITEM = 0.005
+
+_NUMBER = r'\d[\d,]*(?:\.\d+)?'
+# Totals must look like money (two decimals) so counts such as "Total Qty: 5" are not taken for amounts
+_MONEY = r'(?:SGD|USD|MYR|EUR|GBP|AUD|RM|S\$)?\s*\$?\s*(\d[\d,]*\.\d{2})\b'
+
+# Line-item layouts seen in templated quotations, tried in order on each line
+ITEM_PATTERNS = (
+    # Description | Qty | Unit Price | Amount
+    re.compile(r'^\s*(?P<desc>[^|]*[A-Za-z][^|]*?)\s*\|\s*(?P<qty>' + _NUMBER + r')\s*(?:[A-Za-z]{1,5}\s*)?\|\s*\$?\s*(?P<unit>' + _NUMBER + r')\s*\|\s*\$?\s*(?P<total>' + _NUMBER + r')\s*\|?\s*$'),
+    # Description 2 x 3.00 = 6.00
+    re.compile(r'^\s*(?P<desc>.*?[A-Za-z].*?)\s+(?P<qty>' + _NUMBER + r')\s*[xX×@]\s*\$?\s*(?P<unit>' + _NUMBER + r')\s*=\s*\$?\s*(?P<total>' + _NUMBER + r')\s*$'),
+    # Description   2 pcs   3.00   6.00   (whitespace-aligned columns, prices with decimals)
+    re.compile(r'^\s*(?:\d{1,4}[.)]?\s+)?(?P<desc>.*?[A-Za-z].*?)\s+(?P<qty>' + _NUMBER + r')\s+(?:[A-Za-z]{1,5}\s+)?\$?\s*(?P<unit>\d[\d,]*\.\d{2,4})\s+\$?\s*(?P<total>\d[\d,]*\.\d{2})\s*$'),
+)
+
+SUBTOTAL_PATTERN = re.compile(r'\bsub[\s-]?total\b\s*[:=]?\s*' + _MONEY, re.IGNORECASE)
+TAX_PATTERN = re.compile(r'\b(?:GST|VAT|tax)\b[^\d\n]*(?:\d+(?:\.\d+)?\s*%)?\s*[:=]?\s*' + _MONEY, re.IGNORECASE)
+TOTAL_PATTERN = re.compile(r'(?<![A-Za-z])(?<!sub )(?<!sub-)(?:grand\s+)?total(?:\s+amount)?(?:\s*\([^)\n]*\))?\s*[:=]?\s*' + _MONEY, re.IGNORECASE)
+MONEY_PATTERN = re.compile(r'\d[\d,]*\.\d{2}\b')
+# Labelled amounts ("Total: 10.00") are never line items
+TOTALS_LABEL_PATTERN = re.compile(r'\b(?:sub[\s-]?total|total|gst|vat|tax)\b[^\n:=]{0,20}[:=]', re.IGNORECASE)
+
+EMAIL_PATTERN = re.compile(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}')
+PHONE_PATTERN = re.compile(r'(?:Tel|Phone|Ph|Mobile|Hp)\.?\s*:?\s*(\+?[\d][\d\s\-()]{6,}\d)', re.IGNORECASE)
+QUOTE_NUMBER_PATTERN = re.compile(r'\b(?:Quotation|Quote)\s*(?:No\.?|Number|#|Ref\.?)\s*:?\s*([A-Z0-9][A-Z0-9\-/]*)', re.IGNORECASE)
+# The quotation's own date: a "Date" label starting a line or a column, not "Delivery Date" or "Due Date"
+_DATE = r'\d{4}-\d{2}-\d{2}|\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\d{1,2}\s+[A-Za-z]{3,9},?\s+\d{4}'
+DATE_PATTERN = re.compile(r'(?:^|\||[ \t]{2})[ \t]*(?:(?:Quotation|Quote|Document|Issue)\s+)?Date\s*:?\s*(' + _DATE + r')',
+                          re.IGNORECASE | re.MULTILINE)
+# Any date as printed, labelled or not
+DATE_VALUE_PATTERN = re.compile(r'(?<![\w/.-])(' + _DATE + r')(?![\w/-])')
+# Printed date formats, day first as on Singapore and Malaysian quotations; stored as YYYY-MM-DD like the model's
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y', '%d.%m.%Y', '%d.%m.%y', '%d-%m-%Y', '%d-%m-%y',
+                '%d %b %Y', '%d %B %Y', '%d %b, %Y', '%d %B, %Y')
+COMPANY_PATTERN = re.compile(r'^\s*([A-Z][^\n|:]*?\b(?:Pte\.?\s+Ltd|Sdn\.?\s+Bhd|Ltd|Limited|Inc|Corp|Corporation|Company|LLC|GmbH)\.?)', re.MULTILINE)
+BUYER_PATTERN = re.compile(r'^\s*(?:Bill\s+To|Ship\s+To|To|Attn|Customer)\s*:\s*(.+)$', re.IGNORECASE | re.MULTILINE)
+ADDRESS_PATTERN = re.compile(r'^\s*(\d+[^\n|]*\b(?:Road|Rd|Street|St|Avenue|Ave|Drive|Dr|Lane|Ln|Way|Boulevard|Singapore)\b[^\n|]*)', re.IGNORECASE | re.MULTILINE)
+
+# Per-path latency and counts for this container: rules, model, fallback, cache
+_path_stats = {}
+_stats_lock = threading.Lock()
+
+def _to_number(value):
+    return float(value.replace(',', ''))
+
+def _close(a, b):
+    return abs(a - b) <= max(0.01, AMOUNT_TOLERANCE * abs(b))
+
+def parse_items(lines):
+    """Return (items, item_line_indexes) for lines matching a known item layout"""
+    items = []
+    indexes = []
+    for index, line in enumerate(lines):
+        if '.' not in line and '|' not in line:
+            continue
+        for pattern in ITEM_PATTERNS:
+            match = pattern.match(line)
+            if match and not TOTALS_LABEL_PATTERN.search(line):
+                items.append({
+                    'description': match.group('desc').strip(),
+                    'quantity': _to_number(match.group('qty')),
+                    'unit_price': _to_number(match.group('unit')),
+                    'total_amount': _to_number(match.group('total'))
+                })
+                indexes.append(index)
+                break
+    return items, indexes
+
+def _last_amount(pattern, text):
+    value = None
+    for match in pattern.finditer(text):
+        value = _to_number(match.group(1))
+    return value
+
+def stated_totals(text):
+    """(subtotal, tax, total) as stated in the text, None where absent; the last mention wins"""
+    return _last_amount(SUBTOTAL_PATTERN, text), _last_amount(TAX_PATTERN, text), _last_amount(TOTAL_PATTERN, text)
+
+def normalize_date(value):
+    """A date in one of DATE_FORMATS as YYYY-MM-DD; '' when it is not a valid date in any of them"""
+    value = ' '.join(value.split())
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    # "Sept" is printed as often as "Sep"
+    if re.search(r'\bSept\b', value, re.IGNORECASE):
+        return normalize_date(re.sub(r'\bSept\b', 'Sep', value, flags=re.IGNORECASE))
+    return ''
+
+def header_fields(text):
+    """Supplier, buyer, quote number and date found anywhere in the text"""
+    company = COMPANY_PATTERN.search(text)
+    email = EMAIL_PATTERN.search(text)
+    phone = PHONE_PATTERN.search(text)
+    quote = QUOTE_NUMBER_PATTERN.search(text)
+    date = DATE_PATTERN.search(text)
+    address = ADDRESS_PATTERN.search(text)
+    buyer = BUYER_PATTERN.search(text)
+    buyer_name, _, buyer_address = (buyer.group(1).partition(',') if buyer else ('', '', ''))
+    return {
+        'company_name': company.group(1).strip() if company else '',
+        'email': email.group(0) if email else '',
+        'phone': phone.group(1).strip() if phone else '',
+        'address': address.group(1).split('|')[0].strip() if address else '',
+        'buyer_name': buyer_name.strip(),
+        'buyer_address': buyer_address.strip(),
+        'quote_number': quote.group(1) if quote else '',
+        'date': normalize_date(date.group(1)) if date else ''
+    }
+
+def check_extraction(lines, items, indexes, subtotal, tax, total):
+    """Arithmetic checks for items parsed from lines[indexes] against the stated totals"""
+    checks = {'items': len(items)}
+    if not items:
+        return checks
+    items_sum = round(sum(item['total_amount'] for item in items), 2)
+    consistent = sum(1 for item in items if _close(item['quantity'] * item['unit_price'], item['total_amount']))
+    checks['items_consistent'] = round(consistent / len(items), 3)
+    checks['subtotal_matches'] = subtotal is not None and abs(items_sum - subtotal) <= max(0.01, ROUNDING_PER_ITEM * len(items))
+    if total is None:
+        checks['total_matches'] = False
+    else:
+        checks['total_matches'] = _close((subtotal or items_sum) + (tax or 0), total)
+
+    # Priced lines between the first and last item that matched no layout are probably missed items
+    item_lines = set(indexes)
+    checks['unmatched_priced_lines'] = sum(
+        1 for index in range(indexes[0], indexes[-1] + 1)
+        if index not in item_lines and len(MONEY_PATTERN.findall(lines[index])) >= 2
+    )
+    return checks
+
+def extract_with_rules(text):
+    """Rule-based extraction with a confidence score in [0, 1]
+
+    Returns (data, confidence, checks). data has the same shape as the model
+    output. Confidence rewards arithmetic that adds up (quantity x unit price
+    per item, items against the subtotal, subtotal + tax against the total)
+    and penalises priced lines inside the item table that no layout matched.
+    """
+    lines = text.splitlines()
+    items, indexes = parse_items(lines)
+    data = header_fields(text)
+    subtotal, tax, total = stated_totals(text)
+    items_sum = round(sum(item['total_amount'] for item in items), 2)
+    data.update({'items': items, 'subtotal': subtotal or items_sum, 'tax': tax or 0, 'total': total or 0})
+
+    checks = check_extraction(lines, items, indexes, subtotal, tax, total)
+    if not items:
+        return data, 0.0, checks
+
+    unmatched = checks['unmatched_priced_lines']
+    confidence = (
+        0.4 * checks['items_consistent']
+        + 0.3 * checks['subtotal_matches']
+        + 0.1 * checks['total_matches']
+        + 0.1 * bool(data['company_name'])
+        + 0.05 * bool(data['quote_number'])
+        + 0.05 * bool(data['email'] or data['phone'])
+        - (0.15 + 0.5 * min(1.0, unmatched / len(items)) if unmatched else 0.0)
+    )
+    return data, round(max(0.0, confidence), 3), checks
+
+def record_path(path, seconds):
+    with _stats_lock:
+        stats = _path_stats.setdefault(path, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        stats['count'] += 1
+        stats['total_ms'] += seconds * 1000
+        stats['max_ms'] = max(stats['max_ms'], seconds * 1000)
+
+def get_path_metrics():
+    """Count, share of documents and mean/max latency for each extraction path"""
+    with _stats_lock:
+        documents = sum(stats['count'] for stats in _path_stats.values())
+        return {
+            path: {
+                'count': stats['count'],
+                'hit_rate': round(stats['count'] / documents, 3),
+                'avg_ms': round(stats['total_ms'] / stats['count'], 2),
+                'max_ms': round(stats['max_ms'], 2)
+            }
+            for path, stats in _path_stats.items()
+        }
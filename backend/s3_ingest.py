@@ -0,0 +1,53 @@
+import os
+import uuid
+import hashlib
+import tempfile
+
+UPLOAD_PREFIX = 'uploads/'
+UPLOAD_URL_EXPIRES_SECONDS = int(os.environ.get('UPLOAD_URL_EXPIRES_SECONDS', '900'))
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+def check_upload_key(key):
+    """Only objects uploaded through create_upload_url may be processed by key"""
+    if not isinstance(key, str) or not key.startswith(UPLOAD_PREFIX):
+        raise ValueError(f"s3Key must be under {UPLOAD_PREFIX}")
+    return key
+
+def create_upload_url(s3_client, bucket_name, file_name, file_type):
+    """Presigned PUT URL so the browser uploads straight to S3 instead of inside the JSON body"""
+    upload_key = f"{UPLOAD_PREFIX}{uuid.uuid4()}/{os.path.basename(file_name)}"
+    upload_url = s3_client.generate_presigned_url(
+        'put_object',
+        Params={'Bucket': bucket_name, 'Key': upload_key, 'ContentType': file_type},
+        ExpiresIn=UPLOAD_URL_EXPIRES_SECONDS
+    )
+    return {
+        'uploadUrl': upload_url,
+        's3Key': upload_key,
+        'contentType': file_type,
+        'expiresIn': UPLOAD_URL_EXPIRES_SECONDS
+    }
+
+def download_to_tempfile(s3_client, bucket_name, key):
+    """Stream an object to local /tmp in fixed-size chunks, hashing as it goes
+
+    Returns (path, size, sha256 hexdigest); the caller removes the file.
+    """
+    body = s3_client.get_object(Bucket=bucket_name, Key=key)['Body']
+    digest = hashlib.sha256()
+    size = 0
+    suffix = os.path.splitext(key)[1]
+    handle, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            while True:
+                chunk = body.read(DOWNLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, size, digest.hexdigest()
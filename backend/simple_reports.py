@@ -2,16 +2,35 @@ import os
 import csv
 import boto3
 import json
+import threading
 from io import StringIO, BytesIO
 from datetime import datetime
 import sys
-sys.path.append('/var/task/python')
+
+from tracing import RequestTrace
+from quotation_model import json_number
 
 # Note: Using text-based logo to avoid Pillow dependency
 
-from fpdf import FPDF
+# fpdf, the S3 client and config are loaded on first use to keep cold starts short
+_s3_client = None
+_s3_client_lock = threading.Lock()
+_config = None
+
+def load_fpdf():
+    # Lambda layer packages live under /var/task/python
+    if '/var/task/python' not in sys.path:
+        sys.path.append('/var/task/python')
+    from fpdf import FPDF
+    return FPDF
 
-s3_client = boto3.client('s3')
+def get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = boto3.client('s3')
+    return _s3_client
 
 # Load configuration
 def load_config():
@@ -21,117 +40,248 @@ def load_config():
     except:
         return {'DOCS_BUCKET': os.environ.get('S3_BUCKET', 'quotation-processor-docs')}
 
-config = load_config()
+def get_config():
+    global _config
+    if _config is None:
+        _config = load_config()
+    return _config
 
-def generate_pdf_report(quotation_id, extracted_data, purchase_order):
+def generate_pdf_report(quotation_id, quotation, purchase_order, trace=None):
     """Generate structured purchase order PDF matching PO_format.json"""
-    bucket_name = config.get('DOCS_BUCKET', os.environ.get('S3_BUCKET', 'quotation-processor-docs'))
+    bucket_name = get_config().get('DOCS_BUCKET', os.environ.get('S3_BUCKET', 'quotation-processor-docs'))
+    trace = trace or RequestTrace()
     
-    pdf = FPDF()
+    with trace.stage('pdf_render'):
+        pdf_bytes = render_pdf_report(quotation, purchase_order)
+    trace.count(pdf_bytes=len(pdf_bytes))
+    
+    pdf_key = f"reports/{quotation_id}_purchase_order.pdf"
+    
+    with trace.stage('s3_upload'):
+        get_s3_client().put_object(
+            Bucket=bucket_name,
+            Key=pdf_key,
+            Body=pdf_bytes,
+            ContentType='application/pdf'
+        )
+    
+    return f"https://{bucket_name}.s3.amazonaws.com/{pdf_key}"
+
+# Buyer details and footer never change, so they are laid out from constants
+BUYER_LINES = ('Axrail Demo Pte Ltd', 'Changi Tower, 78909 Singapore', 'Phone: +65 56998 3421', 'Email: contactus@axrail.com')
+FOOTER_TEXT = 'Axrail Demo Pte Ltd | Changi Tower, 78909 Singapore | contactus@axrail.com'
+BUYER_COLUMN_X = 105
+
+# Static blocks as (FPDF method, args) calls, prebuilt once and replayed into each document
+TITLE_BLOCK = (
+    ('set_font', ('Arial', 'B', 20)),
+    ('cell', (0, 15, 'PURCHASE ORDER', 0, 1, 'C')),
+    ('ln', (10,)),
+)
+PARTY_HEADINGS_BLOCK = (
+    ('set_font', ('Arial', 'B', 12)),
+    ('cell', (95, 8, 'SUPPLIER', 0, 0)),
+    ('cell', (95, 8, 'BUYER', 0, 1)),
+)
+# Drawn beside the supplier column, which leaves the cursor at its top left
+BUYER_BLOCK = (
+    ('set_font', ('Arial', '', 10)),
+    ('set_x', (BUYER_COLUMN_X,)),
+) + tuple(('cell', (95, 6, line, 0, 2)) for line in BUYER_LINES)
+# Stylized AXRAIL text logo in a bordered box, then the company details
+LOGO_BLOCK = (
+    ('ln', (15,)),
+    ('set_line_width', (0.5,)),
+    ('set_draw_color', (147, 112, 219)),
+    ('set_text_color', (147, 112, 219)),
+    ('set_font', ('Arial', 'B', 16)),
+    ('set_x', (75,)),
+    ('cell', (60, 15, 'A X R A I L', 1, 1, 'C')),
+    ('set_text_color', (0, 0, 0)),
+    ('set_draw_color', (0, 0, 0)),
+    ('set_line_width', (0.2,)),
+    ('ln', (5,)),
+    ('set_font', ('Arial', 'B', 14)),
+    ('cell', (0, 8, BUYER_LINES[0], 0, 1, 'C')),
+    ('set_font', ('Arial', '', 10)),
+    ('cell', (0, 6, BUYER_LINES[1], 0, 1, 'C')),
+    ('cell', (0, 6, f'{BUYER_LINES[2]} | {BUYER_LINES[3]}', 0, 1, 'C')),
+)
+
+# Item table: (heading, width mm, alignment); widths add up to the 190mm printable width
+TABLE_COLUMNS = (('DESCRIPTION', 80, 'L'), ('QUANTITY', 30, 'C'), ('UNIT PRICE', 40, 'R'), ('TOTAL', 40, 'R'))
+TABLE_HEADER_HEIGHT = 10
+ROW_LINE_HEIGHT = 5
+ROW_PADDING = 3
+# Space kept free at the bottom of each page for the running footer
+FOOTER_HEIGHT = 20
+# Totals, quotation reference and logo block, kept together on the last page
+SUMMARY_HEIGHT = 115
+
+_po_pdf_class = None
+
+def get_po_pdf_class():
+    """FPDF subclass with the running header and footer, built once per container"""
+    global _po_pdf_class
+    if _po_pdf_class is None:
+        FPDF = load_fpdf()
+
+        class PurchaseOrderPDF(FPDF):
+            po_number = 'N/A'
+
+            def header(self):
+                # Page 1 carries the full title block; later pages get a one-line reminder
+                if self.page_no() > 1:
+                    self.set_font('Arial', 'B', 10)
+                    self.cell(0, 8, f'PURCHASE ORDER {self.po_number} (continued)', 0, 1, 'L')
+                    self.ln(2)
+
+            def footer(self):
+                self.set_y(-15)
+                self.set_font('Arial', '', 8)
+                self.set_text_color(128, 128, 128)
+                self.cell(0, 5, f'{FOOTER_TEXT} | Page {self.page_no()} of {{nb}}', 0, 0, 'C')
+                self.set_text_color(0, 0, 0)
+
+        _po_pdf_class = PurchaseOrderPDF
+    return _po_pdf_class
+
+def pdf_text(value):
+    # The core fonts are latin-1 only; anything else would abort the whole render
+    return str(value).encode('latin-1', 'replace').decode('latin-1')
+
+def wrap_text(pdf, text, width):
+    """Greedy word wrap for the current font; words wider than the column are split"""
+    lines = []
+    line = ''
+    for word in text.split():
+        candidate = f'{line} {word}' if line else word
+        if pdf.get_string_width(candidate) <= width:
+            line = candidate
+            continue
+        if line:
+            lines.append(line)
+        while pdf.get_string_width(word) > width and len(word) > 1:
+            cut = len(word) - 1
+            while cut > 1 and pdf.get_string_width(word[:cut]) > width:
+                cut -= 1
+            lines.append(word[:cut])
+            word = word[cut:]
+        line = word
+    lines.append(line)
+    return lines
+
+def replay(pdf, block):
+    for method, args in block:
+        getattr(pdf, method)(*args)
+
+def draw_table_header(pdf):
+    pdf.set_font('Arial', 'B', 10)
+    for heading, width, _ in TABLE_COLUMNS:
+        pdf.cell(width, TABLE_HEADER_HEIGHT, heading, 1, 0, 'C')
+    pdf.ln(TABLE_HEADER_HEIGHT)
+    pdf.set_font('Arial', '', 9)
+
+def render_pdf_report(quotation, purchase_order, stats=None):
+    """Lay out the purchase order PDF and return its bytes
+
+    The item table paginates with its header repeated on every page and
+    long descriptions wrap, so cost grows linearly with the row count.
+    If given, stats is filled with the page and row counts.
+    """
+    pdf = get_po_pdf_class()()
+    pdf.po_number = pdf_text(purchase_order.po_number or "N/A")
+    pdf.alias_nb_pages()
+    pdf.set_auto_page_break(False)
+    page_bottom = pdf.h - FOOTER_HEIGHT
     pdf.add_page()
     
-    # Header
-    pdf.set_font('Arial', 'B', 20)
-    pdf.cell(0, 15, 'PURCHASE ORDER', 0, 1, 'C')
-    pdf.ln(10)
+    replay(pdf, TITLE_BLOCK)
     
     # PO Number and Date
     pdf.set_font('Arial', 'B', 12)
-    po_number = purchase_order.get("po_number") or "N/A"
-    po_date = purchase_order.get("po_date") or datetime.now().strftime("%Y-%m-%d")
-    pdf.cell(95, 8, f'PO Number: {po_number}', 0, 0)
-    pdf.cell(95, 8, f'Date: {po_date}', 0, 1)
+    po_date = purchase_order.po_date or datetime.now().strftime("%Y-%m-%d")
+    pdf.cell(95, 8, f'PO Number: {pdf.po_number}', 0, 0)
+    pdf.cell(95, 8, pdf_text(f'Date: {po_date}'), 0, 1)
     pdf.ln(10)
     
     # Supplier and Buyer sections side by side
-    pdf.set_font('Arial', 'B', 12)
-    pdf.cell(95, 8, 'SUPPLIER', 0, 0)
-    pdf.cell(95, 8, 'BUYER', 0, 1)
-    
+    replay(pdf, PARTY_HEADINGS_BLOCK)
     pdf.set_font('Arial', '', 10)
-    # Supplier info (left side)
-    company_name = extracted_data.get("company_name") or "N/A"
-    address = extracted_data.get("address") or "N/A"
-    phone = extracted_data.get("phone") or "N/A"
-    email = extracted_data.get("email") or "N/A"
-    
-    pdf.cell(95, 6, company_name, 0, 0)
-    # Buyer info (right side) - Fixed company details
-    pdf.cell(95, 6, 'Axrail Demo Pte Ltd', 0, 1)
-    
-    pdf.cell(95, 6, address, 0, 0)
-    pdf.cell(95, 6, 'Changi Tower, 78909 Singapore', 0, 1)
-    
-    pdf.cell(95, 6, f'Phone: {phone}', 0, 0)
-    pdf.cell(95, 6, 'Phone: +65 56998 3421', 0, 1)
-    
-    pdf.cell(95, 6, f'Email: {email}', 0, 0)
-    pdf.cell(95, 6, 'Email: contactus@axrail.com', 0, 1)
+    top = pdf.get_y()
+    supplier_lines = (
+        quotation.company_name or "N/A",
+        quotation.address or "N/A",
+        f'Phone: {quotation.phone or "N/A"}',
+        f'Email: {quotation.email or "N/A"}'
+    )
+    for supplier_line in supplier_lines:
+        pdf.cell(95, 6, pdf_text(supplier_line), 0, 2)
+    pdf.set_y(top)
+    replay(pdf, BUYER_BLOCK)
     pdf.ln(15)
     
     # Items Table
-    pdf.set_font('Arial', 'B', 10)
-    pdf.cell(80, 10, 'DESCRIPTION', 1, 0, 'C')
-    pdf.cell(30, 10, 'QUANTITY', 1, 0, 'C')
-    pdf.cell(40, 10, 'UNIT PRICE', 1, 0, 'C')
-    pdf.cell(40, 10, 'TOTAL', 1, 1, 'C')
-    
-    # Table rows
-    pdf.set_font('Arial', '', 9)
-    for item in extracted_data.get('items', []):
-        description = item.get("description") or "N/A"
-        quantity = item.get("quantity") or 0
-        unit_price = item.get("unit_price") or 0
-        total_amount = item.get("total_amount") or 0
+    draw_table_header(pdf)
+    description_width = TABLE_COLUMNS[0][1] - 2
+    rows = 0
+    for item in quotation.items:
+        description, quantity, unit_price, total_amount = item.to_row()
+        values = (
+            wrap_text(pdf, pdf_text(description), description_width),
+            [str(quantity)],
+            [f'${unit_price:.2f}'],
+            [f'${total_amount:.2f}']
+        )
+        row_height = len(values[0]) * ROW_LINE_HEIGHT + ROW_PADDING
+        if pdf.get_y() + row_height > page_bottom:
+            pdf.add_page()
+            draw_table_header(pdf)
         
-        pdf.cell(80, 8, description, 1, 0)
-        pdf.cell(30, 8, str(quantity), 1, 0, 'C')
-        pdf.cell(40, 8, f'${float(unit_price):.2f}', 1, 0, 'R')
-        pdf.cell(40, 8, f'${float(total_amount):.2f}', 1, 1, 'R')
-    
-    # Summary section
+        # Single-line rows (the common case) are plain bordered cells
+        if len(values[0]) == 1:
+            for (_, width, align), lines in zip(TABLE_COLUMNS, values):
+                pdf.cell(width, row_height, lines[0], 1, 0, align)
+            pdf.ln(row_height)
+            rows += 1
+            continue
+        
+        x = pdf.l_margin
+        y = pdf.get_y()
+        for (_, width, align), lines in zip(TABLE_COLUMNS, values):
+            pdf.rect(x, y, width, row_height)
+            pdf.set_xy(x, y + ROW_PADDING / 2)
+            for line in lines:
+                pdf.cell(width, ROW_LINE_HEIGHT, line, 0, 2, align)
+            x += width
+        pdf.set_xy(pdf.l_margin, y + row_height)
+        rows += 1
+    
+    # Summary section, quotation reference and logo block stay together
+    if pdf.get_y() + SUMMARY_HEIGHT > page_bottom:
+        pdf.add_page()
     pdf.ln(10)
     pdf.set_font('Arial', 'B', 10)
-    subtotal = extracted_data.get("subtotal") or 0
-    tax = extracted_data.get("tax") or 0
-    total = purchase_order.get("total") or 0
-    
     pdf.cell(150, 8, 'Subtotal:', 0, 0, 'R')
-    pdf.cell(40, 8, f'${float(subtotal):.2f}', 1, 1, 'R')
+    pdf.cell(40, 8, f'${quotation.subtotal:.2f}', 1, 1, 'R')
     pdf.cell(150, 8, 'Tax:', 0, 0, 'R')
-    pdf.cell(40, 8, f'${float(tax):.2f}', 1, 1, 'R')
+    pdf.cell(40, 8, f'${quotation.tax:.2f}', 1, 1, 'R')
     pdf.set_font('Arial', 'B', 12)
     pdf.cell(150, 10, 'GRAND TOTAL:', 0, 0, 'R')
-    pdf.cell(40, 10, f'${float(total):.2f}', 1, 1, 'R')
+    pdf.cell(40, 10, f'${purchase_order.total:.2f}', 1, 1, 'R')
     
     # Add quotation reference at the bottom
     pdf.ln(15)
     pdf.set_font('Arial', '', 10)
-    quote_ref = extracted_data.get('quote_number') or 'N/A'
-    pdf.cell(0, 8, f'Quotation Reference: {quote_ref}', 0, 1, 'L')
+    quote_ref = quotation.quote_number or 'N/A'
+    pdf.cell(0, 8, pdf_text(f'Quotation Reference: {quote_ref}'), 0, 1, 'L')
     
     # Add centered Axrail footer with stylized text logo
-    pdf.ln(15)
-    
-    # Create stylized AXRAIL logo with border
-    pdf.set_line_width(0.5)
-    pdf.set_draw_color(147, 112, 219)  # Light purple border
-    pdf.rect(75, pdf.get_y(), 60, 15)  # Rectangle around logo
-    
-    pdf.set_font('Arial', 'B', 16)
-    pdf.set_text_color(147, 112, 219)  # Light purple text
-    pdf.cell(0, 15, 'A X R A I L', 0, 1, 'C')
+    replay(pdf, LOGO_BLOCK)
     
-    # Reset colors and add company info
-    pdf.set_text_color(0, 0, 0)  # Black text
-    pdf.set_draw_color(0, 0, 0)  # Black lines
-    pdf.ln(5)
-    
-    pdf.set_font('Arial', 'B', 14)
-    pdf.cell(0, 8, 'Axrail Demo Pte Ltd', 0, 1, 'C')
-    pdf.set_font('Arial', '', 10)
-    pdf.cell(0, 6, 'Changi Tower, 78909 Singapore', 0, 1, 'C')
-    pdf.cell(0, 6, 'Phone: +65 56998 3421 | Email: contactus@axrail.com', 0, 1, 'C')
+    if stats is not None:
+        stats['pages'] = pdf.page_no()
+        stats['rows'] = rows
     
     pdf_buffer = BytesIO()
     pdf_content = pdf.output(dest='S')
@@ -140,20 +290,11 @@ def generate_pdf_report(quotation_id, extracted_data, purchase_order):
     else:
         pdf_buffer.write(pdf_content)
     
-    pdf_key = f"reports/{quotation_id}_purchase_order.pdf"
-    
-    s3_client.put_object(
-        Bucket=bucket_name,
-        Key=pdf_key,
-        Body=pdf_buffer.getvalue(),
-        ContentType='application/pdf'
-    )
-    
-    return f"https://{bucket_name}.s3.amazonaws.com/{pdf_key}"
+    return pdf_buffer.getvalue()
 
-def generate_csv_report(quotation_id, extracted_data, purchase_order):
+def generate_csv_report(quotation_id, quotation, purchase_order):
     """Generate CSV report and upload to S3 with public access"""
-    bucket_name = config.get('DOCS_BUCKET', os.environ.get('S3_BUCKET', 'quotation-processor-docs'))
+    bucket_name = get_config().get('DOCS_BUCKET', os.environ.get('S3_BUCKET', 'quotation-processor-docs'))
     
     csv_buffer = StringIO()
     writer = csv.writer(csv_buffer)
@@ -165,42 +306,36 @@ def generate_csv_report(quotation_id, extracted_data, purchase_order):
     
     # Extracted Data
     writer.writerow(['Section', 'Extracted Information'])
-    writer.writerow(['Company', extracted_data.get('company_name', 'N/A')])
-    writer.writerow(['Email', extracted_data.get('email', 'N/A')])
-    writer.writerow(['Phone', extracted_data.get('phone', 'N/A')])
-    writer.writerow(['Address', extracted_data.get('address', 'N/A')])
-    writer.writerow(['Quote Number', extracted_data.get('quote_number', 'N/A')])
-    writer.writerow(['Date', extracted_data.get('date', 'N/A')])
-    writer.writerow(['Subtotal', extracted_data.get('subtotal', 0)])
-    writer.writerow(['Tax', extracted_data.get('tax', 0) or 0])
-    writer.writerow(['Total', extracted_data.get('total', 0) or extracted_data.get('subtotal', 0)])
+    writer.writerow(['Company', quotation.company_name or 'N/A'])
+    writer.writerow(['Email', quotation.email or 'N/A'])
+    writer.writerow(['Phone', quotation.phone or 'N/A'])
+    writer.writerow(['Address', quotation.address or 'N/A'])
+    writer.writerow(['Quote Number', quotation.quote_number or 'N/A'])
+    writer.writerow(['Date', quotation.date or 'N/A'])
+    writer.writerow(['Subtotal', quotation.subtotal])
+    writer.writerow(['Tax', quotation.tax])
+    writer.writerow(['Total', quotation.grand_total])
     writer.writerow([])
     
     # Items
     writer.writerow(['Items'])
     writer.writerow(['Description', 'Quantity', 'Unit Price', 'Total Amount'])
-    for item in extracted_data.get('items', []):
-        writer.writerow([
-            item.get('description', 'N/A'),
-            item.get('quantity', 0),
-            item.get('unit_price', 0),
-            item.get('total_amount', 0)
-        ])
+    writer.writerows(item.to_row() for item in quotation.items)
     writer.writerow([])
     
     # Purchase Order
     writer.writerow(['Section', 'Purchase Order'])
-    writer.writerow(['PO Number', purchase_order.get('po_number', 'N/A')])
-    writer.writerow(['Vendor', purchase_order.get('vendor', 'N/A')])
-    writer.writerow(['Vendor Email', purchase_order.get('vendor_email', 'N/A')])
-    writer.writerow(['Vendor Phone', purchase_order.get('vendor_phone', 'N/A')])
-    writer.writerow(['Vendor Address', purchase_order.get('vendor_address', 'N/A')])
-    writer.writerow(['Status', purchase_order.get('status', 'N/A')])
-    writer.writerow(['Total Amount', purchase_order.get('total', 0)])
+    writer.writerow(['PO Number', purchase_order.po_number])
+    writer.writerow(['Vendor', quotation.company_name or 'N/A'])
+    writer.writerow(['Vendor Email', quotation.email or 'N/A'])
+    writer.writerow(['Vendor Phone', quotation.phone or 'N/A'])
+    writer.writerow(['Vendor Address', quotation.address or 'N/A'])
+    writer.writerow(['Status', purchase_order.status])
+    writer.writerow(['Total Amount', purchase_order.total])
     
     csv_key = f"reports/{quotation_id}_data.csv"
     
-    s3_client.put_object(
+    get_s3_client().put_object(
         Bucket=bucket_name,
         Key=csv_key,
         Body=csv_buffer.getvalue(),
@@ -209,17 +344,36 @@ def generate_csv_report(quotation_id, extracted_data, purchase_order):
     
     return f"https://{bucket_name}.s3.amazonaws.com/{csv_key}"
 
-def generate_summary(extracted_data, purchase_order):
-    """Generate processing summary"""
-    items_count = len(extracted_data.get('items', []))
-    total_amount = extracted_data.get('total', 0) or extracted_data.get('subtotal', 0)
+def generate_json_report(quotation_id, quotation, purchase_order):
+    """Upload the extraction and purchase order as a JSON export"""
+    bucket_name = get_config().get('DOCS_BUCKET', os.environ.get('S3_BUCKET', 'quotation-processor-docs'))
+    
+    json_key = f"reports/{quotation_id}_data.json"
+    items = [item.to_json() for item in quotation.items]
+    body = json.dumps({
+        'quotationId': quotation_id,
+        'generated': datetime.now().isoformat(),
+        'extractedData': quotation.to_json(items),
+        'purchaseOrder': purchase_order.to_json(items)
+    })
+    
+    get_s3_client().put_object(
+        Bucket=bucket_name,
+        Key=json_key,
+        Body=body,
+        ContentType='application/json'
+    )
     
+    return f"https://{bucket_name}.s3.amazonaws.com/{json_key}"
+
+def generate_summary(quotation, purchase_order):
+    """Generate processing summary"""
     summary = {
         'processing_status': 'completed',
-        'items_processed': items_count,
-        'total_value': total_amount,
-        'vendor': extracted_data.get('company_name', 'Unknown'),
-        'po_generated': purchase_order.get('po_number'),
+        'items_processed': len(quotation.items),
+        'total_value': json_number(quotation.total or quotation.subtotal),
+        'vendor': quotation.company_name or 'Unknown',
+        'po_generated': purchase_order.po_number,
         'processing_time': datetime.now().isoformat()
     }
     
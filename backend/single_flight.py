@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import zlib
+import uuid
+import threading
+
+from bedrock_invoker import error_code
+
+# Duplicate requests (client retries, double submits) wait for the run already in progress
+# and share its response instead of extracting, storing and reporting the document again
+SINGLE_FLIGHT = os.environ.get('SINGLE_FLIGHT', 'on').lower() not in ('0', 'off', 'false', 'no')
+# The leader renews its lease while it runs; a lease left by a crashed container expires quickly
+FLIGHT_LEASE_SECONDS = int(os.environ.get('FLIGHT_LEASE_SECONDS', '30'))
+# Stay below the 300s Lambda timeout so a waiter can still answer
+FLIGHT_WAIT_SECONDS = float(os.environ.get('FLIGHT_WAIT_SECONDS', '240'))
+# How long a finished response is replayed: briefly for identical documents, a day for idempotency keys
+FLIGHT_RESULT_SECONDS = int(os.environ.get('FLIGHT_RESULT_SECONDS', '300'))
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+FLIGHT_POLL_SECONDS = 0.25
+FLIGHT_POLL_MAX_SECONDS = 2.0
+# Stay well below the 400KB DynamoDB item limit
+MAX_RESULT_BYTES = 300000
+
+KEY_REUSED = "Idempotency key was already used for a different request"
+
+class FlightInProgress(Exception):
+    """An identical request is still running elsewhere after FLIGHT_WAIT_SECONDS"""
+
+class IdempotencyKeyReused(ValueError):
+    """The idempotency key belongs to a different request; a client error, retrying cannot help"""
+
+class _Flight:
+    __slots__ = ('fingerprint', 'done', 'result', 'error')
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+_flights = {}
+_lock = threading.Lock()
+
+flight_stats = {
+    'leaders': 0,
+    'joined': 0,
+    'replayed': 0,
+    'takeovers': 0,
+    'timeouts': 0,
+    'errors': 0
+}
+
+def _count(name):
+    with _lock:
+        flight_stats[name] += 1
+
+def run_once(key, compute, table=None, fingerprint=None, retention_seconds=None):
+    """Run compute() once for all concurrent callers with the same key; returns (result, role)
+
+    role is 'leader' for the caller that ran compute, 'joined' for callers that
+    waited on it and 'replayed' when a finished result was still retained
+    (retention_seconds, 0 to share only with requests that overlap the run).
+    Callers in this container wait on an event; other containers see the
+    lease record in table (the extraction cache table) and poll it. A
+    fingerprint that differs from the leader's means the key was reused for
+    another request and raises IdempotencyKeyReused. Storage errors never fail the
+    request: the caller then runs compute itself.
+    """
+    if not SINGLE_FLIGHT:
+        return compute(), 'leader'
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight(fingerprint)
+    if not leader:
+        if flight.fingerprint != fingerprint:
+            raise IdempotencyKeyReused(KEY_REUSED)
+        _count('joined')
+        if not flight.done.wait(FLIGHT_WAIT_SECONDS):
+            _count('timeouts')
+            raise FlightInProgress(f"An identical request is still being processed ({key})")
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, 'joined'
+
+    try:
+        if retention_seconds is None:
+            retention_seconds = FLIGHT_RESULT_SECONDS
+        flight.result, role = _run_shared(key, compute, table, fingerprint, retention_seconds)
+        return flight.result, role
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            del _flights[key]
+        flight.done.set()
+
+def _run_shared(key, compute, table, fingerprint, retention_seconds):
+    if table is None:
+        _count('leaders')
+        return compute(), 'leader'
+    lease = _Lease(table, f"flight#{key}", fingerprint)
+    deadline = time.time() + FLIGHT_WAIT_SECONDS
+    delay = FLIGHT_POLL_SECONDS
+    waited = False
+    while True:
+        try:
+            acquired, record = lease.acquire()
+        except Exception as e:
+            _count('errors')
+            print(f"Single-flight lease error, running without it: {e}")
+            _count('leaders')
+            return compute(), 'leader'
+        if acquired:
+            break
+        if record is None:
+            # The previous holder released or its lease lapsed between our two reads
+            continue
+        if fingerprint is not None and record.get('fingerprint') not in (None, fingerprint):
+            raise IdempotencyKeyReused(KEY_REUSED)
+        if record.get('state') == 'done':
+            if record.get('result') is None:
+                # Too large to keep; the extraction cache still spares the model call
+                _count('leaders')
+                return compute(), 'leader'
+            role = 'joined' if waited else 'replayed'
+            _count(role)
+            return json.loads(zlib.decompress(bytes(record['result'])).decode('utf-8')), role
+        if time.time() + delay > deadline:
+            _count('timeouts')
+            raise FlightInProgress(f"An identical request is still being processed ({key})")
+        waited = True
+        time.sleep(delay)
+        delay = min(delay * 2, FLIGHT_POLL_MAX_SECONDS)
+
+    _count('takeovers' if lease.took_over else 'leaders')
+    lease.start_renewal()
+    try:
+        result = compute()
+    except Exception:
+        lease.stop_renewal()
+        lease.release()
+        raise
+    lease.stop_renewal()
+    lease.publish(result, retention_seconds)
+    return result, 'leader'
+
+class _Lease:
+    """Lease record for one flight in the cache table; expires_at doubles as lease expiry and TTL"""
+
+    def __init__(self, table, cache_key, fingerprint):
+        self.table = table
+        self.cache_key = cache_key
+        self.fingerprint = fingerprint
+        self.owner = str(uuid.uuid4())
+        self.took_over = False
+        self._stop = threading.Event()
+        self._renewer = None
+
+    def acquire(self):
+        """Returns (True, None) when the lease is ours, else (False, the current record or None)"""
+        now = int(time.time())
+        item = {'cache_key': self.cache_key, 'state': 'running', 'owner': self.owner,
+                'created_at': now, 'expires_at': now + FLIGHT_LEASE_SECONDS}
+        if self.fingerprint is not None:
+            item['fingerprint'] = self.fingerprint
+        try:
+            # Finished and lapsed records can be replaced; DynamoDB TTL deletion is lazy
+            previous = self.table.put_item(
+                Item=item,
+                ConditionExpression='attribute_not_exists(#key) OR #expires <= :now',
+                ExpressionAttributeNames={'#key': 'cache_key', '#expires': 'expires_at'},
+                ExpressionAttributeValues={':now': now},
+                ReturnValues='ALL_OLD'
+            ).get('Attributes')
+            # A lapsed running lease means its holder died mid-run
+            self.took_over = bool(previous) and previous.get('state') == 'running'
+            return True, None
+        except Exception as e:
+            if error_code(e) != 'ConditionalCheckFailedException':
+                raise
+        record = self.table.get_item(Key={'cache_key': self.cache_key}, ConsistentRead=True).get('Item')
+        if record is not None and int(record.get('expires_at', 0)) <= now:
+            # Lapsed between the put and the read; retry the put
+            return False, None
+        return False, record
+
+    def _update_owned(self, assignments, values):
+        names = {'#owner': 'owner'}
+        for name in assignments:
+            names[f'#{name}'] = name
+        values = dict(values, **{':owner': self.owner})
+        self.table.update_item(
+            Key={'cache_key': self.cache_key},
+            UpdateExpression='SET ' + ', '.join(f'#{name} = :{name}' for name in assignments),
+            ConditionExpression='#owner = :owner',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+
+    def start_renewal(self):
+        def renew():
+            while not self._stop.wait(FLIGHT_LEASE_SECONDS / 3):
+                try:
+                    self._update_owned(['expires_at'], {':expires_at': int(time.time()) + FLIGHT_LEASE_SECONDS})
+                except Exception as e:
+                    print(f"Single-flight lease renewal failed: {e}")
+        self._renewer = threading.Thread(target=renew, daemon=True)
+        self._renewer.start()
+
+    def stop_renewal(self):
+        self._stop.set()
+        if self._renewer:
+            self._renewer.join()
+
+    def publish(self, result, retention_seconds):
+        """Mark the flight done with its result so waiters and later retries can replay it"""
+        payload = zlib.compress(json.dumps(result, default=str).encode('utf-8'))
+        values = {':state': 'done', ':expires_at': int(time.time()) + retention_seconds}
+        assignments = ['state', 'expires_at']
+        if len(payload) <= MAX_RESULT_BYTES:
+            values[':result'] = payload
+            assignments.append('result')
+        else:
+            print(f"Single-flight result too large to share ({len(payload)} bytes)")
+        try:
+            self._update_owned(assignments, values)
+        except Exception as e:
+            _count('errors')
+            print(f"Single-flight publish failed: {e}")
+
+    def release(self):
+        """Drop the lease after a failure so a waiting request can take over at once"""
+        try:
+            self.table.delete_item(
+                Key={'cache_key': self.cache_key},
+                ConditionExpression='#owner = :owner',
+                ExpressionAttributeNames={'#owner': 'owner'},
+                ExpressionAttributeValues={':owner': self.owner}
+            )
+        except Exception as e:
+            print(f"Single-flight release failed: {e}")
+
+def get_flight_stats():
+    """Snapshot of single-flight counters for this container"""
+    with _lock:
+        stats = dict(flight_stats)
+        stats['in_flight'] = len(_flights)
+    return stats
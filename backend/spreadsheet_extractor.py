@@ -0,0 +1,301 @@
+import io
+import re
+import csv
+import time
+import zipfile
+from datetime import datetime, timedelta
+from xml.etree.ElementTree import iterparse
+
+from rule_extractor import ROUNDING_PER_ITEM, header_fields, stated_totals
+from docx_extractor import iter_docx_rows
+
+XLSX_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CSV_TYPES = ('text/csv', 'application/csv', 'text/comma-separated-values')
+# Browsers on Windows label .csv files as Excel; the extension decides for these
+AMBIGUOUS_TYPES = ('application/vnd.ms-excel', 'application/octet-stream', 'text/plain', '')
+
+# The item table header must be within the first rows of the sheet
+HEADER_SCAN_ROWS = 50
+
+# Header cell text (lowercased, punctuation stripped) -> field; first match per column wins
+COLUMN_SYNONYMS = (
+    ('description', re.compile(r'^(?:item\s+)?(?:description|desc|particulars|details|product(?:\s+name)?|item(?:\s+name)?|goods|services?)$')),
+    ('quantity', re.compile(r'^(?:qty|quantity|quantities|units?|pcs|no\s+of\s+units)$')),
+    ('unit_price', re.compile(r'^(?:unit\s+(?:price|cost|rate)|price(?:\s+per\s+unit|\s+each|\s+unit)?|rate|each|u\s*price)(?:\s+\w{3})?$')),
+    ('total_amount', re.compile(r'^(?:(?:line\s+|item\s+|ext(?:ended)?\s+)?(?:total|amount)(?:\s+(?:price|amount))?|ext(?:ended)?\s+price|net\s+amount)(?:\s+\w{3})?$')),
+)
+TOTALS_ROW_PATTERN = re.compile(r'^\s*(sub[\s-]?total|grand\s+total|total(?:\s+amount)?|gst|vat|tax)\b', re.IGNORECASE)
+CSV_DELIMITERS = (',', ';', '\t', '|')
+# "1.234,50" style amounts from European exports
+DECIMAL_COMMA = re.compile(r'^-?\d{1,3}(?:\.\d{3})*,\d{1,2}$')
+# "12 pcs", "3 units": quantities often carry their unit
+TRAILING_UNIT = re.compile(r'(?<=\d)\s*[A-Za-z]{1,5}\.?$')
+NUMBER_CLEANUP = re.compile(r'(?:SGD|USD|MYR|EUR|GBP|AUD|RM|S\$|\$|€|£|,|\s)', re.IGNORECASE)
+# Excel stores dates as days since 1899-12-30; plausible quotation dates fall in this range
+EXCEL_EPOCH = datetime(1899, 12, 30)
+EXCEL_DATE_RANGE = (30000, 80000)
+
+_SPREADSHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_RELATIONSHIP_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PACKAGE_RELS_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+def spreadsheet_format(file_type, file_name=''):
+    """'xlsx', 'csv' or None for documents that take the text path"""
+    extension = file_name.lower().rsplit('.', 1)[-1] if '.' in file_name else ''
+    if file_type == XLSX_TYPE:
+        return 'xlsx'
+    if file_type in CSV_TYPES:
+        return 'csv'
+    if file_type in AMBIGUOUS_TYPES and extension in ('xlsx', 'csv'):
+        return extension
+    return None
+
+def parse_number(value):
+    """Spreadsheet cell to float; None for text and empty cells"""
+    if value is None:
+        return None
+    try:
+        # Plain numbers, the common case, skip the cleanup
+        return float(value)
+    except ValueError:
+        pass
+    text = TRAILING_UNIT.sub('', value.strip())
+    if DECIMAL_COMMA.match(text):
+        text = text.replace('.', '').replace(',', '.')
+    text = NUMBER_CLEANUP.sub('', text)
+    negative = text.startswith('(') and text.endswith(')')
+    try:
+        number = float(text.strip('()'))
+    except ValueError:
+        return None
+    return -number if negative else number
+
+def _normalise_header(value):
+    return re.sub(r'[^a-z0-9]+', ' ', str(value or '').lower()).strip()
+
+def detect_columns(row):
+    """Map a header row to {field: column index}, or None if it is not an item table header
+
+    A header needs a description column and at least two of quantity,
+    unit price and amount; the third is derived from the other two.
+    """
+    columns = {}
+    for index, cell in enumerate(row):
+        label = _normalise_header(cell)
+        if not label:
+            continue
+        for field, pattern in COLUMN_SYNONYMS:
+            if field not in columns and pattern.match(label):
+                columns[field] = index
+                break
+    if 'description' not in columns or len(columns) < 3:
+        return None
+    return columns
+
+def iter_csv_rows(file_content):
+    """Rows of a CSV file (bytes or a local path), read incrementally"""
+    raw = io.BytesIO(file_content) if isinstance(file_content, bytes) else open(file_content, 'rb')
+    with io.TextIOWrapper(raw, encoding='utf-8-sig', errors='replace', newline='') as stream:
+        # The delimiter found on the most lines wins; header blocks above the table often have none
+        lines = stream.read(8192).splitlines()[:-1] or ['']
+        stream.seek(0)
+        delimiter = max(CSV_DELIMITERS, key=lambda candidate: sum(1 for line in lines if candidate in line))
+        yield from csv.reader(stream, delimiter=delimiter)
+
+def _column_index(reference):
+    # "AB12" -> 27 (zero-based column of the cell reference)
+    index = 0
+    for char in reference:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - 64
+    return index - 1
+
+def _first_sheet_path(archive):
+    try:
+        with archive.open('xl/workbook.xml') as workbook:
+            first = next(element for _, element in iterparse(workbook) if element.tag == f'{_SPREADSHEET_NS}sheet')
+        relation = first.get(f'{_RELATIONSHIP_NS}id')
+        with archive.open('xl/_rels/workbook.xml.rels') as rels:
+            for _, element in iterparse(rels):
+                if element.tag == f'{_PACKAGE_RELS_NS}Relationship' and element.get('Id') == relation:
+                    target = element.get('Target')
+                    return target.lstrip('/') if target.startswith('/') else f"xl/{target}"
+    except (KeyError, StopIteration):
+        pass
+    return 'xl/worksheets/sheet1.xml'
+
+def _shared_strings(archive):
+    strings = []
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return strings
+    with archive.open('xl/sharedStrings.xml') as source:
+        for _, element in iterparse(source):
+            if element.tag == f'{_SPREADSHEET_NS}si':
+                strings.append(''.join(text.text or '' for text in element.iter(f'{_SPREADSHEET_NS}t')))
+                element.clear()
+    return strings
+
+def iter_xlsx_rows(file_content):
+    """Rows of the first worksheet of an .xlsx file (bytes or a local path)
+
+    The sheet XML is parsed incrementally and each row is discarded once
+    read, so memory stays flat however many rows the sheet has. Only the
+    shared string table is held in full, as Excel requires.
+    """
+    with zipfile.ZipFile(io.BytesIO(file_content) if isinstance(file_content, bytes) else file_content) as archive:
+        strings = _shared_strings(archive)
+        with archive.open(_first_sheet_path(archive)) as sheet:
+            sheet_data = None
+            for event, element in iterparse(sheet, events=('start', 'end')):
+                if event == 'start':
+                    if element.tag == f'{_SPREADSHEET_NS}sheetData':
+                        sheet_data = element
+                    continue
+                if element.tag != f'{_SPREADSHEET_NS}row':
+                    continue
+                row = []
+                for cell in element.iter(f'{_SPREADSHEET_NS}c'):
+                    kind = cell.get('t')
+                    value_element = cell.find(f'{_SPREADSHEET_NS}v')
+                    if kind == 'inlineStr':
+                        value = ''.join(text.text or '' for text in cell.iter(f'{_SPREADSHEET_NS}t'))
+                    elif value_element is None or value_element.text is None:
+                        continue
+                    elif kind == 's':
+                        value = strings[int(value_element.text)]
+                    elif kind in ('str', 'e', 'b', 'd'):
+                        value = value_element.text
+                    else:
+                        value = float(value_element.text)
+                    column = _column_index(cell.get('r', '')) if cell.get('r') else len(row)
+                    row.extend([None] * (column - len(row)))
+                    row.append(value)
+                yield row
+                # Processed rows are dropped so the tree never grows
+                if sheet_data is not None:
+                    sheet_data.clear()
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else str(value)
+    return str(value).strip()
+
+def _header_date(value):
+    # Serial dates next to a "Date" label become YYYY-MM-DD
+    if isinstance(value, float) and EXCEL_DATE_RANGE[0] <= value <= EXCEL_DATE_RANGE[1]:
+        return (EXCEL_EPOCH + timedelta(days=int(value))).strftime('%Y-%m-%d')
+    return _cell_text(value)
+
+def _row_line(row):
+    """A non-table row as a text line the header patterns understand ("Label: value")"""
+    cells = [cell for cell in row if cell not in (None, '')]
+    if len(cells) >= 2 and isinstance(cells[0], str) and 'date' in cells[0].lower():
+        cells[1] = _header_date(cells[1])
+    texts = [_cell_text(cell) for cell in cells]
+    if len(texts) == 2 and not texts[0].endswith(':'):
+        return f"{texts[0]}: {texts[1]}"
+    return ' | '.join(texts)
+
+def _column(row, columns, field):
+    index = columns.get(field)
+    return row[index] if index is not None and index < len(row) else None
+
+def _item(row, columns):
+    description = _cell_text(_column(row, columns, 'description'))
+    quantity, unit_price, total = (parse_number(_column(row, columns, field)) for field in ('quantity', 'unit_price', 'total_amount'))
+    if quantity is None and unit_price is None and total is None:
+        return None
+    if total is None and quantity is not None and unit_price is not None:
+        total = round(quantity * unit_price, 2)
+    elif unit_price is None and quantity and total is not None:
+        unit_price = round(total / quantity, 4)
+    elif quantity is None and unit_price and total is not None:
+        quantity = round(total / unit_price, 4)
+    return {
+        'description': description,
+        'quantity': quantity or 0,
+        'unit_price': unit_price or 0,
+        'total_amount': total or 0
+    }
+
+ROW_READERS = {'xlsx': iter_xlsx_rows, 'csv': iter_csv_rows, 'docx': iter_docx_rows}
+
+def extract_spreadsheet(file_content, fmt, metrics=None):
+    """Map a CSV/XLSX quotation, or the item tables of a Word one ('docx'), straight to the extraction shape
+
+    Returns (data, text, checks). data is None when no item table header
+    was found; text (rows as "a | b | c" lines) then goes down the normal
+    text path instead. Header fields come from the rows around the table.
+    Word tables are only trusted when their items add up to a subtotal
+    stated in the document.
+    """
+    started = time.perf_counter()
+    rows = ROW_READERS[fmt](file_content)
+    # Each Word table needs its own header row, wherever it is in the document
+    per_table = fmt == 'docx'
+    scan_rows = None if per_table else HEADER_SCAN_ROWS
+    lines = []
+    other_lines = []
+    items = []
+    totals = {}
+    columns = None
+    header_columns = None
+    header_row = None
+    row_count = 0
+    for row_count, row in enumerate(rows, start=1):
+        if not row and per_table:
+            columns = None
+            continue
+        if not any(cell not in (None, '') for cell in row):
+            continue
+        line = _row_line(row)
+        lines.append(line)
+        if columns is None:
+            if scan_rows is None or row_count <= scan_rows:
+                columns = detect_columns(row)
+                if columns is not None:
+                    header_row = header_row or row_count
+                    header_columns = header_columns or columns
+                    continue
+            other_lines.append(line)
+            continue
+        label = next((cell for cell in row if isinstance(cell, str) and cell.strip()), '')
+        # An item that merely starts with "Tax" or "Total" still has a quantity
+        totals_label = TOTALS_ROW_PATTERN.match(label)
+        if totals_label and parse_number(_column(row, columns, 'quantity')) is None:
+            amounts = [number for number in map(parse_number, row) if number is not None]
+            if amounts:
+                kind = totals_label.group(1).lower()
+                name = 'subtotal' if kind.startswith('sub') else 'total' if 'total' in kind else 'tax'
+                totals[name] = amounts[-1]
+                continue
+        item = _item(row, columns)
+        if item is not None and item['description']:
+            items.append(item)
+        else:
+            other_lines.append(line)
+
+    text = '\n'.join(lines) + '\n'
+    checks = {'rows': row_count, 'header_row': header_row, 'columns': header_columns, 'items': len(items)}
+    if metrics is not None:
+        metrics.update({'format': fmt, 'rows': row_count, 'chars': len(text),
+                        'total_seconds': round(time.perf_counter() - started, 4)})
+    if not items:
+        return None, text, checks
+
+    other_text = '\n'.join(other_lines)
+    data = header_fields(other_text)
+    # Totals written as text ("Subtotal: 1,234.50  GST 9%: ...") rather than in their own cells
+    for name, value in zip(('subtotal', 'tax', 'total'), stated_totals(other_text)):
+        if value is not None:
+            totals.setdefault(name, value)
+    items_sum = round(sum(item['total_amount'] for item in items), 2)
+    subtotal = totals.get('subtotal', items_sum)
+    data.update({'items': items, 'subtotal': subtotal, 'tax': totals.get('tax', 0), 'total': totals.get('total', 0)})
+    checks['subtotal_matches'] = abs(items_sum - subtotal) <= max(0.01, ROUNDING_PER_ITEM * len(items))
+    if per_table and not ('subtotal' in totals and checks['subtotal_matches']):
+        return None, text, checks
+    return data, text, checks
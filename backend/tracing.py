@@ -0,0 +1,65 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Full documents, prompts and model payloads are only logged at LOG_LEVEL=DEBUG
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+_LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+
+def debug_enabled():
+    return _LEVELS.get(LOG_LEVEL, 20) <= _LEVELS['DEBUG']
+
+def log_debug(message):
+    """Print only at DEBUG level; pass a callable to skip building expensive messages otherwise"""
+    if debug_enabled():
+        print(message() if callable(message) else message)
+
+class RequestTrace:
+    """Wall-clock time per pipeline stage plus byte/token counters for one request
+
+    A stage that runs several times (e.g. one Bedrock call per chunk) accumulates
+    its time and call count. Safe to share with worker threads.
+    """
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        with self._lock:
+            stage = self.stages.setdefault(name, {'ms': 0.0, 'count': 0})
+            stage['ms'] += seconds * 1000
+            stage['count'] += 1
+
+    def count(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + (value or 0)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'total_ms': round((time.perf_counter() - self.started) * 1000, 1),
+                'stages': {name: {'ms': round(stage['ms'], 1), 'count': stage['count']} for name, stage in self.stages.items()},
+                'counters': dict(self.counters)
+            }
+
+    def emit(self, **fields):
+        """Print the trace as one structured log line"""
+        record = {'type': 'request_trace', 'request_id': self.request_id}
+        record.update(fields)
+        record.update(self.to_dict())
+        print(json.dumps(record, default=str))
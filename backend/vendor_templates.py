@@ -0,0 +1,352 @@
+import os
+import re
+import json
+import time
+import threading
+
+from rule_extractor import EMAIL_PATTERN, COMPANY_PATTERN, DATE_VALUE_PATTERN, check_extraction, normalize_date
+
+# Layout templates learned from successful model extractions, stored per vendor
+# in the extraction cache table under "template#<vendor>"
+TEMPLATE_TTL_SECONDS = int(os.environ.get('TEMPLATE_TTL_SECONDS', str(90 * 24 * 3600)))
+# Vendors without a template are not looked up again for this long
+TEMPLATE_MISS_TTL_SECONDS = int(os.environ.get('TEMPLATE_MISS_TTL_SECONDS', '300'))
+MAX_TEMPLATES_PER_VENDOR = 3
+# Share of layout labels two documents must have in common to try a template
+MIN_LABEL_SIMILARITY = 0.7
+# Our own addresses appear on every quotation, so they never identify the vendor
+BUYER_EMAIL_DOMAINS = tuple(d.strip().lower() for d in os.environ.get('BUYER_EMAIL_DOMAINS', 'axrail.com').split(','))
+# Shared mailbox providers are used by many small vendors, so they are keyed by company name instead
+FREE_MAIL_DOMAINS = tuple(d.strip().lower() for d in os.environ.get(
+    'FREE_MAIL_DOMAINS',
+    'gmail.com,googlemail.com,yahoo.com,yahoo.com.sg,hotmail.com,outlook.com,live.com,msn.com,icloud.com,me.com,'
+    'aol.com,protonmail.com,proton.me,gmx.com,mail.com,zoho.com,qq.com,163.com,126.com,singnet.com.sg,'
+    'pacific.net.sg,starhub.net.sg'
+).split(','))
+
+# Fields that are the same on every quotation from a vendor are stored as learned values
+LITERAL_FIELDS = ('company_name', 'email', 'phone', 'address', 'buyer_name', 'buyer_address')
+# Fields that change per document are found again next to the label they followed
+ANCHORED_TEXT_FIELDS = ('quote_number', 'date')
+ANCHORED_AMOUNT_FIELDS = ('subtotal', 'tax', 'total')
+
+_NUMBER = r'\d[\d,]*(?:\.\d+)?'
+# "Quotation No:", "GST 9%:", "Payment terms:" - up to five words before a colon
+LABEL_PATTERN = re.compile(r'([A-Za-z][A-Za-z.#%&()/-]*(?: [A-Za-z0-9.#%&()/-]+){0,4})\s*:')
+_TEXT_VALUE = r'([^|\n]+?)(?=\s{2,}|\s*\||[ \t]*(?:\n|$))'
+
+_templates = {}
+_templates_lock = threading.Lock()
+template_stats = {}
+
+def vendor_key(text):
+    """Vendor identity from the document itself: the sender's company email domain, else company name"""
+    head = text[:4000]
+    for email in EMAIL_PATTERN.findall(head):
+        domain = email.rsplit('@', 1)[1].lower()
+        if domain not in BUYER_EMAIL_DOMAINS and domain not in FREE_MAIL_DOMAINS:
+            return domain
+    company = COMPANY_PATTERN.search(head)
+    if company:
+        return re.sub(r'[^a-z0-9]+', '-', company.group(1).lower()).strip('-')
+    return None
+
+def layout_labels(text):
+    """Normalised field labels of a document; documents from one template share nearly all of them"""
+    labels = set()
+    for match in LABEL_PATTERN.finditer(text):
+        labels.add(re.sub(r'\d+', '9', match.group(1).lower()))
+    return labels
+
+def _normalise(value):
+    return ' '.join(str(value).split()).lower()
+
+def _vendor_literal_found(template, text):
+    """The learned email or company name must be on the document, or the key matched another vendor"""
+    document = _normalise(text)
+    literals = template['literals']
+    return any(_normalise(literals.get(field) or '') in document
+               for field in ('email', 'company_name') if _normalise(literals.get(field) or ''))
+
+def _similarity(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+def _number_strings(value, money=False):
+    value = float(value)
+    strings = [f"{value:,.2f}", f"{value:.2f}"]
+    if not money and value == int(value):
+        strings.insert(0, str(int(value)))
+    return list(dict.fromkeys(strings))
+
+def _find_number(line, strings, end):
+    """Rightmost occurrence before end that is a whole number token; returns (start, stop) or None"""
+    for string in strings:
+        position = line.rfind(string, 0, end)
+        while position >= 0:
+            stop = position + len(string)
+            before = line[position - 1] if position else ' '
+            after = line[stop] if stop < len(line) else ' '
+            if not (before.isdigit() or before in '.,') and not (after.isdigit() or after in '.,'):
+                return position, stop
+            position = line.rfind(string, 0, position)
+    return None
+
+def _separator_regex(separator):
+    if not separator:
+        return ''
+    parts = []
+    whitespace_only = not separator.strip()
+    for token in re.split(r'(\s+)', separator):
+        if not token:
+            continue
+        if token.isspace():
+            parts.append(r'\s+' if whitespace_only else r'\s*')
+        elif token.isalpha():
+            # Units such as "pcs" or "ea" vary from row to row
+            parts.append(r'[A-Za-z]*')
+        else:
+            parts.append(re.escape(token))
+    return ''.join(parts)
+
+def _row_pattern(line, item):
+    total = _find_number(line, _number_strings(item.get('total_amount') or 0, money=True), len(line))
+    if not total:
+        return None
+    unit = _find_number(line, _number_strings(item.get('unit_price') or 0, money=True), total[0])
+    if not unit:
+        return None
+    quantity = _find_number(line, _number_strings(item.get('quantity') or 0), unit[0])
+    if not quantity:
+        return None
+    prefix = line[:quantity[0]]
+    lead = re.search(r'[^\w.]*$', prefix).group(0)
+    if not re.search(r'[A-Za-z]', prefix):
+        return None
+    return (r'^\s*(?P<desc>.*?[A-Za-z].*?)' + _separator_regex(lead)
+            + r'(?P<qty>' + _NUMBER + r')' + _separator_regex(line[quantity[1]:unit[0]])
+            + r'(?P<unit>' + _NUMBER + r')' + _separator_regex(line[unit[1]:total[0]])
+            + r'(?P<total>' + _NUMBER + r')' + _separator_regex(line[total[1]:].rstrip()) + r'\s*$')
+
+def _to_number(value):
+    return float(value.replace(',', ''))
+
+def parse_rows(pattern, lines):
+    row = re.compile(pattern)
+    items = []
+    indexes = []
+    for index, line in enumerate(lines):
+        match = row.match(line)
+        if match:
+            items.append({
+                'description': match.group('desc').strip(),
+                'quantity': _to_number(match.group('qty')),
+                'unit_price': _to_number(match.group('unit')),
+                'total_amount': _to_number(match.group('total'))
+            })
+            indexes.append(index)
+    return items, indexes
+
+def _learn_anchor(lines, strings):
+    """Label text directly before the first occurrence of a value, e.g. "Quotation No:" """
+    for string in strings:
+        if not string:
+            continue
+        for line in lines:
+            position = line.find(string)
+            stop = position + len(string)
+            # The value must be a whole token, not part of a longer word or number
+            if position <= 0 or line[position - 1].isalnum() or (stop < len(line) and line[stop].isalnum()):
+                continue
+            anchor = re.split(r'\s{2,}|\|', line[:position])[-1].strip()
+            if re.search(r'[A-Za-z]', anchor):
+                return anchor
+    return None
+
+def _source_strings(field, value, text):
+    """How an extracted value is printed in the text; the model normalises dates and tidies quote numbers"""
+    if not value:
+        return []
+    strings = [value]
+    if field == 'date':
+        strings += [printed for printed in DATE_VALUE_PATTERN.findall(text) if normalize_date(printed) == value]
+    else:
+        # "Q-6489" or "Q 6489" in the document for a model's "Q6489"
+        characters = [re.escape(character) for character in value if character.isalnum()]
+        if characters:
+            strings += [match.group(0) for match in re.finditer(r'[\s#./-]*'.join(characters), text, re.IGNORECASE)]
+    return list(dict.fromkeys(strings))
+
+def _anchor_regex(anchor, value_regex):
+    # A leading letter must not continue a longer word ("Total:" inside "Subtotal:")
+    guard = r'(?<![A-Za-z])' if anchor[0].isalpha() else ''
+    return guard + re.escape(anchor) + r'\s*' + value_regex
+
+def build_template(text, extracted_data):
+    """Learn a template from a trusted extraction; None unless it reproduces that extraction"""
+    lines = text.splitlines()
+    items = extracted_data.get('items') or []
+    if not items:
+        return None
+
+    item_pattern = None
+    for item in items[:5]:
+        for line in lines:
+            candidate = _row_pattern(line, item)
+            if not candidate:
+                continue
+            parsed, _ = parse_rows(candidate, lines)
+            if len(parsed) == len(items) and all(
+                abs(a['total_amount'] - float(b.get('total_amount') or 0)) < 0.01 for a, b in zip(parsed, items)
+            ):
+                item_pattern = candidate
+                break
+        if item_pattern:
+            break
+    if not item_pattern:
+        return None
+
+    anchors = {}
+    for field in ANCHORED_TEXT_FIELDS:
+        anchors[field] = _learn_anchor(lines, _source_strings(field, str(extracted_data.get(field) or ''), text))
+    for field in ANCHORED_AMOUNT_FIELDS:
+        value = extracted_data.get(field)
+        anchors[field] = _learn_anchor(lines, _number_strings(value, money=True)) if value else None
+
+    template = {
+        'labels': sorted(layout_labels(text)),
+        'item_pattern': item_pattern,
+        'anchors': anchors,
+        'literals': {field: extracted_data.get(field) or '' for field in LITERAL_FIELDS},
+        # A field the model found must be found again, or the template is missing it silently
+        'required_fields': [field for field in ANCHORED_TEXT_FIELDS if extracted_data.get(field)],
+        'learned_at': int(time.time())
+    }
+    # The template has to reproduce what it was learned from
+    data, valid, _ = apply_template(template, text)
+    if not valid:
+        return None
+    return template
+
+def apply_template(template, text):
+    """Parse text with a template; returns (data, valid, checks)
+
+    Valid means the learned email or company name appears in the text, the
+    quote number and date are found wherever the model found them, every
+    row's arithmetic holds, no priced line in the table was skipped, and the
+    rows add up to the anchored subtotal or total. Dates are returned as
+    YYYY-MM-DD, as the model returns them.
+    """
+    lines = text.splitlines()
+    items, indexes = parse_rows(template['item_pattern'], lines)
+    data = dict(template['literals'])
+    anchors = template['anchors']
+    for field in ANCHORED_TEXT_FIELDS:
+        value_regex = DATE_VALUE_PATTERN.pattern if field == 'date' else _TEXT_VALUE
+        match = re.search(_anchor_regex(anchors[field], value_regex), text) if anchors.get(field) else None
+        data[field] = match.group(1).strip() if match else ''
+    data['date'] = normalize_date(data['date']) if data['date'] else ''
+    amounts = {}
+    for field in ANCHORED_AMOUNT_FIELDS:
+        amounts[field] = None
+        if anchors.get(field):
+            for match in re.finditer(_anchor_regex(anchors[field], r'(' + _NUMBER + r')'), text):
+                amounts[field] = _to_number(match.group(1))
+    items_sum = round(sum(item['total_amount'] for item in items), 2)
+    data.update({
+        'items': items,
+        'subtotal': amounts['subtotal'] if amounts['subtotal'] is not None else items_sum,
+        'tax': amounts['tax'] or 0,
+        'total': amounts['total'] or 0
+    })
+
+    checks = check_extraction(lines, items, indexes, amounts['subtotal'], amounts['tax'], amounts['total'])
+    checks['vendor_literal_found'] = _vendor_literal_found(template, text)
+    # Templates stored before required_fields existed may have lost either field
+    checks['missing_fields'] = [field for field in template.get('required_fields', ANCHORED_TEXT_FIELDS) if not data[field]]
+    valid = checks['vendor_literal_found'] and not checks['missing_fields'] and bool(items) and checks['items_consistent'] == 1.0 and checks['unmatched_priced_lines'] == 0 \
+        and (checks['subtotal_matches'] or checks['total_matches'])
+    return data, valid, checks
+
+def _stats(vendor):
+    return template_stats.setdefault(vendor, {'documents': 0, 'hits': 0, 'validation_failures': 0, 'learned': 0})
+
+def _load_templates(vendor, table):
+    now = time.time()
+    with _templates_lock:
+        cached = _templates.get(vendor)
+        if cached and cached[0] > now:
+            return cached[1]
+    templates = []
+    if table is not None:
+        try:
+            record = table.get_item(Key={'cache_key': f"template#{vendor}"}).get('Item')
+            if record and int(record.get('expires_at', 0)) > now:
+                templates = json.loads(record['templates'])
+        except Exception as e:
+            print(f"Template lookup failed: {e}")
+    ttl = TEMPLATE_TTL_SECONDS if templates else TEMPLATE_MISS_TTL_SECONDS
+    with _templates_lock:
+        _templates[vendor] = (now + ttl, templates)
+    return templates
+
+def match_template(text, table=None):
+    """Extract with the vendor's stored template; returns (data or None, vendor, checks)"""
+    vendor = vendor_key(text)
+    if not vendor:
+        return None, None, None
+    with _templates_lock:
+        _stats(vendor)['documents'] += 1
+    templates = _load_templates(vendor, table)
+    if not templates:
+        return None, vendor, None
+
+    labels = layout_labels(text)
+    candidates = sorted(templates, key=lambda t: _similarity(labels, set(t['labels'])), reverse=True)
+    checks = None
+    for template in candidates:
+        if _similarity(labels, set(template['labels'])) < MIN_LABEL_SIMILARITY:
+            break
+        data, valid, checks = apply_template(template, text)
+        if valid:
+            with _templates_lock:
+                _stats(vendor)['hits'] += 1
+            return data, vendor, checks
+    with _templates_lock:
+        _stats(vendor)['validation_failures'] += 1
+    return None, vendor, checks
+
+def learn_template(text, extracted_data, table=None):
+    """Store a template for this document's vendor layout after a trusted extraction"""
+    vendor = vendor_key(text)
+    if not vendor:
+        return False
+    template = build_template(text, extracted_data)
+    if template is None:
+        print(f"No template learned for {vendor}")
+        return False
+
+    templates = [t for t in _load_templates(vendor, table) if t['labels'] != template['labels']]
+    templates = ([template] + templates)[:MAX_TEMPLATES_PER_VENDOR]
+    now = time.time()
+    if table is not None:
+        try:
+            table.put_item(Item={
+                'cache_key': f"template#{vendor}",
+                'templates': json.dumps(templates),
+                'expires_at': int(now + TEMPLATE_TTL_SECONDS)
+            })
+        except Exception as e:
+            print(f"Template store failed: {e}")
+    with _templates_lock:
+        _templates[vendor] = (now + TEMPLATE_TTL_SECONDS, templates)
+        _stats(vendor)['learned'] += 1
+    print(f"Learned template for {vendor}")
+    return True
+
+def get_template_stats():
+    """Per-vendor documents seen, template hits and hit rate for this container"""
+    with _templates_lock:
+        return {
+            vendor: dict(stats, hit_rate=round(stats['hits'] / stats['documents'], 3) if stats['documents'] else 0.0)
+            for vendor, stats in template_stats.items()
+        }
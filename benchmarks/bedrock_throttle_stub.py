@@ -0,0 +1,101 @@
+"""Drive BedrockInvoker against a local stub that throttles on purpose.
+
+The stub accepts at most --capacity concurrent calls and raises a
+ThrottlingException-shaped error beyond that, so the AIMD limiter and the
+jittered retries can be exercised without AWS:
+
+    python benchmarks/bedrock_throttle_stub.py --requests 200 --callers 32 --capacity 6
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from bedrock_invoker import AdaptiveLimiter, BedrockInvoker
+
+class StubThrottlingException(Exception):
+    def __init__(self):
+        super().__init__("Too many requests, please wait before trying again.")
+        self.response = {'Error': {'Code': 'ThrottlingException'}}
+
+class _Body:
+    def __init__(self, payload):
+        self._payload = payload
+
+    def read(self):
+        return self._payload
+
+class ThrottlingBedrockStub:
+    """invoke_model stand-in with fixed concurrency capacity and latency"""
+
+    def __init__(self, capacity, latency_seconds):
+        self.capacity = capacity
+        self.latency_seconds = latency_seconds
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def invoke_model(self, modelId, body, **kwargs):
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.throttled += 1
+                raise StubThrottlingException()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency_seconds)
+            text = json.dumps({'items': [], 'total': 0})
+            return {'body': _Body(json.dumps({'content': [{'text': text}]}).encode())}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--callers', type=int, default=32)
+    parser.add_argument('--capacity', type=int, default=6)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--initial-concurrency', type=float, default=16)
+    args = parser.parse_args()
+
+    stub = ThrottlingBedrockStub(args.capacity, args.latency)
+    invoker = BedrockInvoker(
+        client=stub,
+        limiter=AdaptiveLimiter(initial=args.initial_concurrency, maximum=64),
+        backoff_base_seconds=0.02,
+        backoff_cap_seconds=0.5,
+        max_attempts=20
+    )
+
+    def call(_):
+        try:
+            invoker.invoke_model(modelId='stub', body='{}')
+            return True
+        except Exception:
+            return False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.callers) as pool:
+        succeeded = sum(pool.map(call, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        'requests': args.requests,
+        'succeeded': succeeded,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(args.requests / elapsed, 1),
+        'stub_capacity': args.capacity,
+        'stub_peak_in_flight': stub.peak_in_flight,
+        'stub_throttled': stub.throttled,
+        'invoker': invoker.get_metrics()
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
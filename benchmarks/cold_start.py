@@ -0,0 +1,87 @@
+"""Reproducible cold-start benchmark for the Lambda modules.
+
+Each run imports the handler modules in a fresh interpreter with
+``-X importtime`` and reports per-module import time (median and p99 across
+runs), so regressions in startup cost show up before deployment:
+
+    python benchmarks/cold_start.py --runs 20
+    python benchmarks/cold_start.py --modules document_processor simple_reports --top 15
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from collections import defaultdict
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_once(modules):
+    """Import modules in a fresh interpreter; returns (wall_ms, {module: cumulative_ms})"""
+    code = '; '.join(f'import {module}' for module in modules)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get('PYTHONPATH')]))
+    # Any region works; clients are not built at import time
+    env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line.replace('import time:', '', 1).split('|')
+        # Nesting is shown by indentation; the cumulative figure already includes children
+        cumulative[name.strip()] = int(cumulative_us) / 1000.0
+    return wall_ms, cumulative
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--modules', nargs='+', default=['document_processor', 'simple_reports'])
+    parser.add_argument('--top', type=int, default=10, help='slowest modules to list')
+    args = parser.parse_args()
+
+    wall = []
+    per_module = defaultdict(list)
+    for _ in range(args.runs):
+        wall_ms, cumulative = run_once(args.modules)
+        wall.append(wall_ms)
+        for name, ms in cumulative.items():
+            per_module[name].append(ms)
+
+    summary = {
+        name: {'median_ms': round(percentile(values, 50), 2), 'p99_ms': round(percentile(values, 99), 2)}
+        for name, values in per_module.items()
+    }
+    slowest = sorted(summary.items(), key=lambda kv: kv[1]['median_ms'], reverse=True)
+
+    print(json.dumps({
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'modules': {name: summary.get(name) for name in args.modules},
+        'interpreter_wall_ms': {
+            'median': round(percentile(wall, 50), 2),
+            'p99': round(percentile(wall, 99), 2)
+        },
+        'slowest_imports': dict(slowest[:args.top])
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""Synthetic quotation corpus for the offline benchmarks.
+
+Documents are generated deterministically (fixed seed per case) with
+fpdf2 and python-docx, the same libraries the Lambda layer ships;
+spreadsheet quotations (CSV, XLSX) use only the standard library.
+Every page carries a repeated header/footer and terms-and-conditions
+filler, like real supplier quotations.
+"""
+import csv
+import zlib
+import random
+import zipfile
+import textwrap
+from io import BytesIO, StringIO
+from xml.sax.saxutils import escape
+
+PDF_TYPE = 'application/pdf'
+DOCX_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# (pages, items) pairs spanning one-page quotes to 100+ page tenders
+DEFAULT_SIZES = [(1, 1), (1, 10), (5, 50), (20, 200), (50, 500), (120, 1000)]
+
+PRODUCTS = ['Ballpoint pen', 'A4 copier paper', 'Stapler', 'Whiteboard marker', 'Desk organiser',
+            'Laminating pouch', 'Ring binder', 'Sticky notes', 'Highlighter', 'Calculator']
+
+XLSX_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+XLSX_CONTENT_TYPES = (
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+    '</Types>'
+)
+XLSX_ROOT_RELS = (
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+XLSX_WORKBOOK_RELS = (
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
+    '</Relationships>'
+)
+
+TERMS = ("Prices are valid for 30 days from the date of this quotation. Delivery within 14 working days "
+         "of purchase order. Payment terms: 30 days net. Goods remain the property of the supplier until "
+         "paid in full. All prices exclude GST unless stated otherwise.")
+
+def make_items(count, seed):
+    rng = random.Random(seed)
+    items = []
+    for n in range(1, count + 1):
+        quantity = rng.randint(1, 50)
+        unit_price = round(rng.uniform(0.5, 250), 2)
+        items.append({
+            'code': f"ITEM-{n:04d}",
+            'description': f"{rng.choice(PRODUCTS)} model {rng.randint(100, 999)}",
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'total_amount': round(quantity * unit_price, 2)
+        })
+    return items
+
+def item_row(item):
+    return f"{item['code']} {item['description']} | {item['quantity']} | {item['unit_price']:.2f} | {item['total_amount']:.2f}"
+
+def _pages_of_items(items, pages):
+    per_page = -(-len(items) // pages) if items else 0
+    return [items[i * per_page:(i + 1) * per_page] for i in range(pages)]
+
+def _header_lines(quote_number, page, pages):
+    return [
+        'Benchmark Supplies Pte Ltd',
+        '1 Benchmark Road, Singapore 000001 | Tel: +65 6123 4567 | sales@benchmark-supplies.example',
+        f"Quotation No: {quote_number}    Date: 2024-01-31    Page {page} of {pages}"
+    ]
+
+def build_pdf(quote_number, items, pages):
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(False)
+    for page, page_items in enumerate(_pages_of_items(items, pages), start=1):
+        pdf.add_page()
+        pdf.set_font('Helvetica', '', 8)
+        for line in _header_lines(quote_number, page, pages):
+            pdf.cell(0, 5, line, 0, 1)
+        if page == 1:
+            pdf.cell(0, 5, 'To: Axrail Demo Pte Ltd, Changi Tower, 78909 Singapore', 0, 1)
+        pdf.cell(0, 5, 'Code Description | Qty | Unit Price | Amount', 0, 1)
+        # Long item tables shrink the row height to stay on the page
+        row_height = max(2.0, min(5.0, 200.0 / max(1, len(page_items))))
+        for item in page_items:
+            pdf.cell(0, row_height, item_row(item), 0, 1)
+        if page == pages:
+            subtotal = round(sum(item['total_amount'] for item in items), 2)
+            pdf.cell(0, 5, f"Subtotal: {subtotal:.2f}   GST 9%: {subtotal * 0.09:.2f}   Total: {subtotal * 1.09:.2f}", 0, 1)
+        pdf.set_y(-25)
+        pdf.multi_cell(0, 3, TERMS)
+    content = pdf.output(dest='S')
+    return content.encode('latin1') if isinstance(content, str) else bytes(content)
+
+def build_docx(quote_number, items, pages, tables=False):
+    """Word quotation; tables=True puts each page's items in a Word table, as most suppliers do"""
+    from docx import Document
+
+    doc = Document()
+    for page, page_items in enumerate(_pages_of_items(items, pages), start=1):
+        for line in _header_lines(quote_number, page, pages):
+            doc.add_paragraph(line)
+        if page == 1:
+            doc.add_paragraph('To: Axrail Demo Pte Ltd, Changi Tower, 78909 Singapore')
+        if tables:
+            table = doc.add_table(rows=len(page_items) + 1, cols=5)
+            for cell, text in zip(table.rows[0].cells, ('Code', 'Description', 'Qty', 'Unit Price', 'Amount')):
+                cell.text = text
+            for row, item in zip(table.rows[1:], page_items):
+                for cell, text in zip(row.cells, (item['code'], item['description'], str(item['quantity']),
+                                                  f"{item['unit_price']:.2f}", f"{item['total_amount']:.2f}")):
+                    cell.text = text
+        else:
+            doc.add_paragraph('Code Description | Qty | Unit Price | Amount')
+            for item in page_items:
+                doc.add_paragraph(item_row(item))
+        if page == pages:
+            subtotal = round(sum(item['total_amount'] for item in items), 2)
+            doc.add_paragraph(f"Subtotal: {subtotal:.2f}   GST 9%: {subtotal * 0.09:.2f}   Total: {subtotal * 1.09:.2f}")
+        doc.add_paragraph(TERMS)
+        if page < pages:
+            doc.add_page_break()
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+def spreadsheet_rows(quote_number, items):
+    """Rows of a supplier's spreadsheet quotation: header block, item table, totals"""
+    subtotal = round(sum(item['total_amount'] for item in items), 2)
+    rows = [
+        ['Benchmark Supplies Pte Ltd'],
+        ['1 Benchmark Road, Singapore 000001'],
+        ['Tel', '+65 6123 4567'],
+        ['Email', 'sales@benchmark-supplies.example'],
+        ['Quotation No', quote_number],
+        ['Date', '2024-01-31'],
+        ['To', 'Axrail Demo Pte Ltd, Changi Tower, 78909 Singapore'],
+        [],
+        ['Code', 'Description', 'Qty', 'Unit Price', 'Amount']
+    ]
+    rows.extend([item['code'], item['description'], item['quantity'], item['unit_price'], item['total_amount']] for item in items)
+    rows.extend([[], ['', 'Subtotal', '', '', subtotal], ['', 'GST 9%', '', '', round(subtotal * 0.09, 2)],
+                 ['', 'Total', '', '', round(subtotal * 1.09, 2)]])
+    return rows
+
+def build_csv(quote_number, items):
+    buffer = StringIO()
+    csv.writer(buffer).writerows(spreadsheet_rows(quote_number, items))
+    return buffer.getvalue().encode('utf-8')
+
+def build_xlsx(quote_number, items):
+    """Minimal .xlsx (shared strings, one sheet) written with the standard library"""
+    strings = {}
+    sheet_rows = []
+    for number, row in enumerate(spreadsheet_rows(quote_number, items), start=1):
+        cells = []
+        for column, value in enumerate(row):
+            reference = f"{chr(65 + column)}{number}"
+            if isinstance(value, str):
+                index = strings.setdefault(escape(value), len(strings))
+                cells.append(f'<c r="{reference}" t="s"><v>{index}</v></c>')
+            else:
+                cells.append(f'<c r="{reference}"><v>{value}</v></c>')
+        sheet_rows.append(f'<row r="{number}">{"".join(cells)}</row>')
+    namespace = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', XLSX_ROOT_RELS)
+        archive.writestr('xl/workbook.xml', f'<workbook {namespace} xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                                            '<sheets><sheet name="Quotation" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        archive.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        archive.writestr('xl/sharedStrings.xml', f'<sst {namespace} count="{len(strings)}" uniqueCount="{len(strings)}">'
+                                                 + ''.join(f'<si><t>{text}</t></si>' for text in strings) + '</sst>')
+        archive.writestr('xl/worksheets/sheet1.xml', f'<worksheet {namespace}><sheetData>{"".join(sheet_rows)}</sheetData></worksheet>')
+    return buffer.getvalue()
+
+def build_text(quote_number, items, pages):
+    """The text extract_text returns for build_pdf output, without needing fpdf or PyPDF2"""
+    page_texts = []
+    for page, page_items in enumerate(_pages_of_items(items, pages), start=1):
+        lines = _header_lines(quote_number, page, pages)
+        if page == 1:
+            lines.append('To: Axrail Demo Pte Ltd, Changi Tower, 78909 Singapore')
+        lines.append('Code Description | Qty | Unit Price | Amount')
+        lines.extend(item_row(item) for item in page_items)
+        if page == pages:
+            subtotal = round(sum(item['total_amount'] for item in items), 2)
+            lines.append(f"Subtotal: {subtotal:.2f}   GST 9%: {subtotal * 0.09:.2f}   Total: {subtotal * 1.09:.2f}")
+        lines.extend(textwrap.wrap(TERMS, 100))
+        page_texts.append('\n'.join(lines) + '\n')
+    return '\f'.join(page_texts)
+
+def build_case(fmt, pages, item_count, seed=0):
+    """Return a corpus case dict with the document bytes and its ground-truth items"""
+    quote_number = f"Q{pages:03d}{item_count:04d}{fmt[0].upper()}"
+    # str hashes are salted per process, so derive the seed from the case itself
+    items = make_items(item_count, seed=zlib.crc32(f"{fmt}-{pages}-{item_count}-{seed}".encode()))
+    builder = build_pdf if fmt == 'pdf' else build_docx
+    return {
+        'name': f"{fmt}-{pages}p-{item_count}i",
+        'format': fmt,
+        'pages': pages,
+        'items': items,
+        'file_name': f"{quote_number}.{fmt}",
+        'file_type': PDF_TYPE if fmt == 'pdf' else DOCX_TYPE,
+        'content': builder(quote_number, items, pages)
+    }
+
+def build_corpus(sizes=None, formats=('pdf', 'docx')):
+    return [build_case(fmt, pages, item_count) for pages, item_count in (sizes or DEFAULT_SIZES) for fmt in formats]
@@ -0,0 +1,119 @@
+"""Word (DOCX) text extraction benchmark: python-docx paragraphs vs the streaming reader.
+
+Builds Word quotations whose items sit in tables (one per page), from a
+one-page quote to a long tender, and reports for each extractor the time,
+peak traced memory and how many item rows reach the text; then the
+end-to-end handler time with the local stand-ins, the extraction path and
+Bedrock calls:
+
+    python benchmarks/docx_ingest.py --sizes 1x10 20x200 120x1000 400x5000
+
+The python_docx figures reproduce the previous extract_text branch
+(Document(...).paragraphs concatenated with +=), python_docx_tables adds
+the table rows with python-docx; both need python-docx, which the corpus
+builder uses anyway. Only the dynamodb sink is written so
+the PO PDF does not dominate the end-to-end figure.
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import tracemalloc
+from contextlib import redirect_stdout
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'backend'))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('DOCS_BUCKET', 'benchmark-docs')
+os.environ.setdefault('ARTIFACT_SINKS', 'dynamodb')
+
+import corpus
+import local_aws
+
+class _Context:
+    function_name = 'quotation-processor-benchmark'
+    aws_request_id = 'docx-benchmark'
+
+def python_docx_text(content):
+    from docx import Document
+
+    doc = Document(io.BytesIO(content))
+    text = ""
+    for paragraph in doc.paragraphs:
+        text += paragraph.text + "\n"
+    return text
+
+def python_docx_tables_text(content):
+    """python-docx with the tables added, the obvious fix to the old branch"""
+    from docx import Document
+
+    doc = Document(io.BytesIO(content))
+    lines = [paragraph.text for paragraph in doc.paragraphs]
+    for table in doc.tables:
+        for row in table.rows:
+            lines.append(' | '.join(cell.text for cell in row.cells))
+    return '\n'.join(lines) + '\n'
+
+def measure(extract, content, items):
+    """Time, peak traced memory and item rows present in the text for one extractor"""
+    started = time.perf_counter()
+    text = extract(content)
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    extract(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'ms': round(seconds * 1000, 1),
+        'peak_mb': round(peak / 1024 / 1024, 2),
+        'chars': len(text),
+        'item_rows_in_text': sum(1 for item in items if item['code'] in text)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=['1x10', '20x200', '120x1000', '400x5000'], help='PAGESxITEMS')
+    args = parser.parse_args()
+
+    import document_processor
+    import docx_extractor
+
+    aws = local_aws.install()
+    results = {}
+    for size in args.sizes:
+        pages, item_count = (int(part) for part in size.split('x'))
+        items = corpus.make_items(item_count, seed=item_count)
+        content = corpus.build_docx(f"QD{pages}", items, pages, tables=True)
+
+        calls_before = aws['bedrock'].calls
+        event = {'httpMethod': 'POST', 'body': json.dumps({
+            'file': base64.b64encode(content).decode('ascii'),
+            'fileName': f"QD{pages}.docx",
+            'fileType': docx_extractor.DOCX_TYPE,
+            'skipCache': True
+        })}
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            response = document_processor.handler(event, _Context())
+        handler_ms = (time.perf_counter() - started) * 1000
+        body = json.loads(response['body'])
+
+        results[size] = {
+            'bytes': len(content),
+            'python_docx': measure(python_docx_text, content, items),
+            'python_docx_tables': measure(python_docx_tables_text, content, items),
+            'streaming': measure(docx_extractor.extract_docx, content, items),
+            'handler_ms': round(handler_ms, 1),
+            'path': body.get('extraction', {}).get('path'),
+            'items_ok': len((body.get('extractedData') or {}).get('items') or []) == item_count,
+            'bedrock_calls': aws['bedrock'].calls - calls_before
+        }
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""Bulk export benchmark: rows per second, memory and resume of CSV/Parquet exports.
+
+Fills the local DynamoDB stand-in with processed quotations and their line
+items, then for each QUOTATIONSxITEMS size exports them with a parallel
+scan into S3 multipart uploads, reporting rows per second, parts and peak
+traced memory next to the single StringIO + put_object approach of the
+per-quotation CSV report applied to the whole table:
+
+    python benchmarks/export_throughput.py --sizes 500x20 5000x20 20000x20
+
+--resume exports the largest size again through the handler, with the time
+budget at zero (every run pauses after its first checkpoint and re-invokes
+itself) and an upload that fails once part way, resumed with
+{"action": "export", "resume": ...}; both must produce the same rows as the
+uninterrupted export. Parquet is included when pyarrow is installed.
+
+Without --read-latency-ms the stand-ins answer instantly and the figures
+are CPU cost only; with a realistic DynamoDB round trip (a few ms) the
+parallel segments and item lookups are what sets the rate.
+"""
+import io
+import os
+import sys
+import csv
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+from decimal import Decimal
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'backend'))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('DOCS_BUCKET', 'benchmark-docs')
+
+import corpus
+import local_aws
+
+class _Context:
+    function_name = 'quotation-processor-benchmark'
+    aws_request_id = 'export-benchmark'
+
+def populate(quotation_count, item_count, seed=0):
+    """Processed quotations over twelve months, plus a few unfinished async jobs the export must skip"""
+    import document_processor
+
+    rng = random.Random(seed)
+    headers = document_processor.get_quotations_table()
+    items_table = document_processor.get_items_table()
+    headers.items.clear()
+    headers.partitions.clear()
+    items_table.items.clear()
+    items_table.partitions.clear()
+    for n in range(quotation_count):
+        quotation_id = f"exp-{n:06d}"
+        if n % 100 == 99:
+            headers.put_item(Item={'quotation_id': quotation_id, 'status': 'queued', 'stage': 'extracting'})
+            continue
+        processed_at = f"2024-{1 + n % 12:02d}-{1 + n % 28:02d}T{n % 24:02d}:00:00.{n:06d}"
+        subtotal = Decimal(0)
+        for seq in range(item_count):
+            product, model = rng.choice(corpus.PRODUCTS), rng.randint(100, 999)
+            quantity, unit_price = rng.randint(1, 50), Decimal(str(round(rng.uniform(0.5, 250), 2)))
+            amount = unit_price * quantity
+            subtotal += amount
+            items_table.put_item(Item={'quotation_id': quotation_id, 'item_seq': seq, 'description': f"{product} model {model}",
+                                       'quantity': Decimal(quantity), 'unit_price': unit_price, 'total_amount': amount})
+        headers.put_item(Item={
+            'quotation_id': quotation_id, 'status': 'processed', 'company_name': f"Vendor {n % 97} Pte Ltd",
+            'quote_number': f"Q-{n}", 'date': '2024-01-31', 'processed_at': processed_at, 'processed_month': processed_at[:7],
+            'po_number': f"PO-20240131-{n:08x}", 'po_date': processed_at[:10], 'po_status': 'pending_approval',
+            'subtotal': subtotal, 'tax': (subtotal * Decimal('0.09')).quantize(Decimal('0.01')),
+            'total': (subtotal * Decimal('1.09')).quantize(Decimal('0.01')), 'items_count': item_count
+        })
+    return quotation_count - quotation_count // 100
+
+def single_put_export(bucket_name):
+    """Every row in one StringIO and one put_object, as the per-quotation CSV report does"""
+    import document_processor
+    from bulk_export import EXPORT_COLUMNS, HEADER_COLUMNS, ITEM_COLUMNS
+    from quotation_store import get_all_line_items
+
+    headers = document_processor.get_quotations_table()
+    items_table = document_processor.get_items_table()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    start_key = None
+    while True:
+        request = {'Limit': 100, 'FilterExpression': '#s = :p', 'ExpressionAttributeNames': {'#s': 'status'},
+                   'ExpressionAttributeValues': {':p': 'processed'}}
+        if start_key:
+            request['ExclusiveStartKey'] = start_key
+        response = headers.scan(**request)
+        for record in response['Items']:
+            header = [record.get(name) for name in HEADER_COLUMNS]
+            for item in get_all_line_items(items_table, record['quotation_id'], record.get('items_count')):
+                writer.writerow(header + [item.get(name) for name in ITEM_COLUMNS])
+        start_key = response.get('LastEvaluatedKey')
+        if not start_key:
+            break
+    document_processor.get_client('s3').put_object(Bucket=bucket_name, Key='exports/single.csv', Body=buffer.getvalue())
+
+def export_rows(aws, status, bucket_name):
+    """Sorted digest of the exported rows, whatever order the segments wrote them in"""
+    rows = []
+    for key in status['files']:
+        data = aws['s3'].get_object(Bucket=bucket_name, Key=key)['Body'].read()
+        if status['format'] == 'csv':
+            rows.extend(data.decode('utf-8').splitlines()[1:])
+        else:
+            import pyarrow.parquet as pq
+
+            rows.extend(json.dumps(row, default=str) for row in pq.read_table(io.BytesIO(data)).to_pylist())
+    rows.sort()
+    return len(rows), hashlib.sha256('\n'.join(rows).encode('utf-8')).hexdigest()
+
+def direct_export(export_format, bucket_name):
+    import document_processor
+    import bulk_export
+
+    status = bulk_export.create_export(document_processor.get_cache_table(), export_format)
+    return bulk_export.run_export(document_processor.get_cache_table(), document_processor.get_quotations_table(),
+                                  document_processor.get_items_table(), document_processor.get_client('s3'),
+                                  bucket_name, status['exportId'])
+
+def traced(run):
+    tracemalloc.start()
+    with redirect_stdout(io.StringIO()):
+        result = run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, round(peak / 1024 / 1024, 2)
+
+def handler_export(aws, body):
+    """POST an export, then run the async invocations it (and each paused run) queues until none are left"""
+    import document_processor
+
+    with redirect_stdout(io.StringIO()):
+        response = document_processor.handler({'httpMethod': 'POST', 'body': json.dumps(body)}, _Context())
+        export_id = json.loads(response['body'])['exportId']
+        while aws['lambda'].events:
+            document_processor.handler(aws['lambda'].events.pop(0), _Context())
+        response = document_processor.handler({'httpMethod': 'GET', 'queryStringParameters': {'exportId': export_id}}, _Context())
+    return json.loads(response['body'])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=['500x20', '5000x20', '20000x20'], help='QUOTATIONSxITEMS')
+    parser.add_argument('--resume', action='store_true', help='also interrupt and resume the largest size')
+    parser.add_argument('--read-latency-ms', type=float, default=0.0, help='simulated DynamoDB read round trip')
+    args = parser.parse_args()
+
+    import document_processor
+    import bulk_export
+
+    try:
+        import pyarrow
+        formats = ['csv', 'parquet']
+    except ImportError:
+        formats = ['csv']
+
+    aws = local_aws.install(read_latency=args.read_latency_ms / 1000)
+    spool = tempfile.TemporaryDirectory()
+    # Uploaded parts go to disk, so traced memory is the exporter's own
+    aws['s3'].spool_dir = spool.name
+    bucket_name = document_processor.get_docs_bucket()
+    results = {}
+    for size in args.sizes:
+        quotation_count, item_count = (int(part) for part in size.split('x'))
+        processed = populate(quotation_count, item_count)
+        result = {'rows_expected': processed * item_count}
+        for export_format in formats:
+            parts_before = aws['s3'].parts_uploaded
+            with redirect_stdout(io.StringIO()):
+                status = direct_export(export_format, bucket_name)
+            _, peak_mb = traced(lambda: direct_export(export_format, bucket_name))
+            result[export_format] = {
+                'rows': status['rows'],
+                'quotations': status['quotations'],
+                'rows_per_second': status['rowsPerSecond'],
+                'seconds': status['seconds'],
+                'mb': round(status['bytes'] / 1024 / 1024, 2),
+                'files': len(status['files']),
+                'parts': (aws['s3'].parts_uploaded - parts_before) // 2,
+                'peak_mb': peak_mb
+            }
+        started = time.perf_counter()
+        single_put_export(bucket_name)
+        seconds = time.perf_counter() - started
+        _, peak_mb = traced(lambda: single_put_export(bucket_name))
+        result['single_put_csv'] = {'rows_per_second': round(result['rows_expected'] / seconds, 1), 'peak_mb': peak_mb}
+        results[size] = result
+
+    if args.resume:
+        # Several Parquet files, so the failed upload hits a later file
+        bulk_export.EXPORT_PARQUET_FILE_ROWS = max(1, results[args.sizes[-1]]['rows_expected'] // 4)
+        for export_format in formats:
+            complete = handler_export(aws, {'action': 'export', 'format': export_format})
+            expected = export_rows(aws, complete, bucket_name)
+
+            # Every run pauses at its first checkpoint and hands over to a new invocation
+            bulk_export.EXPORT_TIME_BUDGET_SECONDS = 0
+            paused = handler_export(aws, {'action': 'export', 'format': export_format})
+            bulk_export.EXPORT_TIME_BUDGET_SECONDS = 240
+
+            # The second part upload fails; the export stops at its last checkpoint until resumed
+            upload_part = aws['s3'].upload_part
+            calls = []
+
+            def failing_upload_part(**kwargs):
+                calls.append(kwargs['PartNumber'])
+                if len(calls) == 2:
+                    raise ConnectionError('Connection reset by peer')
+                return upload_part(**kwargs)
+            aws['s3'].upload_part = failing_upload_part
+            failed = handler_export(aws, {'action': 'export', 'format': export_format})
+            aws['s3'].upload_part = upload_part
+            resumed = handler_export(aws, {'action': 'export', 'resume': failed['exportId']})
+
+            results[f"resume_{export_format}"] = {
+                'size': args.sizes[-1],
+                'rows': complete['rows'],
+                'paused_runs': paused['runs'],
+                'paused_same_rows': export_rows(aws, paused, bucket_name) == expected,
+                'failed_status': failed['status'],
+                'failed_rows_checkpointed': failed['rows'],
+                'resumed_status': resumed['status'],
+                'resumed_same_rows': export_rows(aws, resumed, bucket_name) == expected
+            }
+
+    spool.cleanup()
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,430 @@
+"""In-process stand-ins for S3, DynamoDB and Bedrock used by the benchmarks.
+
+install() swaps them into the lazily built clients of document_processor,
+simple_reports and bedrock_invoker, so the real handler runs unchanged
+without network access or AWS credentials.
+"""
+import io
+import os
+import re
+import json
+import time
+import uuid
+import zlib
+import bisect
+import hashlib
+import threading
+
+# Synthetic corpus rows look like "ITEM-0001 Widget A1 | 3 | 12.50 | 37.50"
+ITEM_ROW = re.compile(r'(ITEM-\d{4,}) ([^|\n]+?)\s*\|\s*(\d+)\s*\|\s*([\d.]+)\s*\|\s*([\d.]+)')
+QUOTE_NUMBER = re.compile(r'Quotation No:\s*(\S+)')
+TOTALS = re.compile(r'Subtotal:\s*([\d.]+)\s+GST \d+%:\s*([\d.]+)\s+Total:\s*([\d.]+)')
+
+class ConditionalCheckFailed(Exception):
+    response = {'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'The conditional request failed'}}
+
+class LocalS3:
+    """S3 stand-in; with spool_dir set, multipart parts are kept on disk instead of in memory"""
+
+    def __init__(self, spool_dir=None):
+        self.objects = {}
+        self.uploads = {}
+        self.spool_dir = spool_dir
+        self.parts_uploaded = 0
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        data = Body.encode('utf-8') if isinstance(Body, str) else bytes(Body)
+        with self._lock:
+            self.objects[(Bucket, Key)] = data
+        return {}
+
+    def _read(self, stored):
+        if isinstance(stored, bytes):
+            return stored
+        # A completed multipart object: its parts, as bytes or spooled file paths
+        chunks = []
+        for part in stored:
+            if isinstance(part, str):
+                with open(part, 'rb') as f:
+                    part = f.read()
+            chunks.append(part)
+        return b''.join(chunks)
+
+    def get_object(self, Bucket, Key, **kwargs):
+        data = self._read(self.objects[(Bucket, Key)])
+        return {'Body': io.BytesIO(data), 'ContentLength': len(data)}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self.uploads[upload_id] = {'bucket': Bucket, 'key': Key, 'parts': {}}
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        if self.spool_dir:
+            stored = os.path.join(self.spool_dir, f"{UploadId}-{PartNumber}")
+            with open(stored, 'wb') as f:
+                f.write(Body)
+        else:
+            stored = bytes(Body)
+        with self._lock:
+            upload = self.uploads[UploadId]
+            # Uploading a part number again replaces it, as in S3
+            upload['parts'][PartNumber] = (etag, stored)
+            self.parts_uploaded += 1
+        return {'ETag': etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        with self._lock:
+            upload = self.uploads[UploadId]
+            parts = []
+            for part in MultipartUpload['Parts']:
+                etag, stored = upload['parts'][part['PartNumber']]
+                if etag != part['ETag']:
+                    raise ValueError(f"InvalidPart: ETag mismatch for part {part['PartNumber']}")
+                parts.append(stored)
+            del self.uploads[UploadId]
+            self.objects[(Bucket, Key)] = parts
+        return {'Bucket': Bucket, 'Key': Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        with self._lock:
+            self.uploads.pop(UploadId, None)
+        return {}
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn=900):
+        return f"https://{Params['Bucket']}.s3.local/{Params['Key']}?expires={ExpiresIn}"
+
+class LocalTable:
+    def __init__(self, name, key_names, batch_write_latency=0.0, read_latency=0.0):
+        self.name = name
+        self.key_names = key_names
+        # Simulated round trip of one 25-item BatchWriteItem request
+        self.batch_write_latency = batch_write_latency
+        # Simulated round trip of a GetItem, Query or Scan request
+        self.read_latency = read_latency
+        self.items = {}
+        # Keys by hash key value, so a query reads one partition as DynamoDB does
+        self.partitions = {}
+        self._segments = {}
+        self._lock = threading.Lock()
+
+    def _key(self, item):
+        return tuple(item.get(name) for name in self.key_names)
+
+    def _store(self, key, item):
+        self.items[key] = item
+        self.partitions.setdefault(key[0], set()).add(key)
+
+    def _remove(self, key):
+        if self.items.pop(key, None) is not None:
+            self.partitions[key[0]].discard(key)
+
+    def _check(self, key, condition, names, values):
+        # Supports "attribute_not_exists(#a)" and "#a <op> :v" clauses joined by OR
+        if not condition:
+            return
+        item = self.items.get(key)
+        for clause in condition.split(' OR '):
+            clause = clause.strip()
+            if clause.startswith('attribute_not_exists('):
+                if item is None:
+                    return
+                continue
+            name, op, operand = clause.split()
+            attr = names.get(name, name)
+            if item is not None and attr in item and OPERATORS[op](item[attr], values[operand]):
+                return
+        raise ConditionalCheckFailed()
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+                 ReturnValues=None, **kwargs):
+        with self._lock:
+            self._check(self._key(Item), ConditionExpression, ExpressionAttributeNames or {}, ExpressionAttributeValues or {})
+            previous = self.items.get(self._key(Item))
+            self._store(self._key(Item), dict(Item))
+        return {'Attributes': dict(previous)} if ReturnValues == 'ALL_OLD' and previous else {}
+
+    def delete_item(self, Key, ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None, **kwargs):
+        with self._lock:
+            self._check(self._key(Key), ConditionExpression, ExpressionAttributeNames or {}, ExpressionAttributeValues or {})
+            self._remove(self._key(Key))
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        if self.read_latency:
+            time.sleep(self.read_latency)
+        with self._lock:
+            item = self.items.get(self._key(Key))
+        return {'Item': dict(item)} if item else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+                    ConditionExpression=None, **kwargs):
+        # Supports the plain "SET #a = :v, ..." form used by the pipeline
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        with self._lock:
+            self._check(self._key(Key), ConditionExpression, names, values)
+            item = self.items.get(self._key(Key))
+            if item is None:
+                item = dict(Key)
+                self._store(self._key(Key), item)
+            for assignment in UpdateExpression.split('SET', 1)[1].split(','):
+                name, value = [part.strip() for part in assignment.split('=')]
+                item[names.get(name, name)] = values[value]
+        return {}
+
+    def batch_writer(self, **kwargs):
+        return _BatchWriter(self)
+
+    def query(self, KeyConditionExpression, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+              Limit=None, ExclusiveStartKey=None, IndexName=None, ScanIndexForward=True, **kwargs):
+        # Supports "#a = :v [AND #b <op> :w | AND #b BETWEEN :x AND :y]"; indexes are named "<hash>-<range>-index"
+        if self.read_latency:
+            time.sleep(self.read_latency)
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        conditions = []
+        for clause in re.split(r' AND (?=#)', KeyConditionExpression):
+            name, op, operand = clause.split(None, 2)
+            if op == 'BETWEEN':
+                low, high = [values[v.strip()] for v in operand.split(' AND ')]
+                conditions.append((names.get(name, name), lambda a, bounds: bounds[0] <= a <= bounds[1], (low, high)))
+            else:
+                conditions.append((names.get(name, name), OPERATORS[op], values[operand]))
+        with self._lock:
+            candidates = self.items.values()
+            if not IndexName and conditions[0][0] == self.key_names[0] and conditions[0][1] is OPERATORS['=']:
+                candidates = [self.items[key] for key in self.partitions.get(conditions[0][2], ())]
+            matches = [dict(item) for item in candidates
+                       if all(attr in item and test(item[attr], value) for attr, test, value in conditions)]
+        key_names = list(self.key_names)
+        if IndexName:
+            key_names += IndexName.rsplit('-', 1)[0].split('-')
+        sort_name = IndexName.split('-')[1] if IndexName else (self.key_names[1] if len(self.key_names) > 1 else None)
+        if sort_name:
+            matches.sort(key=lambda item: item.get(sort_name), reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            position = next((i for i, item in enumerate(matches)
+                             if all(item.get(k) == v for k, v in ExclusiveStartKey.items())), None)
+            matches = matches[position + 1:] if position is not None else matches
+        response = {'Items': matches[:Limit] if Limit else matches}
+        if Limit and len(matches) > Limit:
+            last = response['Items'][-1]
+            response['LastEvaluatedKey'] = {k: last[k] for k in key_names if k in last}
+        return response
+
+    def _segment_keys(self, segment, total_segments):
+        # Keys of one scan segment in a stable order, rebuilt when items were added or removed
+        cached = self._segments.get((segment, total_segments))
+        if cached is None or cached[0] != len(self.items):
+            keys = sorted((key for key in self.items if zlib.crc32(repr(key).encode('utf-8')) % total_segments == segment), key=repr)
+            cached = self._segments[(segment, total_segments)] = (len(self.items), [repr(key) for key in keys], keys)
+        return cached[1], cached[2]
+
+    def scan(self, Segment=0, TotalSegments=1, Limit=None, ExclusiveStartKey=None, FilterExpression=None,
+             ExpressionAttributeNames=None, ExpressionAttributeValues=None, **kwargs):
+        # Items are spread over segments by a hash of their key; Limit counts items read before the "#a = :v" filter
+        if self.read_latency:
+            time.sleep(self.read_latency)
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        with self._lock:
+            ordered, keys = self._segment_keys(Segment, TotalSegments)
+            start = bisect.bisect_right(ordered, repr(self._key(ExclusiveStartKey))) if ExclusiveStartKey else 0
+            page = keys[start:start + Limit] if Limit else keys[start:]
+            items = [dict(self.items[key]) for key in page]
+            more = Limit and start + Limit < len(keys)
+        if FilterExpression:
+            name, op, operand = FilterExpression.split()
+            attr = names.get(name, name)
+            items = [item for item in items if attr in item and OPERATORS[op](item[attr], values[operand])]
+        response = {'Items': items, 'Count': len(items), 'ScannedCount': len(page)}
+        if more:
+            response['LastEvaluatedKey'] = dict(zip(self.key_names, page[-1]))
+        return response
+
+OPERATORS = {
+    '=': lambda a, b: a == b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b
+}
+
+class _BatchWriter:
+    def __init__(self, table):
+        self.table = table
+        self.pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.pending:
+            self._flush()
+        return False
+
+    def _flush(self):
+        self.pending = 0
+        if self.table.batch_write_latency:
+            time.sleep(self.table.batch_write_latency)
+
+    def put_item(self, Item):
+        self.table.put_item(Item=Item)
+        self.pending += 1
+        if self.pending == 25:
+            self._flush()
+
+class LocalDynamoDB:
+    """boto3 dynamodb resource stand-in; tables are created on first use"""
+
+    KEYS = {'cache': ('cache_key',), 'items': ('quotation_id', 'item_seq')}
+
+    def __init__(self, batch_write_latency=0.0, read_latency=0.0):
+        self.tables = {}
+        self.batch_write_latency = batch_write_latency
+        self.read_latency = read_latency
+        self._lock = threading.Lock()
+
+    def Table(self, name):
+        with self._lock:
+            if name not in self.tables:
+                suffix = name.rsplit('-', 1)[-1]
+                self.tables[name] = LocalTable(name, self.KEYS.get(suffix, ('quotation_id',)),
+                                              self.batch_write_latency, self.read_latency)
+            return self.tables[name]
+
+class LocalLambda:
+    """Lambda client stand-in; async invocations are recorded for the caller to run"""
+
+    def __init__(self):
+        self.events = []
+
+    def invoke(self, FunctionName, InvocationType='RequestResponse', Payload=None, **kwargs):
+        self.events.append(json.loads(Payload))
+        return {'StatusCode': 202}
+
+class _StreamingBody:
+    def __init__(self, payload):
+        self._payload = payload
+
+    def read(self, *args):
+        return self._payload
+
+class StubBedrock:
+    """bedrock-runtime stand-in returning canned extraction JSON after a simulated delay
+
+    Items are the synthetic corpus rows found in the prompt, so chunked
+    extraction and item merging behave as they would against the model.
+    Latency is latency_seconds plus seconds_per_item for each item returned
+    plus seconds_per_input_token for each (estimated) prompt token.
+    """
+
+    def __init__(self, latency_seconds=0.5, seconds_per_item=0.01, sleep=time.sleep, seconds_per_input_token=0.0,
+                 stream_chunk_chars=40):
+        self.latency_seconds = latency_seconds
+        self.seconds_per_item = seconds_per_item
+        self.seconds_per_input_token = seconds_per_input_token
+        self.stream_chunk_chars = stream_chunk_chars
+        self.calls = 0
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def _extract(self, body):
+        prompt = json.loads(body)['messages'][0]['content']
+        items = [
+            {'description': f"{code} {description.strip()}", 'quantity': int(quantity),
+             'unit_price': float(unit_price), 'total_amount': float(total)}
+            for code, description, quantity, unit_price, total in ITEM_ROW.findall(prompt)
+        ]
+        quote = QUOTE_NUMBER.search(prompt)
+        subtotal = round(sum(item['total_amount'] for item in items), 2)
+        tax, total = round(subtotal * 0.09, 2), round(subtotal * 1.09, 2)
+        # A chunk holding the totals line reports those, like the model would
+        totals = TOTALS.search(prompt)
+        if totals:
+            subtotal, tax, total = (float(value) for value in totals.groups())
+        result = {
+            'company_name': 'Benchmark Supplies Pte Ltd',
+            'email': 'sales@benchmark-supplies.example',
+            'phone': '+65 6123 4567',
+            'address': '1 Benchmark Road, Singapore 000001',
+            'buyer_name': 'Axrail Demo Pte Ltd',
+            'buyer_address': 'Changi Tower, 78909 Singapore',
+            'quote_number': quote.group(1) if quote else 'BENCH',
+            'date': '2024-01-31',
+            'items': items,
+            'subtotal': subtotal,
+            'tax': tax,
+            'total': total
+        }
+        with self._lock:
+            self.calls += 1
+        return prompt, result
+
+    def invoke_model(self, modelId, body, **kwargs):
+        prompt, result = self._extract(body)
+        self._sleep(self.latency_seconds + self.seconds_per_item * len(result['items'])
+                    + self.seconds_per_input_token * (len(prompt) // 4))
+        text = json.dumps(result)
+        payload = {
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn',
+            'usage': {'input_tokens': len(prompt) // 4, 'output_tokens': len(text) // 4}
+        }
+        return {'body': _StreamingBody(json.dumps(payload).encode('utf-8')), 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        """Same reply as invoke_model as Anthropic stream events, paced like generation
+
+        latency_seconds (plus the input token time) passes before the first
+        event; the per-item time is spread over the text chunks, paced
+        against the wall clock.
+        """
+        prompt, result = self._extract(body)
+        text = json.dumps(result, indent=1)
+        generation_seconds = self.seconds_per_item * len(result['items'])
+
+        def event(message):
+            return {'chunk': {'bytes': json.dumps(message).encode('utf-8')}}
+
+        def events():
+            self._sleep(self.latency_seconds + self.seconds_per_input_token * (len(prompt) // 4))
+            yield event({'type': 'message_start', 'message': {'usage': {'input_tokens': len(prompt) // 4}}})
+            yield event({'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}})
+            started = time.monotonic()
+            generated = 0.0
+            for start in range(0, len(text), self.stream_chunk_chars):
+                chunk = text[start:start + self.stream_chunk_chars]
+                # Pace against the wall clock; thousands of tiny sleeps would each overshoot
+                generated += generation_seconds * len(chunk) / len(text)
+                behind = started + generated - time.monotonic()
+                if behind >= 0.005:
+                    self._sleep(behind)
+                yield event({'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': chunk}})
+            self._sleep(max(0.0, started + generated - time.monotonic()))
+            yield event({'type': 'content_block_stop', 'index': 0})
+            yield event({'type': 'message_delta', 'delta': {'stop_reason': 'end_turn'}, 'usage': {'output_tokens': len(text) // 4}})
+            yield event({'type': 'message_stop'})
+        return {'body': events(), 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+def install(bedrock=None, batch_write_latency=0.0, read_latency=0.0):
+    """Point the pipeline's clients at local stand-ins; returns them for inspection"""
+    import document_processor
+    import simple_reports
+    import bedrock_invoker
+
+    s3 = LocalS3()
+    dynamodb = LocalDynamoDB(batch_write_latency, read_latency)
+    bedrock = bedrock or StubBedrock()
+    lambda_client = LocalLambda()
+    document_processor._clients.clear()
+    document_processor._clients['s3'] = s3
+    document_processor._clients['dynamodb-resource'] = dynamodb
+    document_processor._clients['lambda'] = lambda_client
+    simple_reports._s3_client = s3
+    bedrock_invoker._invoker = bedrock_invoker.BedrockInvoker(client=bedrock)
+    return {'s3': s3, 'dynamodb': dynamodb, 'bedrock': bedrock, 'lambda': lambda_client}
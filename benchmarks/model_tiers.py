@@ -0,0 +1,96 @@
+"""Model tiering benchmark.
+
+Runs extract_with_model over synthetic quotation text with routing on and
+off. The fast model is a stub that answers --fast-speedup times quicker
+but drops a line item from --fast-miss-rate of its replies, so escalation
+is exercised. Reports simulated model time, tier choice and escalation
+per document, and the per-tier metrics the Lambda returns:
+
+    python benchmarks/model_tiers.py --fast-miss-rate 0.2
+
+Model time is simulated (--bedrock-latency, --bedrock-per-item) and summed
+over calls rather than waited for.
+"""
+import io
+import os
+import sys
+import json
+import random
+import argparse
+from contextlib import redirect_stdout
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'backend'))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import corpus
+import local_aws
+from prompt_size import SimulatedClock
+
+SIZES = [(1, 1), (1, 5), (1, 10), (2, 20), (3, 40), (5, 50), (20, 200)]
+
+class TieredStub:
+    """Routes invoke_model by modelId to a fast or an accurate StubBedrock"""
+
+    def __init__(self, fast_model_id, args, clock):
+        self.fast_model_id = fast_model_id
+        self.fast = local_aws.StubBedrock(args.bedrock_latency / args.fast_speedup, args.bedrock_per_item / args.fast_speedup,
+                                          sleep=clock.sleep)
+        self.accurate = local_aws.StubBedrock(args.bedrock_latency, args.bedrock_per_item, sleep=clock.sleep)
+        self.miss_rate = args.fast_miss_rate
+        self.random = random.Random(args.seed)
+
+    def invoke_model(self, modelId, body, **kwargs):
+        if modelId != self.fast_model_id:
+            return self.accurate.invoke_model(modelId, body, **kwargs)
+        response = self.fast.invoke_model(modelId, body, **kwargs)
+        payload = json.loads(response['body'].read())
+        result = json.loads(payload['content'][0]['text'])
+        if result['items'] and self.random.random() < self.miss_rate:
+            result['items'].pop()
+            payload['content'][0]['text'] = json.dumps(result)
+        return {'body': local_aws._StreamingBody(json.dumps(payload).encode('utf-8')), 'ResponseMetadata': response['ResponseMetadata']}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bedrock-latency', type=float, default=1.0)
+    parser.add_argument('--bedrock-per-item', type=float, default=0.03)
+    parser.add_argument('--fast-speedup', type=float, default=4.0, help='how much quicker the fast model answers')
+    parser.add_argument('--fast-miss-rate', type=float, default=0.1, help='share of fast replies missing an item')
+    parser.add_argument('--rule-confidence', type=float, default=0.5, help='rule pre-parse confidence to route with')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    import model_router
+    import document_processor
+
+    results = {}
+    for routing in (False, True):
+        model_router.MODEL_ROUTING = routing
+        model_router._tier_stats.clear()
+        clock = SimulatedClock()
+        local_aws.install(TieredStub(model_router.FAST_MODEL_ID, args, clock))
+        documents = {}
+        for pages, item_count in SIZES:
+            items = corpus.make_items(item_count, seed=pages * 10000 + item_count)
+            text = corpus.build_text(f"Q{pages:03d}{item_count:04d}R", items, pages)
+            started = clock.seconds
+            with redirect_stdout(io.StringIO()):
+                data, from_model, _, route = document_processor.extract_with_model(text, args.rule_confidence, 'bench')
+            documents[f"{pages}p-{item_count}i"] = {
+                'tier': route['tier'],
+                'escalated': route['escalated'],
+                'items_ok': len(data.get('items') or []) == item_count,
+                'model_seconds': round(clock.seconds - started, 3)
+            }
+        results['routing' if routing else 'accurate_only'] = {
+            'model_seconds': round(clock.seconds, 3),
+            'documents': documents,
+            'tiers': model_router.get_tier_metrics()
+        }
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Purchase-order PDF render benchmark.
+
+Renders POs with growing item counts through simple_reports.render_pdf_report
+and reports ms per document, per page and per row (median across runs), so
+non-linear growth in the renderer shows up as a rising ms/row:
+
+    python benchmarks/pdf_render.py --rows 10 100 1000 5000 --runs 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'backend'))
+sys.path.insert(0, BENCH_DIR)
+
+import corpus
+from quotation_model import Quotation, PurchaseOrder
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def make_order(row_count, long_descriptions=False):
+    items = corpus.make_items(row_count, seed=row_count)
+    if long_descriptions:
+        # Every third row wraps onto several lines
+        for item in items[::3]:
+            item['description'] += ' with extended warranty, installation and on-site training for up to twelve staff'
+    subtotal = round(sum(item['total_amount'] for item in items), 2)
+    quotation = Quotation.from_extraction({
+        'company_name': 'Benchmark Supplies Pte Ltd',
+        'address': '1 Benchmark Road, Singapore 000001',
+        'phone': '+65 6123 4567',
+        'email': 'sales@benchmark-supplies.example',
+        'quote_number': f'QBENCH{row_count}',
+        'items': items,
+        'subtotal': subtotal,
+        'tax': round(subtotal * 0.09, 2)
+    })
+    return quotation, PurchaseOrder(f'PO-BENCH-{row_count}', '2024-01-31', quotation)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--long-descriptions', action='store_true', help='make every third description wrap')
+    args = parser.parse_args()
+
+    from simple_reports import render_pdf_report
+
+    # The first render pays for loading fpdf and building the PDF class
+    started = time.perf_counter()
+    render_pdf_report(*make_order(1))
+    first_render_ms = (time.perf_counter() - started) * 1000
+
+    results = {}
+    for row_count in args.rows:
+        quotation, purchase_order = make_order(row_count, args.long_descriptions)
+        samples = []
+        stats = {}
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            pdf_bytes = render_pdf_report(quotation, purchase_order, stats=stats)
+            samples.append((time.perf_counter() - started) * 1000)
+        median_ms = percentile(samples, 50)
+        results[row_count] = {
+            'pages': stats['pages'],
+            'bytes': len(pdf_bytes),
+            'median_ms': round(median_ms, 2),
+            'p95_ms': round(percentile(samples, 95), 2),
+            'ms_per_page': round(median_ms / stats['pages'], 3),
+            'ms_per_row': round(median_ms / max(1, stats['rows']), 4)
+        }
+
+    print(json.dumps({'runs': args.runs, 'first_render_ms': round(first_render_ms, 2), 'rows': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
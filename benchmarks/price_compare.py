@@ -0,0 +1,159 @@
+"""Multi-quotation price comparison benchmark.
+
+Generates competing quotations for one purchase: every vendor quotes most
+of a shared item list, with its own wording of each description (word
+order, plurals, "pcs", case) and its own prices. Reports, per
+vendors x items size, the time of compare_quotations (building the
+matrix from the stored lines, then the NumPy analysis) against a plain-Python dict-of-dicts version of the same
+analysis, checking both agree on the split award total:
+
+    python benchmarks/price_compare.py --sizes 5x50 50x500 200x2000 500x5000
+
+--handler also runs the smallest size end to end through the handler's
+compare action, with the quotations stored in the local DynamoDB stand-in.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from contextlib import redirect_stdout
+from decimal import Decimal
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'backend'))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('DOCS_BUCKET', 'benchmark-docs')
+
+import corpus
+import local_aws
+
+class _Context:
+    function_name = 'quotation-processor-benchmark'
+    aws_request_id = 'compare-benchmark'
+
+def _wording(rng, product, model):
+    words = [f"{product}s" if rng.random() < 0.3 and not product.endswith('s') else product, 'model', str(model)]
+    if rng.random() < 0.5:
+        words.reverse()
+    if rng.random() < 0.3:
+        words.append('pcs')
+    text = ' '.join(words)
+    return text.upper() if rng.random() < 0.2 else text
+
+def make_quotations(vendor_count, item_count, coverage=0.9, seed=0):
+    rng = random.Random(seed)
+    catalogue = [(rng.choice(corpus.PRODUCTS).lower(), 1000 + n, round(rng.uniform(0.5, 250), 2), rng.randint(1, 50))
+                 for n in range(item_count)]
+    quotations = []
+    for vendor in range(vendor_count):
+        # The first vendor quotes everything, so there is a single-vendor option to compare with
+        offered = catalogue if vendor == 0 else [entry for entry in catalogue if rng.random() < coverage]
+        items = []
+        for product, model, list_price, quantity in offered:
+            unit_price = round(list_price * rng.uniform(0.8, 1.2), 2)
+            items.append({
+                'description': _wording(rng, product, model),
+                'quantity': Decimal(quantity),
+                'unit_price': Decimal(str(unit_price)),
+                'total_amount': Decimal(str(round(unit_price * quantity, 2)))
+            })
+        quotations.append({'quotation_id': f"cmp-{vendor:04d}", 'company_name': f"Vendor {vendor} Pte Ltd",
+                           'quote_number': f"VQ-{vendor}", 'date': '2024-01-31', 'items': items})
+    return quotations
+
+def python_split_total(quotations):
+    """The split award total with dicts and loops: what the comparison costs without NumPy"""
+    from price_comparison import match_key
+
+    totals = {}
+    for quotation in quotations:
+        lines = {}
+        for item in quotation['items']:
+            amount = float(item['total_amount'])
+            if amount <= 0:
+                continue
+            line = lines.setdefault(match_key(item['description']), [0.0, 0.0])
+            line[0] += float(item['quantity']) or 1.0
+            line[1] += amount
+        for key, (quantity, amount) in lines.items():
+            entry = totals.setdefault(key, [0.0, float('inf')])
+            entry[0] = max(entry[0], quantity)
+            entry[1] = min(entry[1], amount / quantity)
+    return round(sum(quantity * price for quantity, price in totals.values()), 2)
+
+def store(quotations):
+    import document_processor
+    from quotation_store import put_line_items
+
+    headers = document_processor.get_quotations_table()
+    items_table = document_processor.get_items_table()
+    for quotation in quotations:
+        put_line_items(items_table, quotation['quotation_id'], quotation['items'])
+        headers.put_item(Item={key: value for key, value in quotation.items() if key != 'items'} | {'items_count': len(quotation['items'])})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=['5x50', '50x500', '200x2000', '500x5000'], help='VENDORSxITEMS')
+    parser.add_argument('--handler', action='store_true', help='also run the smallest size through the handler')
+    args = parser.parse_args()
+
+    import price_comparison
+
+    results = {}
+    for size in args.sizes:
+        vendor_count, item_count = (int(part) for part in size.split('x'))
+        quotations = make_quotations(vendor_count, item_count)
+        price_comparison.match_key.cache_clear()
+
+        started = time.perf_counter()
+        comparison = price_comparison.compare_quotations(quotations)
+        numpy_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        python_total = python_split_total(quotations)
+        python_ms = (time.perf_counter() - started) * 1000
+
+        best = comparison['bestSingleVendor']
+        results[size] = {
+            'lines': sum(len(quotation['items']) for quotation in quotations),
+            'items_matched': comparison['items'],
+            'numpy_ms': round(numpy_ms, 1),
+            'build_ms': round(comparison['timings']['build_seconds'] * 1000, 1),
+            'analysis_ms': round(comparison['timings']['analysis_seconds'] * 1000, 1),
+            'python_ms': round(python_ms, 1),
+            'split_total': comparison['splitAward']['total'],
+            'totals_agree': abs(comparison['splitAward']['total'] - python_total) <= 0.01 * max(1, item_count),
+            'split_vendors': comparison['splitAward']['vendors'],
+            'best_single_vendor_total': best and best['total'],
+            'savings_percent': best and best['savingsPercent']
+        }
+
+    if args.handler:
+        import document_processor
+
+        vendor_count, item_count = (int(part) for part in args.sizes[0].split('x'))
+        quotations = make_quotations(vendor_count, item_count)
+        local_aws.install()
+        store(quotations)
+        event = {'httpMethod': 'POST', 'body': json.dumps({
+            'action': 'compare', 'quotationIds': [quotation['quotation_id'] for quotation in quotations]})}
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            response = document_processor.handler(event, _Context())
+        body = json.loads(response['body'])
+        results['handler'] = {
+            'size': args.sizes[0],
+            'status': response['statusCode'],
+            'handler_ms': round((time.perf_counter() - started) * 1000, 1),
+            'timings': body.get('timings'),
+            'split_total': (body.get('splitAward') or {}).get('total'),
+            'response_bytes': len(response['body'])
+        }
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
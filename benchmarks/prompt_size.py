@@ -0,0 +1,104 @@
+"""Prompt compaction benchmark.
+
+Sends the synthetic corpus text through process_with_bedrock against the
+stub model with compaction off ("raw"), on ("compact") and with item
+focusing ("focus"), and reports input tokens, simulated model time and
+extraction accuracy against the corpus ground truth for each mode:
+
+    python benchmarks/prompt_size.py --seconds-per-token 0.00005
+
+Model time is simulated (--bedrock-latency, --bedrock-per-item,
+--seconds-per-token) and summed over calls, so chunked documents report
+billed model time rather than wall time.
+"""
+import io
+import os
+import sys
+import json
+import argparse
+import threading
+from contextlib import redirect_stdout
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'backend'))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import corpus
+import local_aws
+
+MODES = ('raw', 'compact', 'focus')
+
+class SimulatedClock:
+    """sleep() replacement that adds up the requested delays instead of waiting"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.seconds += seconds
+
+def set_mode(mode):
+    import document_processor
+    import prompt_compaction
+
+    document_processor.PROMPT_COMPACTION = mode != 'raw'
+    prompt_compaction.PROMPT_FOCUS_ITEMS = mode == 'focus'
+
+def score(result, items, quote_number):
+    expected = {(f"{item['code']} {item['description']}", round(item['total_amount'], 2)) for item in items}
+    found = {(item['description'], round(float(item['total_amount']), 2)) for item in result.get('items') or []}
+    subtotal = round(sum(item['total_amount'] for item in items), 2)
+    return {
+        'item_recall': round(len(expected & found) / len(expected), 4) if expected else 1.0,
+        'extra_items': len(found - expected),
+        'subtotal_ok': abs(float(result.get('subtotal') or 0) - subtotal) < 0.01,
+        'quote_number_ok': result.get('quote_number') == quote_number
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bedrock-latency', type=float, default=0.5)
+    parser.add_argument('--bedrock-per-item', type=float, default=0.01)
+    parser.add_argument('--seconds-per-token', type=float, default=0.00005,
+                        help='simulated prompt processing time per input token')
+    parser.add_argument('--verbose', action='store_true', help='show pipeline logging')
+    args = parser.parse_args()
+
+    from tracing import RequestTrace
+    import document_processor
+
+    results = {}
+    for pages, item_count in corpus.DEFAULT_SIZES:
+        quote_number = f"Q{pages:03d}{item_count:04d}T"
+        items = corpus.make_items(item_count, seed=pages * 10000 + item_count)
+        text = corpus.build_text(quote_number, items, pages)
+        case = {}
+        for mode in MODES:
+            set_mode(mode)
+            clock = SimulatedClock()
+            bedrock = local_aws.StubBedrock(args.bedrock_latency, args.bedrock_per_item, sleep=clock.sleep,
+                                            seconds_per_input_token=args.seconds_per_token)
+            local_aws.install(bedrock)
+            trace = RequestTrace()
+            log = io.StringIO()
+            with redirect_stdout(sys.stdout if args.verbose else log):
+                result, from_model = document_processor.process_with_bedrock(text, return_source=True, trace=trace)
+            case[mode] = dict(score(result, items, quote_number),
+                              from_model=from_model,
+                              calls=bedrock.calls,
+                              prompt_chars=trace.counters.get('prompt_chars', 0),
+                              input_tokens=trace.counters.get('input_tokens', 0),
+                              model_seconds=round(clock.seconds, 3))
+        raw = case['raw']
+        for mode in MODES[1:]:
+            case[mode]['tokens_saved'] = round(1 - case[mode]['input_tokens'] / max(1, raw['input_tokens']), 3)
+            case[mode]['model_seconds_saved'] = round(raw['model_seconds'] - case[mode]['model_seconds'], 3)
+        results[f"{pages}p-{item_count}i"] = case
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Duplicate-request (retry storm) benchmark.
+
+Sends --requests identical uploads of one synthetic quotation through the
+real handler from concurrent threads, --stagger seconds apart so later ones
+arrive while the first is running or after it finished, with single-flight
+coalescing off and on. Reports Bedrock calls, distinct quotation IDs, PDFs
+uploaded, the flight role of each response and the latency spread:
+
+    python benchmarks/retry_storm.py --requests 20 --stagger 0.05
+
+--idempotency-key sends the same key with every request. Bedrock and the
+rule path are stubbed as in run_pipeline.py; RULE_CONFIDENCE_THRESHOLD
+defaults to 2 here so every extraction goes to the model.
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import threading
+from collections import Counter
+from contextlib import redirect_stdout
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'backend'))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('DOCS_BUCKET', 'benchmark-docs')
+os.environ.setdefault('RULE_CONFIDENCE_THRESHOLD', '2')
+
+import corpus
+import local_aws
+
+class _Context:
+    function_name = 'quotation-processor-benchmark'
+
+    def __init__(self, request_id):
+        self.aws_request_id = request_id
+
+def storm(case, args):
+    import document_processor
+    import extraction_cache
+    import vendor_templates
+
+    # Start cold: nothing cached or learned from the previous run
+    extraction_cache._memory_cache.clear()
+    vendor_templates._templates.clear()
+    aws = local_aws.install(local_aws.StubBedrock(args.bedrock_latency, args.bedrock_per_item))
+    body = {'file': base64.b64encode(case['content']).decode('ascii'), 'fileName': case['file_name'], 'fileType': case['file_type']}
+    if args.idempotency_key:
+        body['idempotencyKey'] = args.idempotency_key
+    event = {'httpMethod': 'POST', 'body': json.dumps(body)}
+    responses = [None] * args.requests
+
+    def send(index):
+        started = time.perf_counter()
+        response = document_processor.handler(event, _Context(f"storm-{index}"))
+        responses[index] = (response, (time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    threads = []
+    with redirect_stdout(io.StringIO()):
+        for index in range(args.requests):
+            thread = threading.Thread(target=send, args=(index,))
+            thread.start()
+            threads.append(thread)
+            time.sleep(args.stagger)
+        for thread in threads:
+            thread.join()
+    wall_ms = (time.perf_counter() - started) * 1000
+
+    bodies = [json.loads(response['body']) for response, _ in responses]
+    latencies = sorted(ms for _, ms in responses)
+    return {
+        'bedrock_calls': aws['bedrock'].calls,
+        'quotation_ids': len({body.get('quotationId') for body in bodies}),
+        'pdfs_uploaded': sum(1 for _, key in aws['s3'].objects if key.endswith('_purchase_order.pdf')),
+        'status_codes': dict(Counter(response['statusCode'] for response, _ in responses)),
+        'roles': dict(Counter((body.get('flight') or {}).get('role', 'none') for body in bodies)),
+        'wall_ms': round(wall_ms, 1),
+        'latency_ms': {'min': round(latencies[0], 1), 'p50': round(latencies[len(latencies) // 2], 1), 'max': round(latencies[-1], 1)}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--stagger', type=float, default=0.05, help='seconds between request arrivals')
+    parser.add_argument('--pages', type=int, default=2)
+    parser.add_argument('--items', type=int, default=40)
+    parser.add_argument('--idempotency-key', help='send this Idempotency-Key with every request')
+    parser.add_argument('--bedrock-latency', type=float, default=0.5, help='simulated seconds per Bedrock call')
+    parser.add_argument('--bedrock-per-item', type=float, default=0.01, help='simulated seconds per returned item')
+    args = parser.parse_args()
+
+    import single_flight
+
+    case = corpus.build_case('pdf', args.pages, args.items)
+    results = {}
+    for enabled in (False, True):
+        single_flight.SINGLE_FLIGHT = enabled
+        results['single_flight' if enabled else 'independent'] = storm(case, args)
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
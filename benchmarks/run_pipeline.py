@@ -0,0 +1,196 @@
+"""Offline end-to-end benchmark of the quotation pipeline.
+
+Runs the real Lambda handler over a synthetic corpus (1 to 120 pages,
+1 to 1000 items, PDF and DOCX) with S3, DynamoDB and Bedrock replaced by
+the in-process stand-ins in local_aws.py. Reports p50/p95/p99 per stage,
+end-to-end throughput and peak memory, and can gate on a saved baseline:
+
+    python benchmarks/run_pipeline.py --repeats 5 --save-baseline benchmarks/baseline.json
+    python benchmarks/run_pipeline.py --repeats 5 --baseline benchmarks/baseline.json --tolerance 0.2
+
+Bedrock latency is simulated (--bedrock-latency, --bedrock-per-item), so
+figures measure our own code around the model call, not the model.
+
+The synthetic documents are clean enough for the rule-based extractor, so
+each case also runs with the rule threshold out of reach ("-model" cases)
+to keep the Bedrock call, chunking and streaming stages covered; --paths
+picks one or both.
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import resource
+import tracemalloc
+from contextlib import redirect_stdout
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'backend'))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('DOCS_BUCKET', 'benchmark-docs')
+
+import corpus
+import local_aws
+
+class _Context:
+    function_name = 'quotation-processor-benchmark'
+
+    def __init__(self, request_id):
+        self.aws_request_id = request_id
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(values):
+    return {
+        'p50': round(percentile(values, 50), 2),
+        'p95': round(percentile(values, 95), 2),
+        'p99': round(percentile(values, 99), 2),
+        'max': round(max(values), 2) if values else 0.0
+    }
+
+def forget_templates(cache_table):
+    """Drop learned vendor templates, or every model-path repeat after the first is a template hit"""
+    import vendor_templates
+
+    cache_table.items.clear()
+    cache_table.partitions.clear()
+    with vendor_templates._templates_lock:
+        vendor_templates._templates.clear()
+
+def run_case(handler, case, repeats, trace_memory=False, before_repeat=None):
+    """Invoke the handler repeats times; returns per-stage ms samples and memory figures"""
+    event = {
+        'httpMethod': 'POST',
+        'body': json.dumps({
+            'file': base64.b64encode(case['content']).decode('ascii'),
+            'fileName': case['file_name'],
+            'fileType': case['file_type'],
+            # Every repeat should do the full work, not hit the extraction cache
+            'skipCache': True
+        })
+    }
+
+    stages = defaultdict(list)
+    items_found = None
+    peak_traced = 0
+    for repeat in range(repeats):
+        if before_repeat:
+            before_repeat()
+        if trace_memory:
+            tracemalloc.start()
+        log = io.StringIO()
+        started = time.perf_counter()
+        with redirect_stdout(log):
+            response = handler(event, _Context(f"{case['name']}-{repeat}"))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if trace_memory:
+            peak_traced = max(peak_traced, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        if response['statusCode'] != 200:
+            raise RuntimeError(f"{case['name']}: {response['body']}")
+        # The handler's request_trace log line covers every stage, including serialization
+        trace = next(json.loads(line) for line in log.getvalue().splitlines() if '"request_trace"' in line)
+        for name, stage in trace['stages'].items():
+            stages[name].append(stage['ms'])
+        stages['end_to_end'].append(elapsed_ms)
+        items_found = len(json.loads(response['body'])['extractedData'].get('items', []))
+
+    return {
+        'stages': stages,
+        'items_expected': len(case['items']),
+        'items_found': items_found,
+        'peak_traced_mb': round(peak_traced / 2 ** 20, 1) if trace_memory else None
+    }
+
+def check_baseline(results, baseline, tolerance):
+    """Return regressions where a stage p95 grew beyond tolerance over the baseline"""
+    regressions = []
+    for case_name, case in results['cases'].items():
+        for stage, stats in case['stages'].items():
+            previous = baseline.get('cases', {}).get(case_name, {}).get('stages', {}).get(stage)
+            # Sub-millisecond stages are all noise
+            if not previous or previous['p95'] < 1.0:
+                continue
+            if stats['p95'] > previous['p95'] * (1 + tolerance):
+                regressions.append({'case': case_name, 'stage': stage, 'baseline_p95': previous['p95'], 'p95': stats['p95']})
+    return regressions
+
+def parse_sizes(value):
+    # "1x1,20x200" -> [(1, 1), (20, 200)]
+    return [tuple(int(n) for n in size.split('x')) for size in value.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--sizes', type=parse_sizes, default=None, help='PAGESxITEMS list, e.g. 1x1,20x200')
+    parser.add_argument('--formats', nargs='+', default=['pdf', 'docx'], choices=['pdf', 'docx'])
+    parser.add_argument('--bedrock-latency', type=float, default=0.05, help='simulated seconds per Bedrock call')
+    parser.add_argument('--bedrock-per-item', type=float, default=0.0005, help='simulated seconds per returned item')
+    parser.add_argument('--trace-memory', action='store_true', help='tracemalloc peak per case (slows the run)')
+    parser.add_argument('--baseline', help='compare against this baseline JSON and exit 1 on regression')
+    parser.add_argument('--save-baseline', help='write the results to this path')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 growth over baseline')
+    parser.add_argument('--paths', nargs='+', default=['rules', 'model'], choices=['rules', 'model'],
+                        help='extraction paths to run; model puts the rule threshold out of reach')
+    args = parser.parse_args()
+
+    import document_processor
+    local_aws.install(local_aws.StubBedrock(args.bedrock_latency, args.bedrock_per_item))
+
+    cases = corpus.build_corpus(args.sizes, tuple(args.formats))
+    overall = defaultdict(list)
+    results = {'python': sys.version.split()[0], 'repeats': args.repeats, 'cases': {}}
+    documents = 0
+    started = time.perf_counter()
+    rule_threshold = document_processor.RULE_CONFIDENCE_THRESHOLD
+    runs = [(case, path) for path in args.paths for case in cases]
+    for case, path in runs:
+        # Rule confidence never exceeds 1.0, so every document goes to the (stub) model
+        document_processor.RULE_CONFIDENCE_THRESHOLD = 2.0 if path == 'model' else rule_threshold
+        before_repeat = (lambda: forget_templates(document_processor.get_cache_table())) if path == 'model' else None
+        outcome = run_case(document_processor.handler, case, args.repeats, args.trace_memory, before_repeat)
+        for name, samples in outcome['stages'].items():
+            overall[name].extend(samples)
+        documents += args.repeats
+        case_name = case['name'] if path == 'rules' else f"{case['name']}-model"
+        results['cases'][case_name] = {
+            'bytes': len(case['content']),
+            'items_expected': outcome['items_expected'],
+            'items_found': outcome['items_found'],
+            'peak_traced_mb': outcome['peak_traced_mb'],
+            'stages': {name: summarize(samples) for name, samples in sorted(outcome['stages'].items())}
+        }
+        print(f"{case_name}: p50 {results['cases'][case_name]['stages']['end_to_end']['p50']} ms", file=sys.stderr)
+    wall = time.perf_counter() - started
+
+    results['overall'] = {name: summarize(samples) for name, samples in sorted(overall.items())}
+    results['throughput_docs_per_second'] = round(documents / wall, 2) if wall else 0.0
+    # ru_maxrss is KiB on Linux
+    results['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            results['regressions'] = check_baseline(results, json.load(f), args.tolerance)
+        exit_code = 1 if results['regressions'] else 0
+
+    print(json.dumps(results, indent=2))
+    sys.exit(exit_code)
+
+if __name__ == '__main__':
+    main()
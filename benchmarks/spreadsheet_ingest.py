@@ -0,0 +1,98 @@
+"""Spreadsheet (CSV/XLSX) ingestion benchmark.
+
+Builds spreadsheet quotations with growing row counts and reports, per
+format and size: the time to map the item table with extract_spreadsheet,
+rows per second, the peak memory of reading the rows alone (flat if the
+reader streams) and the end-to-end handler time with the local stand-ins,
+along with the extraction path and Bedrock calls (expected: 0):
+
+    python benchmarks/spreadsheet_ingest.py --rows 100 1000 10000 50000
+
+Only the dynamodb sink is written so the PO PDF does not dominate the
+end-to-end figure for very long tables.
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import tracemalloc
+from contextlib import redirect_stdout
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'backend'))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('DOCS_BUCKET', 'benchmark-docs')
+os.environ.setdefault('ARTIFACT_SINKS', 'dynamodb')
+
+import corpus
+import local_aws
+
+FILE_TYPES = {'csv': 'text/csv', 'xlsx': corpus.XLSX_TYPE}
+BUILDERS = {'csv': corpus.build_csv, 'xlsx': corpus.build_xlsx}
+
+class _Context:
+    function_name = 'quotation-processor-benchmark'
+    aws_request_id = 'spreadsheet-benchmark'
+
+def read_peak_kb(reader, content):
+    """Peak traced memory while iterating every row without keeping any"""
+    tracemalloc.start()
+    for _ in reader(content):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--formats', nargs='+', choices=sorted(BUILDERS), default=sorted(BUILDERS))
+    args = parser.parse_args()
+
+    import document_processor
+    import spreadsheet_extractor
+
+    readers = {'csv': spreadsheet_extractor.iter_csv_rows, 'xlsx': spreadsheet_extractor.iter_xlsx_rows}
+    aws = local_aws.install()
+    results = {}
+    for fmt in args.formats:
+        for row_count in args.rows:
+            items = corpus.make_items(row_count, seed=row_count)
+            content = BUILDERS[fmt](f"QS{row_count}", items)
+
+            started = time.perf_counter()
+            data, _, checks = spreadsheet_extractor.extract_spreadsheet(content, fmt)
+            extract_ms = (time.perf_counter() - started) * 1000
+
+            calls_before = aws['bedrock'].calls
+            event = {'httpMethod': 'POST', 'body': json.dumps({
+                'file': base64.b64encode(content).decode('ascii'),
+                'fileName': f"QS{row_count}.{fmt}",
+                'fileType': FILE_TYPES[fmt],
+                'skipCache': True
+            })}
+            started = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                response = document_processor.handler(event, _Context())
+            handler_ms = (time.perf_counter() - started) * 1000
+            body = json.loads(response['body'])
+
+            results[f"{fmt}-{row_count}"] = {
+                'bytes': len(content),
+                'items_ok': data is not None and len(data['items']) == row_count and checks['subtotal_matches'],
+                'extract_ms': round(extract_ms, 1),
+                'rows_per_second': round(checks['rows'] / (extract_ms / 1000)),
+                'read_peak_kb': read_peak_kb(readers[fmt], content),
+                'handler_ms': round(handler_ms, 1),
+                'path': body.get('extraction', {}).get('path'),
+                'bedrock_calls': aws['bedrock'].calls - calls_before
+            }
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
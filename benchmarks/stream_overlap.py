@@ -0,0 +1,92 @@
+"""Streaming versus buffered Bedrock extraction.
+
+Runs process_with_bedrock followed by store_quotation over synthetic
+quotation text against the stub model, once waiting for the whole reply and
+once streaming it, and reports time to the first parsed line item and
+until the quotation is stored:
+
+    python benchmarks/stream_overlap.py --sizes 1x10,2x100,3x200 --bedrock-per-item 0.01
+
+The stub paces its stream like token generation (--bedrock-latency before
+the first token, --bedrock-per-item spread over the reply) and DynamoDB
+batch writes take --batch-write-latency each, so the overlap of item
+writes with generation shows up in the stored_ms column. Documents long
+enough to be chunked are not streamed.
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+from contextlib import redirect_stdout
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'backend'))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('DOCS_BUCKET', 'benchmark-docs')
+
+import corpus
+import local_aws
+from quotation_model import Quotation
+
+def parse_sizes(value):
+    # "1x1,20x200" -> [(1, 1), (20, 200)]
+    return [tuple(int(n) for n in size.split('x')) for size in value.split(',')]
+
+def run(text, streaming, args):
+    import document_processor
+
+    local_aws.install(local_aws.StubBedrock(args.bedrock_latency, args.bedrock_per_item),
+                      batch_write_latency=args.batch_write_latency)
+    quotation_id = f"bench-{'stream' if streaming else 'buffered'}-{len(text)}"
+    first_item = []
+    started = time.perf_counter()
+    stream = document_processor.StreamedExtraction(quotation_id) if streaming else None
+    if stream:
+        on_item = stream.on_item
+
+        def timed_on_item(item):
+            if not first_item:
+                first_item.append(time.perf_counter() - started)
+            on_item(item)
+        stream.on_item = timed_on_item
+
+    with redirect_stdout(io.StringIO()):
+        extracted_data, from_model = document_processor.process_with_bedrock(text, return_source=True, stream=stream)
+        extracted_ms = (time.perf_counter() - started) * 1000
+        streamed_items = stream.finish() if stream else None
+        quotation = Quotation.from_extraction(extracted_data)
+        document_processor.store_quotation(quotation_id, quotation, 'bench.pdf', text, streamed_items=streamed_items)
+    stored_ms = (time.perf_counter() - started) * 1000
+    return {
+        'from_model': from_model,
+        'items': len(quotation.items),
+        'first_item_ms': round(first_item[0] * 1000 if first_item else extracted_ms, 1),
+        'extracted_ms': round(extracted_ms, 1),
+        'stored_ms': round(stored_ms, 1),
+        'items_rewritten': streamed_items != quotation.items
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=parse_sizes, default=[(1, 10), (2, 100), (3, 200)], help='PAGESxITEMS list')
+    parser.add_argument('--bedrock-latency', type=float, default=0.3, help='simulated seconds to the first token')
+    parser.add_argument('--bedrock-per-item', type=float, default=0.01, help='simulated generation seconds per item')
+    parser.add_argument('--batch-write-latency', type=float, default=0.02, help='simulated seconds per 25-item batch write')
+    args = parser.parse_args()
+
+    results = {}
+    for pages, item_count in args.sizes:
+        quote_number = f"Q{pages:03d}{item_count:04d}S"
+        text = corpus.build_text(quote_number, corpus.make_items(item_count, seed=pages * 10000 + item_count), pages)
+        buffered = run(text, False, args)
+        streamed = run(text, True, args)
+        streamed['stored_ms_saved'] = round(buffered['stored_ms'] - streamed['stored_ms'], 1)
+        results[f"{pages}p-{item_count}i"] = {'buffered': buffered, 'streamed': streamed}
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -84,6 +84,8 @@ done
 echo "📊 Step 5/7: Deleting DynamoDB table..."
 aws dynamodb delete-table --table-name ${PROJECT_NAME}-quotations --region $REGION 2>/dev/null
 aws dynamodb delete-table --table-name ${PROJECT_NAME_FINAL}-quotations --region $REGION 2>/dev/null
+aws dynamodb delete-table --table-name ${PROJECT_NAME_FINAL}-quotations-cache --region $REGION 2>/dev/null
+aws dynamodb delete-table --table-name ${PROJECT_NAME_FINAL}-quotations-items --region $REGION 2>/dev/null
 
 # Step 6: Delete IAM role and policies
 echo "🔐 Step 6/7: Deleting IAM role and policies..."
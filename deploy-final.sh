@@ -18,8 +18,28 @@ TIMESTAMP=$(date +%s)
 echo "📦 Step 1/5: Backend Infrastructure"
 echo "==================================="
 
-# Create DynamoDB table
-aws dynamodb create-table --table-name ${PROJECT_NAME}-quotations --attribute-definitions AttributeName=quotation_id,AttributeType=S --key-schema AttributeName=quotation_id,KeyType=HASH --billing-mode PAY_PER_REQUEST --region $REGION 2>/dev/null
+# Create DynamoDB table with summary indexes for search (vendor, quote number, processing date)
+SUMMARY_ATTRS='"date","total","items_count","original_file","status"'
+INDEX_COMPANY='{"IndexName":"company_name-processed_at-index","KeySchema":[{"AttributeName":"company_name","KeyType":"HASH"},{"AttributeName":"processed_at","KeyType":"RANGE"}],"Projection":{"ProjectionType":"INCLUDE","NonKeyAttributes":["quote_number",'$SUMMARY_ATTRS']}}'
+INDEX_QUOTE_NUMBER='{"IndexName":"quote_number-processed_at-index","KeySchema":[{"AttributeName":"quote_number","KeyType":"HASH"},{"AttributeName":"processed_at","KeyType":"RANGE"}],"Projection":{"ProjectionType":"INCLUDE","NonKeyAttributes":["company_name",'$SUMMARY_ATTRS']}}'
+INDEX_PROCESSED='{"IndexName":"processed_month-processed_at-index","KeySchema":[{"AttributeName":"processed_month","KeyType":"HASH"},{"AttributeName":"processed_at","KeyType":"RANGE"}],"Projection":{"ProjectionType":"INCLUDE","NonKeyAttributes":["company_name","quote_number",'$SUMMARY_ATTRS']}}'
+QUOTATION_ATTRIBUTES="AttributeName=quotation_id,AttributeType=S AttributeName=company_name,AttributeType=S AttributeName=quote_number,AttributeType=S AttributeName=processed_at,AttributeType=S AttributeName=processed_month,AttributeType=S"
+aws dynamodb create-table --table-name ${PROJECT_NAME}-quotations --attribute-definitions $QUOTATION_ATTRIBUTES --key-schema AttributeName=quotation_id,KeyType=HASH --global-secondary-indexes "[$INDEX_COMPANY,$INDEX_QUOTE_NUMBER,$INDEX_PROCESSED]" --billing-mode PAY_PER_REQUEST --region $REGION 2>/dev/null
+# Existing tables: add any missing index (one per update; each waits for the previous to finish building)
+for INDEX in "$INDEX_COMPANY" "$INDEX_QUOTE_NUMBER" "$INDEX_PROCESSED"; do
+    aws dynamodb wait table-exists --table-name ${PROJECT_NAME}-quotations --region $REGION
+    aws dynamodb update-table --table-name ${PROJECT_NAME}-quotations --attribute-definitions $QUOTATION_ATTRIBUTES --global-secondary-index-updates "[{\"Create\":$INDEX}]" --region $REGION >/dev/null 2>&1 || continue
+    echo "Building index, waiting for backfill..."
+    while [ "$(aws dynamodb describe-table --table-name ${PROJECT_NAME}-quotations --query "length(Table.GlobalSecondaryIndexes[?IndexStatus!='ACTIVE'])" --output text --region $REGION)" != "0" ]; do sleep 15; done
+done
+
+# Line items table: one row per item under the quotation (item_seq sort key)
+aws dynamodb create-table --table-name ${PROJECT_NAME}-quotations-items --attribute-definitions AttributeName=quotation_id,AttributeType=S AttributeName=item_seq,AttributeType=N --key-schema AttributeName=quotation_id,KeyType=HASH AttributeName=item_seq,KeyType=RANGE --billing-mode PAY_PER_REQUEST --region $REGION 2>/dev/null
+
+# Create extraction cache table (entries expire via DynamoDB TTL)
+aws dynamodb create-table --table-name ${PROJECT_NAME}-quotations-cache --attribute-definitions AttributeName=cache_key,AttributeType=S --key-schema AttributeName=cache_key,KeyType=HASH --billing-mode PAY_PER_REQUEST --region $REGION 2>/dev/null
+aws dynamodb wait table-exists --table-name ${PROJECT_NAME}-quotations-cache --region $REGION
+aws dynamodb update-time-to-live --table-name ${PROJECT_NAME}-quotations-cache --time-to-live-specification "Enabled=true,AttributeName=expires_at" --region $REGION 2>/dev/null
 
 # Create S3 buckets
 DOCS_BUCKET="${PROJECT_NAME}-docs-${TIMESTAMP}"
@@ -38,12 +58,17 @@ echo "S3 buckets verified successfully"
 aws s3api put-public-access-block --bucket $DOCS_BUCKET --public-access-block-configuration "BlockPublicAcls=false,IgnorePublicAcls=false,BlockPublicPolicy=false,RestrictPublicBuckets=false" --region $REGION
 aws s3api put-bucket-policy --bucket $DOCS_BUCKET --policy "{\"Version\":\"2012-10-17\",\"Statement\":[{\"Sid\":\"PublicReadGetObject\",\"Effect\":\"Allow\",\"Principal\":\"*\",\"Action\":\"s3:GetObject\",\"Resource\":\"arn:aws:s3:::$DOCS_BUCKET/*\"}]}" --region $REGION
 
+# Allow the web app to upload quotations straight to the docs bucket with presigned URLs
+aws s3api put-bucket-cors --bucket $DOCS_BUCKET --cors-configuration "{\"CORSRules\":[{\"AllowedOrigins\":[\"*\"],\"AllowedMethods\":[\"PUT\"],\"AllowedHeaders\":[\"*\"],\"MaxAgeSeconds\":3000}]}" --region $REGION
+# Multipart uploads of bulk exports that were never finished or resumed are removed after a week
+aws s3api put-bucket-lifecycle-configuration --bucket $DOCS_BUCKET --lifecycle-configuration "{\"Rules\":[{\"ID\":\"abort-incomplete-exports\",\"Filter\":{\"Prefix\":\"exports/\"},\"Status\":\"Enabled\",\"AbortIncompleteMultipartUpload\":{\"DaysAfterInitiation\":7}}]}" --region $REGION
+
 aws s3api put-public-access-block --bucket $WEB_BUCKET --public-access-block-configuration "BlockPublicAcls=false,IgnorePublicAcls=false,BlockPublicPolicy=false,RestrictPublicBuckets=false" --region $REGION
 aws s3api put-bucket-policy --bucket $WEB_BUCKET --policy "{\"Version\":\"2012-10-17\",\"Statement\":[{\"Sid\":\"PublicReadGetObject\",\"Effect\":\"Allow\",\"Principal\":\"*\",\"Action\":\"s3:GetObject\",\"Resource\":\"arn:aws:s3:::$WEB_BUCKET/*\"}]}" --region $REGION
 
 # Create IAM role
 aws iam create-role --role-name ${PROJECT_NAME}-role --assume-role-policy-document file://lambda-trust-policy.json 2>/dev/null
-aws iam put-role-policy --role-name ${PROJECT_NAME}-role --policy-name ${PROJECT_NAME}-policy --policy-document "{\"Version\":\"2012-10-17\",\"Statement\":[{\"Effect\":\"Allow\",\"Action\":[\"s3:GetObject\",\"s3:PutObject\",\"dynamodb:PutItem\",\"dynamodb:GetItem\",\"bedrock:InvokeModel\",\"logs:CreateLogGroup\",\"logs:CreateLogStream\",\"logs:PutLogEvents\"],\"Resource\":\"*\"}]}"
+aws iam put-role-policy --role-name ${PROJECT_NAME}-role --policy-name ${PROJECT_NAME}-policy --policy-document "{\"Version\":\"2012-10-17\",\"Statement\":[{\"Effect\":\"Allow\",\"Action\":[\"s3:GetObject\",\"s3:PutObject\",\"s3:AbortMultipartUpload\",\"dynamodb:PutItem\",\"dynamodb:GetItem\",\"dynamodb:UpdateItem\",\"dynamodb:DeleteItem\",\"dynamodb:BatchWriteItem\",\"dynamodb:Query\",\"dynamodb:Scan\",\"lambda:InvokeFunction\",\"bedrock:InvokeModel\",\"bedrock:InvokeModelWithResponseStream\",\"logs:CreateLogGroup\",\"logs:CreateLogStream\",\"logs:PutLogEvents\"],\"Resource\":\"*\"}]}"
 
 sleep 15
 
@@ -51,8 +76,9 @@ echo "📚 Step 2/5: Lambda Layer for PDF Generation"
 echo "============================================="
 
 # Create Lambda layer with PDF dependencies
+# pyarrow is left out for size, so Parquet exports are rejected with a 400; add pyarrow==17.0.0 below to enable them
 mkdir -p lambda-layer/python && cd lambda-layer/python
-pip install fpdf2==2.7.6 fontTools==4.47.0 Pillow==10.1.0 defusedxml PyPDF2==3.0.1 -t . --quiet
+pip install fpdf2==2.7.6 fontTools==4.47.0 Pillow==10.1.0 defusedxml PyPDF2==3.0.1 numpy==1.26.4 -t . --quiet
 cd .. && zip -r ../pdf-layer.zip python && cd ..
 
 LAYER_ARN=$(aws lambda publish-layer-version --layer-name ${PROJECT_NAME}-pdf-layer --zip-file fileb://pdf-layer.zip --compatible-runtimes python3.11 --region $REGION --query "LayerVersionArn" --output text)
@@ -64,7 +90,7 @@ echo "============================"
 
 # Create Lambda function
 cd backend
-zip ../lambda-function.zip document_processor.py simple_reports.py
+zip ../lambda-function.zip document_processor.py simple_reports.py extraction_cache.py pdf_extractor.py chunked_extraction.py bedrock_invoker.py async_jobs.py s3_ingest.py tracing.py artifact_fanout.py quotation_store.py quotation_query.py rule_extractor.py vendor_templates.py prompt_compaction.py bedrock_streaming.py model_router.py quotation_model.py single_flight.py spreadsheet_extractor.py docx_extractor.py price_comparison.py bulk_export.py
 cd ..
 
 # Add env-vars1.json to Lambda package
@@ -96,6 +122,10 @@ RESOURCE_ID=$(aws apigateway create-resource --rest-api-id $API_ID --parent-id $
 aws apigateway put-method --rest-api-id $API_ID --resource-id $RESOURCE_ID --http-method POST --authorization-type NONE --region $REGION
 aws apigateway put-integration --rest-api-id $API_ID --resource-id $RESOURCE_ID --http-method POST --type AWS_PROXY --integration-http-method POST --uri arn:aws:apigateway:$REGION:lambda:path/2015-03-31/functions/arn:aws:lambda:$REGION:$AWS_ACCOUNT_ID:function:${PROJECT_NAME}-processor/invocations --region $REGION
 
+# Setup GET method for async job status polling
+aws apigateway put-method --rest-api-id $API_ID --resource-id $RESOURCE_ID --http-method GET --authorization-type NONE --region $REGION
+aws apigateway put-integration --rest-api-id $API_ID --resource-id $RESOURCE_ID --http-method GET --type AWS_PROXY --integration-http-method POST --uri arn:aws:apigateway:$REGION:lambda:path/2015-03-31/functions/arn:aws:lambda:$REGION:$AWS_ACCOUNT_ID:function:${PROJECT_NAME}-processor/invocations --region $REGION
+
 # Setup CORS
 aws apigateway put-method --rest-api-id $API_ID --resource-id $RESOURCE_ID --http-method OPTIONS --authorization-type NONE --region $REGION
 aws apigateway put-integration --rest-api-id $API_ID --resource-id $RESOURCE_ID --http-method OPTIONS --type MOCK --request-templates "{\"application/json\":\"{\\\"statusCode\\\": 200}\"}" --region $REGION